@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from threading import Lock
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse
+from django.http.response import HttpResponseBase
+from rest_framework import status
+
+from .upload_parsers import InvalidDataUploadError
+from .business_logic import (
+    ProductBusiness,
+    InventoryVersionBusiness,
+    BusinessValidationError,
+    OrderNotAvailableError
+)
+from .views import etag_matches, get_inventory_etag, get_products_availability_body
+
+# Async versions of the read and sell endpoints, meant to be served by an ASGI server. Django 3.2 has no async ORM,
+# the DB work of every request runs in a bounded pool of threads (INVENTORY_ASYNC_DB_WORKERS) while the event loop
+# keeps accepting requests, so the number of open requests is no longer tied to the number of threads.
+
+T = TypeVar('T')
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+_db_executor_lock = Lock()
+
+
+def get_async_db_workers() -> int:
+    return getattr(settings, 'INVENTORY_ASYNC_DB_WORKERS', 10)
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(max_workers=get_async_db_workers(), thread_name_prefix='inventory-db')
+
+        return _db_executor
+
+
+def call_with_db_connection(fn: Callable[..., T], *args: Any) -> T:
+    # every worker thread keeps its own connection, reused between requests up to CONN_MAX_AGE.
+    close_old_connections()
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+def run_in_db_thread(fn: Callable[..., T], *args: Any) -> Awaitable[T]:
+    # the DB work keeps the context of the request, e.g. its replica routing scope.
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(
+        get_db_executor(),
+        context.run,
+        call_with_db_connection,
+        fn,
+        *args
+    )
+
+
+def async_api_view(*methods: str) -> Callable:
+    # answers the same errors as APIVieWithErrorHandling. The views open their own transactions, the request is not
+    # wrapped in one (ATOMIC_REQUESTS doesn't support async views) and, like DRF views, they are exempt from CSRF.
+    def decorator(view: Callable[..., Awaitable[HttpResponseBase]]) -> Callable[..., Awaitable[HttpResponseBase]]:
+        @wraps(view)
+        async def wrapped_view(request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponseBase:
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            try:
+                return await view(request, *args, **kwargs)
+            except OrderNotAvailableError as exception:
+                return JsonResponse({ 'errors': list(exception.line_errors) }, status=status.HTTP_400_BAD_REQUEST)
+            except BusinessValidationError as exception:
+                return JsonResponse({ 'errors': [str(exception)] }, status=status.HTTP_400_BAD_REQUEST)
+            except InvalidDataUploadError as exception:
+                return JsonResponse({ 'errors': exception.errors }, status=status.HTTP_400_BAD_REQUEST)
+
+        wrapped_view.csrf_exempt = True  # type: ignore
+        return transaction.non_atomic_requests(wrapped_view)
+
+    return decorator
+
+
+@async_api_view('GET')
+async def products_availability_view(request: HttpRequest) -> HttpResponseBase:
+    # Django 3.2 iterates streaming responses synchronously in the event loop, where the ORM can't run.
+    if request.GET.get('mode') == 'stream':
+        raise InvalidDataUploadError('query parameter mode: stream is not supported by the async endpoint')
+
+    etag = await run_in_db_thread(get_inventory_etag, InventoryVersionBusiness())
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+        return HttpResponseNotModified(headers={ 'ETag': etag })
+
+    body = await run_in_db_thread(
+        get_products_availability_body,
+        ProductBusiness(),
+        etag,
+        request.get_full_path(),
+        request.GET
+    )
+
+    return HttpResponse(body, content_type='application/json', status=status.HTTP_200_OK, headers={ 'ETag': etag })
+
+
+@async_api_view('POST')
+async def sell_product_view(request: HttpRequest, product_id: int) -> HttpResponseBase:
+    await run_in_db_thread(ProductBusiness().sell_product, product_id)
+
+    return HttpResponse(status=status.HTTP_200_OK)
@@ -0,0 +1,142 @@
+from array import array
+from typing import Dict, Iterable, Optional, List, Any
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .repositories import ArticleRepository, ProductRepository
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# In-memory, array backed copy of the inventory to compute the availability of the whole catalogue with vectorized
+# operations, e.g. for "what could we build" analyses. The requirements are kept as a sparse products x articles
+# matrix in CSR format (row pointers, article column indexes and quantities) next to a vector with the article stocks.
+class InventoryEngine:
+    def __init__(self) -> None:
+        if np is None:
+            raise ImproperlyConfigured('InventoryEngine requires numpy. Install the "engine" extra.')
+
+        self._article_repository = ArticleRepository()
+        self._product_repository = ProductRepository()
+        empty = np.empty(0, dtype=np.int64)
+        self._set_matrix(empty, empty, empty, empty, empty, empty)
+
+    @property
+    def product_ids(self) -> Any:
+        return self._product_ids
+
+    def load(self) -> None:
+        (article_ids, stock) = read_columns(self._article_repository.iter_articles_available_stock(), 2)
+        (product_ids,) = read_columns(([id] for id in self._product_repository.iter_product_ids()), 1)
+        (requirement_product_ids, requirement_article_ids, quantities) = read_columns(
+            self._product_repository.iter_requirements(),
+            3
+        )
+        self._set_matrix(article_ids, stock, product_ids, requirement_product_ids, requirement_article_ids, quantities)
+
+    def compute_availability(self, stock_overrides: Optional[Dict[int, int]] = None) -> Any:
+        # availability of every product, in the order of `product_ids`. The stock of some articles can be replaced
+        # with hypothetical values without modifying the loaded inventory.
+        if not stock_overrides:
+            return self._availability.copy()
+
+        stock = self._stock.copy()
+        ratios = self._ratios.copy()
+        availability = self._availability.copy()
+        self._update_stock(stock, ratios, availability, stock_overrides)
+
+        return availability
+
+    def get_products_availability(self, stock_overrides: Optional[Dict[int, int]] = None) -> Dict[int, int]:
+        availability = self.compute_availability(stock_overrides)
+        return dict(zip(self._product_ids.tolist(), availability.tolist()))
+
+    def apply_stock_changes(self, new_article_stocks: Dict[int, int]) -> None:
+        # updates the loaded inventory, only the products using the changed articles are recomputed.
+        self._update_stock(self._stock, self._ratios, self._availability, new_article_stocks)
+
+    def refresh_articles_stock(self, article_ids: Iterable[int]) -> None:
+        # reads the current available (not reserved) stock of the given articles, e.g. the ones changed by a sell or
+        # an upload. New articles or products require a new `load`.
+        self.apply_stock_changes(self._article_repository.get_articles_available_stock(article_ids))
+
+    def _update_stock(self, stock: Any, ratios: Any, availability: Any, new_article_stocks: Dict[int, int]) -> None:
+        article_indexes = self._get_article_indexes(new_article_stocks.keys())
+        stock[article_indexes] = list(new_article_stocks.values())
+        positions = self._get_requirement_positions(article_indexes)
+        ratios[positions] = stock[self._columns[positions]] // self._quantities[positions]
+
+        # the rows of the changed requirements are gathered one after the other to reduce each of them.
+        rows = np.unique(self._rows[positions])
+        if len(rows) == 0:
+            return
+        row_lengths = self._row_pointers[rows + 1] - self._row_pointers[rows]
+        row_offsets = np.zeros(len(rows), dtype=np.int64)
+        np.cumsum(row_lengths[:-1], out=row_offsets[1:])
+        row_positions = np.repeat(self._row_pointers[rows] - row_offsets, row_lengths) + np.arange(row_lengths.sum())
+        availability[rows] = np.minimum.reduceat(ratios[row_positions], row_offsets)
+
+    def _set_matrix(
+        self,
+        article_ids: Any,
+        stock: Any,
+        product_ids: Any,
+        requirement_product_ids: Any,
+        requirement_article_ids: Any,
+        quantities: Any
+    ) -> None:
+        self._article_ids = article_ids
+        self._stock = stock
+        self._product_ids = product_ids
+
+        rows = np.searchsorted(product_ids, requirement_product_ids)
+        row_order = np.argsort(rows, kind='stable')
+        self._columns = np.searchsorted(article_ids, requirement_article_ids)[row_order]
+        self._quantities = quantities[row_order]
+        self._row_pointers = np.zeros(len(product_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(product_ids)), out=self._row_pointers[1:])
+        self._ratios = stock[self._columns] // self._quantities
+        # row of every requirement, to find the products using an article.
+        self._rows = rows[row_order]
+
+        self._availability = np.zeros(len(product_ids), dtype=np.int64)
+        row_starts = self._row_pointers[:-1]
+        non_empty_rows = row_starts < self._row_pointers[1:]
+        if non_empty_rows.any():
+            self._availability[non_empty_rows] = np.minimum.reduceat(self._ratios, row_starts[non_empty_rows])
+
+        # reverse index (CSC order) from an article to the positions of the requirements using it.
+        self._column_order = np.argsort(self._columns, kind='stable')
+        self._column_pointers = np.zeros(len(article_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self._columns, minlength=len(article_ids)), out=self._column_pointers[1:])
+
+    def _get_requirement_positions(self, article_indexes: Any) -> Any:
+        positions = [
+            self._column_order[self._column_pointers[index]:self._column_pointers[index + 1]]
+            for index in article_indexes.tolist()
+        ]
+        return np.concatenate(positions) if len(positions) > 0 else np.empty(0, dtype=np.int64)
+
+    def _get_article_indexes(self, article_ids: Iterable[int]) -> Any:
+        ids = np.fromiter(article_ids, dtype=np.int64)
+        indexes = np.searchsorted(self._article_ids, ids)
+        found = indexes < len(self._article_ids)
+        found[found] = self._article_ids[indexes[found]] == ids[found]
+        if not found.all():
+            joined_ids = ','.join([str(id) for id in ids[~found].tolist()])
+            raise KeyError(f'Articles not loaded in the engine with ids: {joined_ids}')
+
+        return indexes
+
+
+def read_columns(rows: Iterable[Iterable[int]], column_count: int) -> List[Any]:
+    # compact typed arrays avoid keeping a python object per value while reading from the DB.
+    columns = [array('q') for _ in range(column_count)]
+    for row in rows:
+        for (column, value) in zip(columns, row):
+            column.append(value)
+
+    return [np.array(column, dtype=np.int64) for column in columns]
@@ -0,0 +1,202 @@
+import json
+import platform
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import django
+from django.db import connection
+
+from .models import (
+    Article,
+    Product,
+    ProductRequirement,
+    ProductAvailability,
+    Reservation,
+    ReservationHold,
+    StockMovement
+)
+from .upload_parsers import ArticleUploadParser, ProductUploadParser
+from .business_logic import ArticleBusiness, ProductBusiness, ProductNotAvailableError
+from .data_business_objects import ArticleDBO, CreateProductDBO
+
+
+@dataclass
+class CatalogueScale:
+    name: str
+    article_count: int
+    product_count: int
+    requirements_per_product: int
+    shared_article_ratio: float
+
+
+@dataclass
+class BenchmarkResult:
+    scale: str
+    scenario: str
+    operations: int
+    seconds: float
+    queries: int
+    peak_memory_bytes: Optional[int]
+
+
+SCALES = {
+    'small': (1000, 500),
+    'medium': (10000, 5000),
+    'large': (100000, 50000),
+}
+
+
+def generate_articles_upload(scale: CatalogueScale, rng: random.Random, max_stock: int = 10000) -> dict:
+    return {
+        'inventory': [
+            { 'art_id': str(article_id), 'name': f'article {article_id}', 'stock': str(rng.randint(0, max_stock)) }
+            for article_id in range(1, scale.article_count + 1)
+        ]
+    }
+
+
+def generate_products_upload(scale: CatalogueScale, rng: random.Random) -> dict:
+    # a share of the requirements use a small pool of articles (think screws) that most products have in common.
+    shared_pool_size = max(1, scale.article_count // 100)
+    products = []
+    for product_index in range(scale.product_count):
+        article_ids = set()
+        while len(article_ids) < min(scale.requirements_per_product, scale.article_count):
+            if rng.random() < scale.shared_article_ratio:
+                article_ids.add(rng.randint(1, shared_pool_size))
+            else:
+                article_ids.add(rng.randint(1, scale.article_count))
+        products.append({
+            'name': f'product {product_index}',
+            'contain_articles': [
+                { 'art_id': str(article_id), 'amount_of': str(rng.randint(1, 10)) }
+                for article_id in sorted(article_ids)
+            ]
+        })
+
+    return { 'products': products }
+
+
+class BenchmarkRunner:
+    def __init__(self, sells: int, measure_memory: bool, seed: int) -> None:
+        self._sells = sells
+        self._measure_memory = measure_memory
+        self._seed = seed
+        self.results: List[BenchmarkResult] = []
+
+    def run_scale(self, scale: CatalogueScale) -> None:
+        rng = random.Random(self._seed)
+        clear_inventory()
+        articles_upload = generate_articles_upload(scale, rng)
+        products_upload = generate_products_upload(scale, rng)
+        article_count = len(articles_upload['inventory'])
+        product_count = len(products_upload['products'])
+
+        articles: List[ArticleDBO] = self._measure(
+            scale, 'parse_articles', article_count, lambda: ArticleUploadParser().parse(articles_upload)
+        )
+        self._measure(scale, 'save_articles', article_count, lambda: ArticleBusiness().save_articles(articles))
+        products: List[CreateProductDBO] = self._measure(
+            scale, 'parse_products', product_count, lambda: ProductUploadParser().parse(products_upload)
+        )
+        # the same products through the parse pool (INVENTORY_PARALLEL_PARSE_MIN_PRODUCTS), used when they make at
+        # least two chunks of INVENTORY_PARALLEL_PARSE_CHUNK_SIZE.
+        self._measure(
+            scale, 'parse_products_in_parallel', product_count, lambda: ProductUploadParser().parse_in_parallel(products_upload)
+        )
+        self._measure(scale, 'save_products', product_count, lambda: ProductBusiness().save_products(products))
+        self._measure(
+            scale, 'get_products_availability', product_count, lambda: ProductBusiness().get_products_availability()
+        )
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        sold_product_ids = [rng.choice(product_ids) for _ in range(self._sells)]
+        self._measure(scale, 'sell_product', len(sold_product_ids), lambda: self._sell_products(sold_product_ids))
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'seed': self._seed,
+            },
+            'results': [asdict(result) for result in self.results],
+        }, indent=2)
+
+    def _sell_products(self, product_ids: List[int]) -> None:
+        product_business = ProductBusiness()
+        for product_id in product_ids:
+            try:
+                product_business.sell_product(product_id)
+            except ProductNotAvailableError:
+                # products running out of stock are part of the workload.
+                pass
+
+    def _measure(self, scale: CatalogueScale, scenario: str, operations: int, fn: Callable[[], Any]) -> Any:
+        with count_queries() as query_count, measure_peak_memory(self._measure_memory) as peak_memory:
+            start = time.perf_counter()
+            value = fn()
+            seconds = time.perf_counter() - start
+
+        self.results.append(BenchmarkResult(
+            scale=scale.name,
+            scenario=scenario,
+            operations=operations,
+            seconds=round(seconds, 6),
+            queries=query_count[0],
+            peak_memory_bytes=peak_memory[0]
+        ))
+        return value
+
+
+@contextmanager
+def count_queries() -> Iterator[List[int]]:
+    query_count = [0]
+
+    def counter(execute: Callable, sql: str, params: Any, many: bool, context: Dict[str, Any]) -> Any:
+        query_count[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(counter):
+        yield query_count
+
+
+@contextmanager
+def measure_peak_memory(enabled: bool) -> Iterator[List[Optional[int]]]:
+    peak_memory: List[Optional[int]] = [None]
+    if not enabled:
+        yield peak_memory
+        return
+
+    tracemalloc.start()
+    try:
+        yield peak_memory
+        (_, peak_memory[0]) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+
+def clear_inventory() -> None:
+    with connection.cursor() as cursor:
+        for model in [ReservationHold, Reservation, StockMovement, ProductAvailability, ProductRequirement, Product, Article]:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+
+
+def parse_scale(value: str, requirements_per_product: int, shared_article_ratio: float) -> CatalogueScale:
+    # scales are either a preset name or "<articles>x<products>", e.g. "5000x1000".
+    if value in SCALES:
+        (article_count, product_count) = SCALES[value]
+    else:
+        (article_count, product_count) = tuple(map(int, value.split('x')))  # type: ignore
+
+    return CatalogueScale(
+        name=value,
+        article_count=article_count,
+        product_count=product_count,
+        requirements_per_product=requirements_per_product,
+        shared_article_ratio=shared_article_ratio
+    )
@@ -1,57 +1,332 @@
-from typing import List, Iterable, Any
-from django.db import transaction
+from datetime import datetime, timedelta
+from typing import List, Iterable, Iterator, Any, Callable, Dict, Optional, Set, Tuple
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from .repositories import ArticleRepository, ProductRepository
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from .metrics import SOLD_PRODUCTS, SELL_REJECTIONS, RESERVATIONS
+from .repositories import (
+    ArticleRepository,
+    ProductRepository,
+    ProductAvailabilityRepository,
+    InventoryVersionRepository,
+    UploadJobRepository,
+    ReservationRepository,
+    StockLedgerRepository,
+    CatalogueBulkLoadRepository,
+    is_stock_ledger_enabled
+)
 from .data_business_objects import (
     CreateProductDBO,
     ArticleDBO,
+    ArticleUploadResultDBO,
     ProductAvailabilityDBO,
-    ProductDBO,
-    ProductRequirementDBO
+    OrderLineDBO,
+    BasketLineFeasibilityDBO,
+    BasketFeasibilityDBO,
+    StockDeltaDBO,
+    UploadJobDBO,
+    ReservationRequestDBO,
+    ReservationDBO
 )
 
+class InventoryVersionBusiness:
+    def __init__(self) -> None:
+        self._inventory_version_repository = InventoryVersionRepository()
+
+    def get_version(self) -> int:
+        return self._inventory_version_repository.get_version()
+
+    def bump_version_on_commit(self, on_bumped: Optional[Callable[[int], None]] = None) -> None:
+        # the version is increased in its own short statement once the change is visible, instead of holding a
+        # lock on the single version row until the end of every write transaction.
+        if on_bumped is None:
+            transaction.on_commit(self._inventory_version_repository.bump_version)
+        else:
+            transaction.on_commit(lambda: on_bumped(self._inventory_version_repository.bump_and_get_version()))
+
+
 class ArticleBusiness:
     def __init__(self) -> None:
         self._article_repository = ArticleRepository()
+        self._product_availability_repository = ProductAvailabilityRepository()
+        self._inventory_version_business = InventoryVersionBusiness()
 
-    def save_articles(self, articles: List[ArticleDBO]) -> None:
-        self._article_repository.save_articles(articles)
+    def save_articles(
+        self,
+        articles: List[ArticleDBO],
+        on_version_bumped: Optional[Callable[[int], None]] = None
+    ) -> ArticleUploadResultDBO:
+        return self.save_articles_in_batches([articles], on_version_bumped)
+
+    def save_articles_in_batches(
+        self,
+        article_batches: Iterable[List[ArticleDBO]],
+        on_version_bumped: Optional[Callable[[int], None]] = None
+    ) -> ArticleUploadResultDBO:
+        # only new articles and articles whose name or stock differ from the stored ones are written. Full exports
+        # re-uploaded periodically change a few rows, rewriting all of them would only produce dead rows.
+        result = ArticleUploadResultDBO(created=0, updated=0, unchanged=0)
+        with transaction.atomic():
+            for articles in article_batches:
+                self._save_changed_articles(articles, result)
+            if result.created + result.updated > 0:
+                self._inventory_version_business.bump_version_on_commit(on_version_bumped)
+
+        return result
+
+    def _save_changed_articles(self, articles: List[ArticleDBO], result: ArticleUploadResultDBO) -> None:
+        # the last row of an article repeated in the upload wins.
+        uploaded_articles = { article.id: article for article in articles }
+        stored_articles = self._article_repository.get_articles_name_and_stock(
+            list(uploaded_articles.keys()),
+            get_article_diff_chunk_size()
+        )
+        changed_articles = []
+        for article in uploaded_articles.values():
+            stored_article = stored_articles.get(article.id)
+            if stored_article is None:
+                result.created += 1
+            elif stored_article != (article.name, article.stock):
+                result.updated += 1
+            else:
+                result.unchanged += 1
+                continue
+            changed_articles.append(article)
+
+        if len(changed_articles) > 0:
+            self._article_repository.save_articles(changed_articles)
+            self._product_availability_repository.refresh_for_articles([article.id for article in changed_articles])
+
+    def apply_stock_deltas(self, deltas: List[StockDeltaDBO]) -> None:
+        article_deltas: Dict[int, int] = {}
+        for delta in deltas:
+            article_deltas[delta.article_id] = article_deltas.get(delta.article_id, 0) + delta.delta
+        (_, no_existing_ids) = self._article_repository.partition_ids_by_existence(list(article_deltas.keys()))
+        if len(no_existing_ids) > 0:
+            raise ArticleDoesNotExistError(*no_existing_ids)
+
+        with transaction.atomic():
+            rejected_stock = self._article_repository.apply_articles_stock_deltas(article_deltas, get_stock_delta_batch_size())
+            if len(rejected_stock) == 0:
+                self._product_availability_repository.refresh_for_articles(article_deltas.keys())
+                self._inventory_version_business.bump_version_on_commit()
+                return
+
+        raise StockDeltaRejectedError(*[
+            f'deltas[{index}]: stock of article with id={delta.article_id} can not be lower than zero, '
+            f'current stock is {rejected_stock[delta.article_id]}'
+            for (index, delta) in enumerate(deltas)
+            if delta.article_id in rejected_stock
+        ])
 
 
 class ProductBusiness:
     def __init__(self) -> None:
         self._article_repository = ArticleRepository()
         self._product_repository = ProductRepository()
+        self._product_availability_repository = ProductAvailabilityRepository()
+        self._inventory_version_business = InventoryVersionBusiness()
 
     def save_products(self, products: List[CreateProductDBO]) -> None:
-        self.validate_product_names_not_exist(products)
-        self.validate_product_requirement_articles_exist(products)
+        self.validate_products(products)
         with transaction.atomic():
-            self._product_repository.create_products(products)
-
-    def get_products_availability(self) -> List[ProductAvailabilityDBO]:
-        products = self._product_repository.get_products_with_requirement_details()
-        return [
-            ProductAvailabilityDBO(
-                id=product.id,
-                name=product.name,
-                availability=self._get_product_availability(product.requirements)
-            )
-            for product in products
-        ]
+            product_ids = self._product_repository.create_products(products)
+            self._product_availability_repository.refresh_for_products(product_ids)
+            self._inventory_version_business.bump_version_on_commit()
+
+    def save_products_in_batches(self, product_batches: Iterable[List[CreateProductDBO]]) -> int:
+        saved_count = 0
+        with transaction.atomic():
+            for products in product_batches:
+                self.save_products(products)
+                saved_count += len(products)
+
+        return saved_count
+
+    def get_products_availability(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        min_availability: Optional[int] = None,
+        product_ids: Optional[List[int]] = None
+    ) -> List[ProductAvailabilityDBO]:
+        # with the stock ledger the stored availability lags behind the sells until the compactor refreshes it, the
+        # availability is computed from the stored stock plus the pending movements instead.
+        if is_stock_ledger_enabled():
+            return self._product_repository.get_products_availability(after_id, limit, min_availability, product_ids)
+
+        return self._product_availability_repository.get_products_availability(
+            after_id,
+            limit,
+            min_availability,
+            product_ids
+        )
+
+    def iter_products_availability(
+        self,
+        chunk_size: int,
+        min_availability: Optional[int] = None,
+        product_ids: Optional[List[int]] = None
+    ) -> Iterator[ProductAvailabilityDBO]:
+        after_id = None
+        while True:
+            products_availability = self.get_products_availability(after_id, chunk_size, min_availability, product_ids)
+            yield from products_availability
+            if len(products_availability) < chunk_size:
+                return
+            after_id = products_availability[-1].id
 
     def sell_product(self, product_id: int) -> None:
-        try:
-            product = self._product_repository.get_product_with_requirement_details(product_id)
-            self.validate_product_availability(product)
-            self._reduce_article_stocks_from_requirements(product.requirements)
-        except ObjectDoesNotExist as exception:
-            raise ProductDoesNotExistError(product_id) from exception
+        article_quantities = self._product_repository.get_requirement_article_quantities(product_id)
+        if len(article_quantities) == 0:
+            if not self._product_repository.exists(product_id):
+                raise ProductDoesNotExistError(product_id)
+            SOLD_PRODUCTS.inc()
+            return
+
+        with transaction.atomic():
+            if not self._article_repository.decrement_articles_stock(article_quantities):
+                SELL_REJECTIONS.inc()
+                raise ProductNotAvailableError(product_id)
+            self._refresh_availability_after_sale(article_quantities.keys())
+            self._inventory_version_business.bump_version_on_commit()
+        SOLD_PRODUCTS.inc()
+
+    def sell_products(self, lines: List[OrderLineDBO]) -> None:
+        products_article_quantities = self._get_lines_requirement_article_quantities(lines)
+
+        article_demand: Dict[int, int] = {}
+        for line in lines:
+            for (article_id, quantity) in products_article_quantities.get(line.product_id, {}).items():
+                article_demand[article_id] = article_demand.get(article_id, 0) + quantity * line.quantity
+
+        sold_units = sum([line.quantity for line in lines])
+        if len(article_demand) == 0:
+            SOLD_PRODUCTS.inc(sold_units)
+            return
+        with transaction.atomic():
+            if self._article_repository.decrement_articles_stock(article_demand):
+                self._refresh_availability_after_sale(article_demand.keys())
+                self._inventory_version_business.bump_version_on_commit()
+                SOLD_PRODUCTS.inc(sold_units)
+                return
+
+        SELL_REJECTIONS.inc()
+
+        articles_stock = self._article_repository.get_articles_available_stock(article_demand.keys())
+        short_article_ids = {
+            article_id for (article_id, demand) in article_demand.items()
+            if articles_stock.get(article_id, 0) < demand
+        }
+        line_errors = []
+        for (index, line) in enumerate(lines):
+            line_short_ids = sorted(short_article_ids.intersection(products_article_quantities.get(line.product_id, {})))
+            if len(line_short_ids) > 0:
+                joined_ids = ','.join([str(id) for id in line_short_ids])
+                line_errors.append(f'lines[{index}]: not enough stock of articles with ids {joined_ids} for product id={line.product_id}')
+        if len(line_errors) == 0:
+            # the stock read after the rejection can include units freed since by other sells or uploads.
+            line_errors = [
+                f'lines[{index}]: not enough stock for product id={line.product_id}'
+                for (index, line) in enumerate(lines) if len(products_article_quantities.get(line.product_id, {})) > 0
+            ]
+
+        raise OrderNotAvailableError(*line_errors)
+
+    def get_basket_feasibility(self, lines: List[OrderLineDBO]) -> BasketFeasibilityDBO:
+        # products compete for the articles they share: the lines are served in order from the available stock, each
+        # one with as many units as the stock left by the previous lines allows.
+        products_article_quantities = self._get_lines_requirement_article_quantities(lines)
+        article_ids = {
+            article_id
+            for article_quantities in products_article_quantities.values()
+            for article_id in article_quantities
+        }
+        available_stock = self._article_repository.get_articles_available_stock(article_ids)
+        remaining_stock = dict(available_stock)
+
+        basket_demand: Dict[int, int] = {}
+        feasible_lines = []
+        for line in lines:
+            article_quantities = products_article_quantities.get(line.product_id, {})
+            feasible_quantity = min(
+                [line.quantity] + [remaining_stock.get(id, 0) // quantity for (id, quantity) in article_quantities.items()]
+            )
+            for (article_id, quantity) in article_quantities.items():
+                remaining_stock[article_id] = remaining_stock.get(article_id, 0) - quantity * feasible_quantity
+                basket_demand[article_id] = basket_demand.get(article_id, 0) + quantity * line.quantity
+            feasible_lines.append(BasketLineFeasibilityDBO(line.product_id, line.quantity, feasible_quantity))
+
+        # number of whole baskets the stock can serve, unlimited (None) when the products need no articles.
+        max_baskets = min(
+            [available_stock.get(id, 0) // demand for (id, demand) in basket_demand.items()],
+            default=None
+        )
+
+        return BasketFeasibilityDBO(
+            lines=feasible_lines,
+            feasible=all(line.feasible_quantity == line.quantity for line in feasible_lines),
+            max_baskets=max_baskets
+        )
+
+    def rebuild_products_availability(self) -> None:
+        self._product_availability_repository.rebuild()
 
-    def validate_product_availability(self, product: ProductDBO) -> None:
-        availability = self._get_product_availability(product.requirements)
-        if availability == 0:
-            raise ProductNotAvailableError(product.id)
+    def verify_products_availability(self, chunk_size: int) -> List[Tuple[int, Optional[int], int]]:
+        # compares the stored availability with the one computed from the current stock, returning the mismatches
+        # as (product id, stored availability, computed availability).
+        mismatches = []
+        after_id = None
+        while True:
+            computed = self._product_repository.get_products_availability(after_id, chunk_size)
+            stored = self._product_availability_repository.get_stored_availability([item.id for item in computed])
+            mismatches.extend([
+                (item.id, stored.get(item.id), item.availability)
+                for item in computed
+                if stored.get(item.id) != item.availability
+            ])
+            if len(computed) < chunk_size:
+                return mismatches
+            after_id = computed[-1].id
+
+    def _get_lines_requirement_article_quantities(self, lines: List[OrderLineDBO]) -> Dict[int, Dict[int, int]]:
+        product_ids = list({line.product_id for line in lines})
+        products_article_quantities = self._product_repository.get_products_requirement_article_quantities(product_ids)
+        no_requirement_ids = [id for id in product_ids if id not in products_article_quantities]
+        (_, no_existing_ids) = self._product_repository.partition_ids_by_existence(no_requirement_ids)
+        if len(no_existing_ids) > 0:
+            raise OrderNotAvailableError(*[
+                f'lines[{index}]: {ProductDoesNotExistError(line.product_id)}'
+                for (index, line) in enumerate(lines)
+                if line.product_id in no_existing_ids
+            ])
+
+        return products_article_quantities
+
+    def _refresh_availability_after_sale(self, article_ids: Iterable[int]) -> None:
+        # with the stock ledger the sells don't write the article rows, refreshing the availability rows of their
+        # products would make them contend there instead. The availability is read from the ledger, and the
+        # compactor refreshes the stored one for each batch it folds.
+        if not is_stock_ledger_enabled():
+            self._product_availability_repository.refresh_for_articles(article_ids)
+
+    def validate_products(self, products: List[CreateProductDBO], uploaded_names: Optional[Set[str]] = None) -> None:
+        # uploads validated in batches pass the names of the previous batches, they are extended with the new ones.
+        self.validate_product_names_not_repeated(products, uploaded_names if uploaded_names is not None else set())
+        self.validate_product_names_not_exist(products)
+        self.validate_product_requirement_articles_exist(products)
+
+    def validate_product_names_not_repeated(self, products: Iterable[CreateProductDBO], uploaded_names: Set[str]) -> None:
+        repeated_names = []
+        for product in products:
+            if product.name in uploaded_names:
+                repeated_names.append(product.name)
+            uploaded_names.add(product.name)
+
+        if len(repeated_names) > 0:
+            raise ProductAlreadyExistError(*sorted(set(repeated_names)))
 
     def validate_product_requirement_articles_exist(self, products: List[CreateProductDBO]) -> None:
         product_requirements = flat_list([product.requirements for product in products])
@@ -68,15 +343,203 @@ class ProductBusiness:
         if len(existing_names) > 0:
             raise ProductAlreadyExistError(*existing_names)
 
-    def _get_product_availability(self, requirements: List[ProductRequirementDBO]) -> int:
-        return min([req.article.stock // req.quantity for req in requirements])
+class UploadJobBusiness:
+    def __init__(self) -> None:
+        self._upload_job_repository = UploadJobRepository()
+
+    def create_job(self, kind: str, file: File) -> UploadJobDBO:
+        return self._upload_job_repository.create_job(kind, file)
+
+    def get_job(self, job_id: str) -> UploadJobDBO:
+        try:
+            return self._upload_job_repository.get_job(job_id)
+        except ObjectDoesNotExist as exception:
+            raise UploadJobDoesNotExistError(job_id) from exception
+
+    def get_runnable_job_ids(self) -> List[str]:
+        return self._upload_job_repository.get_runnable_job_ids(self._get_stale_before())
 
-    def _reduce_article_stocks_from_requirements(self, requirements: List[ProductRequirementDBO]) -> None:
-        new_product_articles_stock = {
-            requirement.article.id: requirement.article.stock - requirement.quantity
-            for requirement in requirements
+    def claim_job(self, job_id: str) -> bool:
+        return self._upload_job_repository.claim_job(job_id)
+
+    def claim_interrupted_job(self, job_id: str) -> bool:
+        return self._upload_job_repository.claim_stale_job(job_id, self._get_stale_before())
+
+    def open_job_file(self, job_id: str) -> Any:
+        return self._upload_job_repository.open_job_file(job_id)
+
+    def report_job_alive(self, job_id: str) -> None:
+        self._upload_job_repository.touch_job(job_id)
+
+    def start_applying_job(self, job_id: str, total_count: int) -> None:
+        self._upload_job_repository.set_job_total_count(job_id, total_count)
+
+    def report_job_progress(self, job_id: str, processed_count: int) -> None:
+        self._upload_job_repository.set_job_processed_count(job_id, processed_count)
+
+    def finish_job(self, job_id: str, errors: List[str]) -> None:
+        self._upload_job_repository.finish_job(job_id, errors)
+
+    def _get_stale_before(self) -> datetime:
+        return timezone.now() - timedelta(seconds=get_upload_job_stale_seconds())
+
+
+class StockLedgerBusiness:
+    def __init__(self) -> None:
+        self._stock_ledger_repository = StockLedgerRepository()
+        self._product_availability_repository = ProductAvailabilityRepository()
+        self._inventory_version_business = InventoryVersionBusiness()
+
+    def compact_movements(self, batch_size: Optional[int] = None) -> int:
+        batch_size = batch_size or get_ledger_compaction_batch_size()
+        compacted_count = 0
+        while True:
+            with transaction.atomic():
+                (article_ids, movements_count) = self._stock_ledger_repository.compact_movements(batch_size)
+                # the availability the sells left behind is refreshed once for the whole batch, while the articles
+                # are still locked.
+                if len(article_ids) > 0:
+                    self._product_availability_repository.refresh_for_articles(article_ids)
+                    self._inventory_version_business.bump_version_on_commit()
+            compacted_count += movements_count
+            if len(article_ids) < batch_size:
+                return compacted_count
+
+
+class ReservationBusiness:
+    # Reservations hold the articles of some units of a product during a checkout. Held units are part of the stock
+    # but not of the availability, and a confirmation turns them into a sale without checking the stock again.
+    def __init__(self) -> None:
+        self._article_repository = ArticleRepository()
+        self._product_repository = ProductRepository()
+        self._reservation_repository = ReservationRepository()
+        self._product_availability_repository = ProductAvailabilityRepository()
+        self._inventory_version_business = InventoryVersionBusiness()
+
+    def reserve_product(self, product_id: int, reservation_request: ReservationRequestDBO) -> ReservationDBO:
+        article_quantities = {
+            article_id: quantity * reservation_request.quantity
+            for (article_id, quantity) in self._product_repository.get_requirement_article_quantities(product_id).items()
         }
-        self._article_repository.update_articles_stock(new_product_articles_stock)
+        if len(article_quantities) == 0 and not self._product_repository.exists(product_id):
+            raise ProductDoesNotExistError(product_id)
+
+        ttl_seconds = min(reservation_request.ttl_seconds or get_reservation_ttl(), get_reservation_max_ttl())
+        # expired reservations may still hold the stock when no sweep ran lately, they are expired before rejecting.
+        reservation = self._create_reservation(product_id, reservation_request.quantity, ttl_seconds, article_quantities)
+        if reservation is None and self.expire_reservations() > 0:
+            reservation = self._create_reservation(product_id, reservation_request.quantity, ttl_seconds, article_quantities)
+        if reservation is None:
+            RESERVATIONS.inc(outcome='rejected')
+            raise ProductNotAvailableError(product_id)
+
+        RESERVATIONS.inc(outcome='created')
+        return reservation
+
+    def get_reservation(self, reservation_id: str) -> ReservationDBO:
+        try:
+            return self._reservation_repository.get_reservation(reservation_id)
+        except ObjectDoesNotExist as exception:
+            raise ReservationDoesNotExistError(reservation_id) from exception
+
+    def confirm_reservation(self, reservation_id: str) -> None:
+        reservation = self.get_reservation(reservation_id)
+        with transaction.atomic():
+            if not self._reservation_repository.confirm_reservation(reservation_id, timezone.now()):
+                raise ReservationNotActiveError(reservation_id)
+            article_quantities = self._reservation_repository.get_held_article_quantities([reservation_id])
+            if len(article_quantities) > 0:
+                if not self._article_repository.consume_reserved_stock(article_quantities):
+                    raise ProductNotAvailableError(reservation.product_id)
+                # the stock and the reserved units decrease together, the availability doesn't change.
+                self._inventory_version_business.bump_version_on_commit()
+        RESERVATIONS.inc(outcome='confirmed')
+        SOLD_PRODUCTS.inc(reservation.quantity)
+
+    def release_reservation(self, reservation_id: str) -> None:
+        self.get_reservation(reservation_id)
+        with transaction.atomic():
+            if not self._reservation_repository.release_reservation(reservation_id):
+                raise ReservationNotActiveError(reservation_id)
+            self._release_held_stock([reservation_id])
+        RESERVATIONS.inc(outcome='released')
+
+    def expire_reservations(self, batch_size: Optional[int] = None) -> int:
+        batch_size = batch_size or get_reservation_sweep_batch_size()
+        expired_count = 0
+        while True:
+            with transaction.atomic():
+                reservation_ids = self._reservation_repository.expire_reservations(timezone.now(), batch_size)
+                self._release_held_stock(reservation_ids)
+            expired_count += len(reservation_ids)
+            RESERVATIONS.inc(len(reservation_ids), outcome='expired')
+            if len(reservation_ids) < batch_size:
+                return expired_count
+
+    def _create_reservation(
+        self,
+        product_id: int,
+        quantity: int,
+        ttl_seconds: int,
+        article_quantities: Dict[int, int]
+    ) -> Optional[ReservationDBO]:
+        with transaction.atomic():
+            if len(article_quantities) > 0 and not self._article_repository.reserve_articles_stock(article_quantities):
+                return None
+            reservation = self._reservation_repository.create_reservation(
+                product_id,
+                quantity,
+                timezone.now() + timedelta(seconds=ttl_seconds),
+                article_quantities
+            )
+            if len(article_quantities) > 0:
+                self._refresh_availability(article_quantities.keys())
+                self._inventory_version_business.bump_version_on_commit()
+
+        return reservation
+
+    def _release_held_stock(self, reservation_ids: List[str]) -> None:
+        article_quantities = self._reservation_repository.get_held_article_quantities(reservation_ids)
+        if len(article_quantities) == 0:
+            return
+        self._article_repository.release_reserved_stock(article_quantities)
+        self._refresh_availability(article_quantities.keys())
+        self._inventory_version_business.bump_version_on_commit()
+
+    def _refresh_availability(self, article_ids: Iterable[int]) -> None:
+        # like the sells, reservations with the stock ledger leave the stored availability to the compactor.
+        if not is_stock_ledger_enabled():
+            self._product_availability_repository.refresh_for_articles(article_ids)
+
+
+class CatalogueBulkLoadBusiness:
+    def __init__(self) -> None:
+        self._catalogue_bulk_load_repository = CatalogueBulkLoadRepository()
+        self._product_availability_repository = ProductAvailabilityRepository()
+        self._inventory_version_business = InventoryVersionBusiness()
+
+    def load(self, articles: Iterable[ArticleDBO], products: Iterable[CreateProductDBO]) -> Tuple[int, int]:
+        with transaction.atomic():
+            self._catalogue_bulk_load_repository.create_staging_tables()
+            self._catalogue_bulk_load_repository.stage_articles(articles)
+            self._catalogue_bulk_load_repository.stage_products(products)
+
+            saved_articles_count = self._catalogue_bulk_load_repository.merge_articles()
+            missing_article_ids = self._catalogue_bulk_load_repository.get_staged_missing_article_ids()
+            if len(missing_article_ids) > 0:
+                raise ArticleDoesNotExistError(*missing_article_ids)
+            conflicting_names = self._catalogue_bulk_load_repository.get_staged_conflicting_product_names()
+            if len(conflicting_names) > 0:
+                raise ProductAlreadyExistError(*conflicting_names)
+            created_products_count = self._catalogue_bulk_load_repository.merge_products()
+
+            self._catalogue_bulk_load_repository.drop_staging_tables()
+            # a bulk load can change most of the catalogue, the stored availability is recomputed in a single statement.
+            self._product_availability_repository.rebuild()
+            self._inventory_version_business.bump_version_on_commit()
+
+        return (saved_articles_count, created_products_count)
+
 
 class BusinessValidationError(Exception):
     pass
@@ -103,6 +566,59 @@ class ProductDoesNotExistError(BusinessValidationError):
         self.product_id = product_id
         super().__init__(f'Product does not exist with id={product_id}')
 
+class UploadJobDoesNotExistError(BusinessValidationError):
+    def __init__(self, job_id: str) -> None:
+        self.job_id = job_id
+        super().__init__(f'Upload job does not exist with id={job_id}')
+
+class StockDeltaRejectedError(BusinessValidationError):
+    def __init__(self, *delta_errors: str) -> None:
+        self.delta_errors = delta_errors
+        super().__init__('\n'.join(self.delta_errors))
+
+class ReservationDoesNotExistError(BusinessValidationError):
+    def __init__(self, reservation_id: str) -> None:
+        self.reservation_id = reservation_id
+        super().__init__(f'Reservation does not exist with id={reservation_id}')
+
+class ReservationNotActiveError(BusinessValidationError):
+    def __init__(self, reservation_id: str) -> None:
+        self.reservation_id = reservation_id
+        super().__init__(f'Reservation is not active with id={reservation_id}')
+
+class OrderNotAvailableError(BusinessValidationError):
+    def __init__(self, *line_errors: str) -> None:
+        self.line_errors = line_errors
+        super().__init__('\n'.join(self.line_errors))
+
+
+def get_article_diff_chunk_size() -> int:
+    return getattr(settings, 'INVENTORY_ARTICLE_DIFF_CHUNK_SIZE', 5000)
+
+
+def get_upload_job_stale_seconds() -> int:
+    return getattr(settings, 'INVENTORY_UPLOAD_JOB_STALE_SECONDS', 300)
+
+
+def get_stock_delta_batch_size() -> int:
+    return getattr(settings, 'INVENTORY_STOCK_DELTA_BATCH_SIZE', 500)
+
+
+def get_ledger_compaction_batch_size() -> int:
+    return getattr(settings, 'INVENTORY_LEDGER_COMPACTION_BATCH_SIZE', 1000)
+
+
+def get_reservation_ttl() -> int:
+    return getattr(settings, 'INVENTORY_RESERVATION_TTL', 900)
+
+
+def get_reservation_max_ttl() -> int:
+    return getattr(settings, 'INVENTORY_RESERVATION_MAX_TTL', 3600)
+
+
+def get_reservation_sweep_batch_size() -> int:
+    return getattr(settings, 'INVENTORY_RESERVATION_SWEEP_BATCH_SIZE', 1000)
+
 
 def flat_list(list_groups: Iterable[Iterable[Any]]) -> Iterable[Any]:
     return [item for group in list_groups for item in group]
@@ -1,35 +1,107 @@
 from dataclasses import dataclass
-from typing import List
+from datetime import datetime
+from typing import List, Optional
+
+# Data objects are created for every row read or uploaded, they declare __slots__ to keep them small and fast
+# to create (dataclass(slots=True) needs python 3.10).
 
 @dataclass
 class CreateProductRequirementDBO:
+    __slots__ = ('quantity', 'article_id')
     quantity: int
     article_id: int
 
 @dataclass
 class CreateProductDBO:
+    __slots__ = ('name', 'requirements')
     name: str
     requirements: List[CreateProductRequirementDBO]
 
 @dataclass
 class ArticleDBO:
+    __slots__ = ('id', 'name', 'stock')
     id: int
     name: str
     stock: int
 
 @dataclass
 class ProductRequirementDBO:
+    __slots__ = ('quantity', 'article')
     quantity: int
     article: ArticleDBO
 
 @dataclass
 class ProductDBO:
+    __slots__ = ('id', 'name', 'requirements')
     id: int
     name: str
     requirements: List[ProductRequirementDBO]
 
 @dataclass
 class ProductAvailabilityDBO:
+    __slots__ = ('id', 'name', 'availability')
     id: int
     name: str
     availability: int
+
+@dataclass
+class BasketLineFeasibilityDBO:
+    __slots__ = ('product_id', 'quantity', 'feasible_quantity')
+    product_id: int
+    quantity: int
+    feasible_quantity: int
+
+@dataclass
+class BasketFeasibilityDBO:
+    __slots__ = ('lines', 'feasible', 'max_baskets')
+    lines: List[BasketLineFeasibilityDBO]
+    feasible: bool
+    max_baskets: Optional[int]
+
+@dataclass
+class ArticleUploadResultDBO:
+    __slots__ = ('created', 'updated', 'unchanged')
+    created: int
+    updated: int
+    unchanged: int
+
+@dataclass
+class StockDeltaDBO:
+    __slots__ = ('article_id', 'delta')
+    article_id: int
+    delta: int
+
+@dataclass
+class OrderLineDBO:
+    __slots__ = ('product_id', 'quantity')
+    product_id: int
+    quantity: int
+
+@dataclass
+class UploadJobDBO:
+    __slots__ = ('id', 'kind', 'status', 'total_count', 'processed_count', 'errors', 'created_at', 'started_at', 'finished_at')
+    id: str
+    kind: str
+    status: str
+    total_count: Optional[int]
+    processed_count: int
+    errors: List[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+@dataclass
+class ReservationRequestDBO:
+    __slots__ = ('quantity', 'ttl_seconds')
+    quantity: int
+    ttl_seconds: Optional[int]
+
+@dataclass
+class ReservationDBO:
+    __slots__ = ('id', 'product_id', 'quantity', 'status', 'created_at', 'expires_at')
+    id: str
+    product_id: int
+    quantity: int
+    status: str
+    created_at: datetime
+    expires_at: datetime
@@ -0,0 +1,128 @@
+import random
+from contextlib import contextmanager
+from contextvars import Context, ContextVar, copy_context
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Callable, Iterable, Iterator, List, Optional, TypeVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Read-only repository methods decorated with @read_from_replica query one of the INVENTORY_REPLICA_DATABASES,
+# everything else (and every write) uses the primary `default` database. Replicas lag behind the primary, so reads
+# stay on the primary when:
+# - the routing scope is pinned: the request is a write (sell, upload, ...), it comes from a client that wrote less
+#   than INVENTORY_REPLICA_PIN_SECONDS ago (see ReplicaPinningMiddleware) or something was written to the primary;
+# - the primary is inside a transaction, whose reads must see its own writes and locks.
+
+T = TypeVar('T', bound=Callable[..., Any])
+Item = TypeVar('Item')
+
+
+@dataclass
+class RoutingScope:
+    __slots__ = ('pinned', 'replica')
+    pinned: bool
+    # replica chosen for the whole scope, so the reads of a request see a single snapshot.
+    replica: Optional[str]
+
+
+_routing_scope: ContextVar[Optional[RoutingScope]] = ContextVar('inventory_routing_scope', default=None)
+_reading_from_replica: ContextVar[bool] = ContextVar('inventory_reading_from_replica', default=False)
+
+
+def get_replica_databases() -> List[str]:
+    return getattr(settings, 'INVENTORY_REPLICA_DATABASES', [])
+
+
+def get_replica_pin_seconds() -> int:
+    return getattr(settings, 'INVENTORY_REPLICA_PIN_SECONDS', 10)
+
+
+@contextmanager
+def routing_scope(pinned: bool = False) -> Iterator[RoutingScope]:
+    scope = RoutingScope(pinned=pinned, replica=None)
+    token = _routing_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _routing_scope.reset(token)
+
+
+def iterate_in_routing_scope(items: Iterable[Item]) -> Iterator[Item]:
+    # streamed responses are consumed by the server after the middleware left the routing scope of the request: every
+    # item is produced in the context captured here, keeping the pinning and the replica chosen for the request.
+    return _iterate_in_context(copy_context(), iter(items))
+
+
+def _iterate_in_context(context: Context, iterator: Iterator[Item]) -> Iterator[Item]:
+    while True:
+        try:
+            item = context.run(next, iterator)
+        except StopIteration:
+            return
+        yield item
+
+
+def pin_to_primary() -> None:
+    # outside a routing scope (management commands, upload job threads) the context stays pinned from now on.
+    scope = _routing_scope.get()
+    if scope is None:
+        _routing_scope.set(RoutingScope(pinned=True, replica=None))
+    else:
+        scope.pinned = True
+
+
+def is_pinned_to_primary() -> bool:
+    scope = _routing_scope.get()
+    return scope is not None and scope.pinned
+
+
+def get_read_replica() -> Optional[str]:
+    replicas = get_replica_databases()
+    if len(replicas) == 0 or is_pinned_to_primary() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+
+    scope = _routing_scope.get()
+    if scope is None:
+        return random.choice(replicas)
+    if scope.replica is None:
+        scope.replica = random.choice(replicas)
+
+    return scope.replica
+
+
+def read_from_replica(method: T) -> T:
+    @wraps(method)
+    def wrapped_method(*args: Any, **kwargs: Any) -> Any:
+        token = _reading_from_replica.set(True)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _reading_from_replica.reset(token)
+
+    return wrapped_method  # type: ignore
+
+
+class ReplicaRouter:
+    def db_for_read(self, model: Any, **hints: Any) -> Optional[str]:
+        if not _reading_from_replica.get():
+            return None
+
+        return get_read_replica()
+
+    def db_for_write(self, model: Any, **hints: Any) -> Optional[str]:
+        pin_to_primary()
+        return None
+
+    def allow_relation(self, obj1: Any, obj2: Any, **hints: Any) -> Optional[bool]:
+        # replicas hold the same rows as the primary.
+        databases = [DEFAULT_DB_ALIAS, *get_replica_databases()]
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db: str, app_label: str, model_name: Optional[str] = None, **hints: Any) -> Optional[bool]:
+        # replicas receive the schema from the primary.
+        if db in get_replica_databases():
+            return False
+        return None
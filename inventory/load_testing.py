@@ -0,0 +1,314 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.testcases import LiveServerThread, _StaticFilesHandler
+from django.test.utils import modify_settings
+from django.urls import reverse
+
+from .models import Article, Product
+from .upload_parsers import ArticleUploadParser, ProductUploadParser
+from .business_logic import ArticleBusiness, ProductBusiness
+from .repositories import ArticleRepository, ProductRepository
+from .benchmarks import CatalogueScale, clear_inventory, generate_articles_upload, generate_products_upload
+
+
+@dataclass
+class LoadResult:
+    name: str
+    url: str
+    concurrency: int
+    requests: int
+    seconds: float
+    status_counts: Dict[str, int]
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.requests / self.seconds if self.seconds > 0 else 0.0
+
+
+def percentile(sorted_values: List[float], ratio: float) -> float:
+    if len(sorted_values) == 0:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(ratio * len(sorted_values)) - 1))
+
+    return sorted_values[index]
+
+
+def send_request(url: str, method: str, timeout: float) -> Tuple[str, float]:
+    # returns the status (or the connection error name) and the latency of a single request.
+    start = time.perf_counter()
+    try:
+        with urlopen(Request(url, method=method, data=b'' if method == 'POST' else None), timeout=timeout) as response:
+            response.read()
+            status = str(response.status)
+    except HTTPError as exception:
+        status = str(exception.code)
+    except (URLError, OSError) as exception:
+        status = type(exception).__name__
+
+    return (status, time.perf_counter() - start)
+
+
+def run_http_load(
+    name: str,
+    url: str,
+    method: str,
+    concurrency: int,
+    requests: int,
+    timeout: Optional[float] = 30.0
+) -> LoadResult:
+    # keeps `concurrency` requests open at any time until `requests` requests are answered.
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        responses = list(executor.map(lambda _: send_request(url, method, timeout), range(requests)))
+    seconds = time.perf_counter() - start
+
+    status_counts: Dict[str, int] = {}
+    for (status, _) in responses:
+        status_counts[status] = status_counts.get(status, 0) + 1
+    latencies = sorted([latency * 1000 for (_, latency) in responses])
+
+    return LoadResult(
+        name,
+        url,
+        concurrency,
+        requests,
+        seconds,
+        status_counts,
+        percentile(latencies, 0.5),
+        percentile(latencies, 0.95),
+        percentile(latencies, 0.99)
+    )
+
+
+@dataclass
+class SellLoadReport:
+    target: str
+    concurrency: int
+    requests: int
+    seconds: float
+    status_counts: Dict[str, int]
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    lock_wait_seconds: float
+    locking_statements: int
+    sold_units: int
+    # (article id, expected stock, final stock) of every article whose final stock doesn't match the sales.
+    stock_mismatches: List[Tuple[int, int, int]]
+    oversold_article_ids: List[int]
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.requests / self.seconds if self.seconds > 0 else 0.0
+
+
+class LockWaitTimer:
+    # Times the statements that lock article rows (guarded stock UPDATEs, ledger advisory locks and SELECT ... FOR
+    # UPDATE). Under contention their duration is mostly the time spent waiting for the locks of other transactions.
+    def __init__(self) -> None:
+        self.seconds = 0.0
+        self.statement_count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute: Callable, sql: str, params: Any, many: bool, context: Dict[str, Any]) -> Any:
+        if not self._is_locking_statement(context['connection'], sql):
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.seconds += seconds
+                self.statement_count += 1
+
+    def _is_locking_statement(self, connection: Any, sql: str) -> bool:
+        article_table = connection.ops.quote_name(Article._meta.db_table)
+        return sql.startswith(f'UPDATE {article_table}') or 'pg_advisory_xact_lock' in sql or 'FOR UPDATE' in sql
+
+
+@contextmanager
+def silence_request_logs() -> Iterator[None]:
+    # every rejected or failed sell would log a warning or a traceback, the report counts them instead.
+    loggers = [logging.getLogger('django.request'), logging.getLogger('django.server')]
+    levels = [logger.level for logger in loggers]
+    for logger in loggers:
+        logger.setLevel(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        for (logger, level) in zip(loggers, levels):
+            logger.setLevel(level)
+
+
+@contextmanager
+def time_lock_waits() -> Iterator[LockWaitTimer]:
+    # every connection opened meanwhile (worker and server threads open their own ones) is timed.
+    timer = LockWaitTimer()
+
+    def add_timer(sender: Any, connection: Any, **kwargs: Any) -> None:
+        connection.execute_wrappers.append(timer)
+
+    connection_created.connect(add_timer)
+    try:
+        yield timer
+    finally:
+        connection_created.disconnect(add_timer)
+
+
+class SellLoadHarness:
+    # Seeds a synthetic catalogue, sells random "hot" products sharing articles from concurrent clients and checks that
+    # the final stock of every article is its initial stock minus the confirmed sales.
+    def __init__(self, scale: CatalogueScale, hot_product_count: int, max_stock: int, seed: int) -> None:
+        self._scale = scale
+        self._hot_product_count = hot_product_count
+        self._max_stock = max_stock
+        self._rng = random.Random(seed)
+
+    def seed_catalogue(self) -> List[int]:
+        clear_inventory()
+        articles = ArticleUploadParser().parse(generate_articles_upload(self._scale, self._rng, self._max_stock))
+        ArticleBusiness().save_articles(articles)
+        products = ProductUploadParser().parse(generate_products_upload(self._scale, self._rng))
+        ProductBusiness().save_products(products)
+
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        return self._rng.sample(product_ids, min(self._hot_product_count, len(product_ids)))
+
+    def run(self, target: str, concurrency: int, requests: int) -> SellLoadReport:
+        hot_product_ids = self.seed_catalogue()
+        products_article_quantities = ProductRepository().get_products_requirement_article_quantities(hot_product_ids)
+        article_ids = list({id for article_quantities in products_article_quantities.values() for id in article_quantities})
+        initial_stock = ArticleRepository().get_articles_stock(article_ids)
+        sold_product_ids = [self._rng.choice(hot_product_ids) for _ in range(requests)]
+
+        with modify_settings(ALLOWED_HOSTS={ 'append': ['testserver', 'localhost'] }), silence_request_logs(), \
+                time_lock_waits() as lock_wait_timer:
+            start = time.perf_counter()
+            if target == 'http':
+                responses = self._sell_over_http(sold_product_ids, concurrency)
+            else:
+                responses = self._sell_with_client(sold_product_ids, concurrency)
+            seconds = time.perf_counter() - start
+
+        # only the answered sells count as sales, failed requests (e.g. DB errors) are rolled back.
+        sold_units = 0
+        expected_stock = dict(initial_stock)
+        for (product_id, (status, _)) in zip(sold_product_ids, responses):
+            if status != '200':
+                continue
+            sold_units += 1
+            for (article_id, quantity) in products_article_quantities.get(product_id, {}).items():
+                expected_stock[article_id] -= quantity
+        final_stock = ArticleRepository().get_articles_stock(article_ids)
+
+        status_counts: Dict[str, int] = {}
+        for (status, _) in responses:
+            status_counts[status] = status_counts.get(status, 0) + 1
+        latencies = sorted([latency * 1000 for (_, latency) in responses])
+
+        return SellLoadReport(
+            target=target,
+            concurrency=concurrency,
+            requests=requests,
+            seconds=seconds,
+            status_counts=status_counts,
+            p50_ms=percentile(latencies, 0.5),
+            p95_ms=percentile(latencies, 0.95),
+            p99_ms=percentile(latencies, 0.99),
+            lock_wait_seconds=lock_wait_timer.seconds,
+            locking_statements=lock_wait_timer.statement_count,
+            sold_units=sold_units,
+            stock_mismatches=[
+                (id, expected_stock[id], final_stock.get(id, 0))
+                for id in sorted(article_ids)
+                if expected_stock[id] != final_stock.get(id, 0)
+            ],
+            oversold_article_ids=sorted([id for (id, stock) in expected_stock.items() if stock < 0])
+        )
+
+    def _sell_with_client(self, product_ids: List[int], concurrency: int) -> List[Tuple[str, float]]:
+        # calls the whole Django stack (middlewares, view, ATOMIC_REQUESTS) in-process, without sockets. The client
+        # must not re-raise server errors: it listens to a global signal, so it would also re-raise the errors of the
+        # requests of other threads.
+        def sell(client: Client, product_id: int) -> Tuple[str, float]:
+            start = time.perf_counter()
+            response = client.post(reverse('sell-product', kwargs={ 'product_id': product_id }))
+            return (str(response.status_code), time.perf_counter() - start)
+
+        return run_in_threads(product_ids, concurrency, lambda: Client(raise_request_exception=False), sell)
+
+    def _sell_over_http(self, product_ids: List[int], concurrency: int) -> List[Tuple[str, float]]:
+        # starts the threaded test server used by LiveServerTestCase on a free port.
+        server = LiveServerThread('localhost', _StaticFilesHandler)
+        server.daemon = True
+        server.start()
+        server.is_ready.wait()
+        if server.error:
+            raise server.error
+
+        try:
+            base_url = f'http://localhost:{server.port}'
+            return run_in_threads(
+                product_ids,
+                concurrency,
+                lambda: None,
+                lambda _, product_id: send_request(
+                    base_url + reverse('sell-product', kwargs={ 'product_id': product_id }),
+                    'POST',
+                    30.0
+                )
+            )
+        finally:
+            server.terminate()
+
+
+def run_in_threads(
+    items: List[Any],
+    concurrency: int,
+    create_state: Callable[[], Any],
+    fn: Callable[[Any, Any], Tuple[str, float]]
+) -> List[Tuple[str, float]]:
+    # every worker thread takes the next item until none is left and closes its DB connections at the end.
+    results: List[Optional[Tuple[str, float]]] = [None] * len(items)
+    next_index = iter(range(len(items)))
+    index_lock = threading.Lock()
+
+    def work() -> None:
+        state = create_state()
+        try:
+            while True:
+                with index_lock:
+                    index = next(next_index, None)
+                if index is None:
+                    return
+                try:
+                    results[index] = fn(state, items[index])
+                except Exception as exception:
+                    results[index] = (type(exception).__name__, 0.0)
+        finally:
+            connections.close_all()
+
+    workers = [threading.Thread(target=work) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    return [result for result in results if result is not None]
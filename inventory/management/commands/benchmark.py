@@ -0,0 +1,58 @@
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.test.utils import setup_databases, teardown_databases
+
+from inventory.benchmarks import BenchmarkRunner, parse_scale
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the upload, availability and sell hot paths with synthetic catalogues in a test database.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--scales',
+            nargs='+',
+            default=['small', 'medium'],
+            help='Preset names (small, medium, large) or "<articles>x<products>", e.g. 5000x1000.'
+        )
+        parser.add_argument('--requirements-per-product', type=int, default=4)
+        parser.add_argument(
+            '--shared-article-ratio',
+            type=float,
+            default=0.3,
+            help='Share of the requirements using articles from a small pool common to most products.'
+        )
+        parser.add_argument('--sells', type=int, default=200, help='Number of sells of random products per scale.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-memory', action='store_true', help='Do not trace the memory, it slows down the run.')
+        parser.add_argument('--output', help='Path of the JSON file with the results.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            scales = [
+                parse_scale(value, options['requirements_per_product'], options['shared_article_ratio'])
+                for value in options['scales']
+            ]
+        except ValueError as exception:
+            raise CommandError(f'Invalid scale. {str(exception)}') from exception
+
+        runner = BenchmarkRunner(options['sells'], not options['skip_memory'], options['seed'])
+        # never touch the data of the configured DB, the benchmark uses its own test database.
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            for scale in scales:
+                self.stdout.write(f'Running scale {scale.name} ({scale.article_count} articles, {scale.product_count} products)')
+                runner.run_scale(scale)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        for result in runner.results:
+            memory = f'{result.peak_memory_bytes / 1024 / 1024:.1f}MB' if result.peak_memory_bytes is not None else '-'
+            self.stdout.write(
+                f'{result.scale:>10} {result.scenario:<26} {result.operations:>8} ops '
+                f'{result.seconds:>10.3f}s {result.queries:>7} queries {memory:>10}'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(runner.to_json())
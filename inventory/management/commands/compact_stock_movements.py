@@ -0,0 +1,30 @@
+import time
+from typing import Any
+from django.core.management.base import BaseCommand, CommandParser
+
+from inventory.business_logic import StockLedgerBusiness
+
+
+class Command(BaseCommand):
+    help = 'Fold the pending stock movements of the stock ledger into the articles stock.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=None,
+            help='Keep running and compact the new movements every given number of seconds.'
+        )
+        parser.add_argument('--batch-size', type=int, default=None, help='Articles whose movements are folded in every transaction.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        stock_ledger_business = StockLedgerBusiness()
+
+        while True:
+            compacted_count = stock_ledger_business.compact_movements(options['batch_size'])
+            if compacted_count > 0:
+                self.stdout.write(f'Compacted {compacted_count} stock movements')
+
+            if options['poll'] is None:
+                return
+            time.sleep(options['poll'])
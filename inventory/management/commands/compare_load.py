@@ -0,0 +1,57 @@
+import json
+from dataclasses import asdict
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from inventory.load_testing import run_http_load
+
+ENDPOINTS = {
+    'availability': ('GET', 'products/availability?limit=100'),
+    'sell': ('POST', 'products/{product_id}/sell'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Send the same concurrent load to the sync and the async version of an endpoint of a running server.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--sync-url',
+            default='http://localhost:8000/inventory/',
+            help='Inventory API root of the WSGI server, e.g. gunicorn with thread workers.'
+        )
+        parser.add_argument(
+            '--async-url',
+            default='http://localhost:8001/inventory/async/',
+            help='Async inventory API root of the ASGI server, e.g. uvicorn warehouse.asgi:application.'
+        )
+        parser.add_argument('--endpoint', choices=ENDPOINTS.keys(), default='availability')
+        parser.add_argument('--product-id', type=int, default=1, help='Product sold by the sell endpoint.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+        parser.add_argument('--requests', type=int, default=2000, help='Number of requests of every run.')
+        parser.add_argument('--output', help='Path of the JSON file with the results.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options['requests'] <= 0 or any(concurrency <= 0 for concurrency in options['concurrency']):
+            raise CommandError('--requests and --concurrency expect values greater than 0')
+
+        (method, path) = ENDPOINTS[options['endpoint']]
+        path = path.format(product_id=options['product_id'])
+        results = []
+        for concurrency in options['concurrency']:
+            for (name, root_url) in [('sync', options['sync_url']), ('async', options['async_url'])]:
+                result = run_http_load(name, root_url.rstrip('/') + '/' + path, method, concurrency, options['requests'])
+                results.append(result)
+                statuses = ','.join([f'{status}:{count}' for (status, count) in sorted(result.status_counts.items())])
+                self.stdout.write(
+                    f'{name:>6} {concurrency:>5} concurrent {result.requests_per_second:>9.1f} req/s '
+                    f'p50 {result.p50_ms:>8.1f}ms p95 {result.p95_ms:>8.1f}ms p99 {result.p99_ms:>8.1f}ms {statuses}'
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(
+                    [{ **asdict(result), 'requests_per_second': result.requests_per_second } for result in results],
+                    file,
+                    indent=2
+                )
@@ -0,0 +1,30 @@
+import time
+from typing import Any
+from django.core.management.base import BaseCommand, CommandParser
+
+from inventory.business_logic import ReservationBusiness
+
+
+class Command(BaseCommand):
+    help = 'Expire the reservations past their TTL and release the articles they hold.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=None,
+            help='Keep running and look for expired reservations every given number of seconds.'
+        )
+        parser.add_argument('--batch-size', type=int, default=None, help='Reservations released in every transaction.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        reservation_business = ReservationBusiness()
+
+        while True:
+            expired_count = reservation_business.expire_reservations(options['batch_size'])
+            if expired_count > 0:
+                self.stdout.write(f'Expired {expired_count} reservations')
+
+            if options['poll'] is None:
+                return
+            time.sleep(options['poll'])
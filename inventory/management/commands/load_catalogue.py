@@ -0,0 +1,44 @@
+from itertools import chain
+from typing import Any, Iterable, Iterator, List, IO, Callable
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from inventory.business_logic import CatalogueBulkLoadBusiness, BusinessValidationError
+from inventory.upload_parsers import ArticleUploadParser, ProductUploadParser, InvalidDataUploadError
+
+
+class Command(BaseCommand):
+    help = 'Bulk load articles and products files into the inventory, e.g. for initial catalogue loads.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--articles', help='Path of a JSON file with the same format as the articles upload.')
+        parser.add_argument('--products', help='Path of a JSON file with the same format as the products upload.')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Items parsed at once from the files.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options['articles'] is None and options['products'] is None:
+            raise CommandError('Expected at least one of --articles or --products.')
+
+        batch_size = options['batch_size']
+        articles = self._iter_file_items(options['articles'], ArticleUploadParser().parse_stream, batch_size)
+        products = self._iter_file_items(options['products'], ProductUploadParser().parse_stream, batch_size)
+        try:
+            (saved_articles_count, created_products_count) = CatalogueBulkLoadBusiness().load(articles, products)
+        except InvalidDataUploadError as exception:
+            raise CommandError('\n'.join(exception.errors)) from exception
+        except BusinessValidationError as exception:
+            raise CommandError(str(exception)) from exception
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved {saved_articles_count} articles and created {created_products_count} products.'
+        ))
+
+    def _iter_file_items(
+        self,
+        path: str,
+        parse_stream: Callable[[IO[bytes], int], Iterable[List[Any]]],
+        batch_size: int
+    ) -> Iterator[Any]:
+        if path is None:
+            return
+        with open(path, 'rb') as file:
+            yield from chain.from_iterable(parse_stream(file, batch_size))
@@ -0,0 +1,31 @@
+import time
+from typing import Any
+from django.core.management.base import BaseCommand, CommandParser
+
+from inventory.business_logic import UploadJobBusiness
+from inventory.upload_jobs import run_upload_job
+
+
+class Command(BaseCommand):
+    help = 'Run the pending upload jobs and resume the interrupted ones, e.g. the ones left behind by a restarted ' \
+        'web server.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=None,
+            help='Keep running and look for new pending jobs every given number of seconds.'
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        upload_job_business = UploadJobBusiness()
+
+        while True:
+            for job_id in upload_job_business.get_runnable_job_ids():
+                self.stdout.write(f'Running upload job {job_id}')
+                run_upload_job(job_id)
+
+            if options['poll'] is None:
+                return
+            time.sleep(options['poll'])
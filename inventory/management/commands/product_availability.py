@@ -0,0 +1,28 @@
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from inventory.business_logic import ProductBusiness
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the stored availability of the products.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('action', choices=['rebuild', 'verify'])
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Products compared per query when verifying.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        product_business = ProductBusiness()
+
+        if options['action'] == 'rebuild':
+            product_business.rebuild_products_availability()
+            self.stdout.write(self.style.SUCCESS('Products availability rebuilt.'))
+            return
+
+        mismatches = product_business.verify_products_availability(options['chunk_size'])
+        for (product_id, stored, computed) in mismatches:
+            self.stdout.write(f'product id={product_id}: stored={stored} computed={computed}')
+        if len(mismatches) > 0:
+            raise CommandError(f'{len(mismatches)} products have an outdated availability. Run the "rebuild" action.')
+
+        self.stdout.write(self.style.SUCCESS('Products availability is up to date.'))
@@ -0,0 +1,92 @@
+import json
+from dataclasses import asdict
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.test.utils import setup_databases, teardown_databases
+
+from inventory.benchmarks import CatalogueScale
+from inventory.load_testing import SellLoadHarness
+
+
+class Command(BaseCommand):
+    help = 'Sell products sharing articles from concurrent clients in a test database and check that no stock is lost.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--articles', type=int, default=200)
+        parser.add_argument('--products', type=int, default=100)
+        parser.add_argument('--requirements-per-product', type=int, default=4)
+        parser.add_argument(
+            '--shared-article-ratio',
+            type=float,
+            default=0.5,
+            help='Share of the requirements using articles from a small pool common to most products.'
+        )
+        parser.add_argument('--hot-products', type=int, default=10, help='Number of products receiving all the sells.')
+        parser.add_argument(
+            '--max-stock',
+            type=int,
+            default=2000,
+            help='Upper bound of the seeded article stock, lower it to also sell out articles during the run.'
+        )
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--requests', type=int, default=1000, help='Number of sells of every run.')
+        parser.add_argument(
+            '--target',
+            choices=['view', 'http'],
+            default='view',
+            help='Call the views in-process with the test client or send HTTP requests to a threaded test server.'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Path of the JSON file with the results.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options['requests'] <= 0 or options['hot_products'] <= 0 or any(concurrency <= 0 for concurrency in options['concurrency']):
+            raise CommandError('--requests, --hot-products and --concurrency expect values greater than 0')
+        if options['articles'] <= 0 or options['products'] <= 0 or options['max_stock'] < 0:
+            raise CommandError('--articles and --products expect values greater than 0 and --max-stock a positive value')
+
+        scale = CatalogueScale(
+            'load',
+            options['articles'],
+            options['products'],
+            options['requirements_per_product'],
+            options['shared_article_ratio']
+        )
+        reports = []
+        # never touch the data of the configured DB, every run seeds the catalogue again in a test database.
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            for concurrency in options['concurrency']:
+                harness = SellLoadHarness(scale, options['hot_products'], options['max_stock'], options['seed'])
+                report = harness.run(options['target'], concurrency, options['requests'])
+                reports.append(report)
+                statuses = ','.join([f'{status}:{count}' for (status, count) in sorted(report.status_counts.items())])
+                self.stdout.write(
+                    f'{report.target:>5} {concurrency:>5} concurrent {report.requests_per_second:>9.1f} req/s '
+                    f'p50 {report.p50_ms:>8.1f}ms p95 {report.p95_ms:>8.1f}ms p99 {report.p99_ms:>8.1f}ms '
+                    f'lock wait {report.lock_wait_seconds:>8.3f}s ({report.locking_statements} statements) '
+                    f'{report.sold_units} sold {statuses}'
+                )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(
+                    [{ **asdict(report), 'requests_per_second': report.requests_per_second } for report in reports],
+                    file,
+                    indent=2
+                )
+
+        failures = []
+        for report in reports:
+            for (article_id, expected_stock, final_stock) in report.stock_mismatches:
+                problem = 'lost update' if final_stock > expected_stock else 'unexpected stock decrement'
+                failures.append(
+                    f'{report.concurrency} concurrent: {problem} of article with id={article_id}, '
+                    f'expected stock {expected_stock}, final stock {final_stock}'
+                )
+            for article_id in report.oversold_article_ids:
+                failures.append(f'{report.concurrency} concurrent: article with id={article_id} was oversold')
+        if len(failures) > 0:
+            raise CommandError('\n'.join(failures))
@@ -0,0 +1,55 @@
+from argparse import ArgumentTypeError
+from typing import Any, Tuple
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from inventory.availability_engine import InventoryEngine
+
+
+def parse_article_stock(value: str) -> Tuple[int, int]:
+    try:
+        (article_id, stock) = value.split('=')
+        return (int(article_id), int(stock))
+    except ValueError as exception:
+        raise ArgumentTypeError(f'expected ART_ID=STOCK, found "{value}"') from exception
+
+
+class Command(BaseCommand):
+    help = 'Compute the availability of every product if some articles had another stock, e.g. "what could we ' \
+        'build if 500 screws arrived". Requires the "engine" extra.'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--stock',
+            type=parse_article_stock,
+            action='append',
+            default=[],
+            metavar='ART_ID=STOCK',
+            help='Hypothetical available stock of an article, can be repeated.'
+        )
+        parser.add_argument('--all', action='store_true', help='List every product, not only the changed ones.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            engine = InventoryEngine()
+        except ImproperlyConfigured as exception:
+            raise CommandError(str(exception)) from exception
+
+        engine.load()
+        current_availability = engine.compute_availability()
+        try:
+            what_if_availability = engine.compute_availability(dict(options['stock']))
+        except KeyError as exception:
+            raise CommandError(exception.args[0]) from exception
+
+        changed_count = 0
+        for (product_id, current, what_if) in zip(
+            engine.product_ids.tolist(),
+            current_availability.tolist(),
+            what_if_availability.tolist()
+        ):
+            changed_count += int(current != what_if)
+            if options['all'] or current != what_if:
+                self.stdout.write(f'product id={product_id}: availability={current} what-if={what_if}')
+
+        self.stdout.write(self.style.SUCCESS(f'{changed_count} products would change their availability.'))
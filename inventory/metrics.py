@@ -0,0 +1,165 @@
+import bisect
+import threading
+from time import perf_counter
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple, TypeVar
+
+T = TypeVar('T')
+
+DEFAULT_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+# Minimal in-process metrics in the Prometheus text exposition format. Every web process keeps its own values.
+class Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def _labels_key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Sequence[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if len(pairs) == 0:
+            return ''
+        return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for (name, value) in pairs) + '}'
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self) -> List[str]:
+        return [f'{self.name}{self._format_labels(key)} {value}' for (key, value) in self._values.items()]
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_SECONDS_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self._buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._labels_key(labels)
+        bucket_index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            (bucket_counts, sum_and_count) = self._values.setdefault(key, ([0] * len(self._buckets), [0.0, 0]))
+            if bucket_index < len(self._buckets):
+                bucket_counts[bucket_index] += 1
+            sum_and_count[0] += value
+            sum_and_count[1] += 1
+
+    def _render_samples(self) -> List[str]:
+        lines = []
+        for (key, (bucket_counts, (total, count))) in self._values.items():
+            cumulative_count = 0
+            for (bound, bucket_count) in zip(self._buckets, bucket_counts):
+                cumulative_count += bucket_count
+                lines.append(f'{self.name}_bucket{self._format_labels(key, [("le", str(bound))])} {cumulative_count}')
+            lines.append(f'{self.name}_bucket{self._format_labels(key, [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{self._format_labels(key)} {total}')
+            lines.append(f'{self.name}_count{self._format_labels(key)} {count}')
+        return lines
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+REQUEST_DURATION = Histogram(
+    'inventory_request_duration_seconds',
+    'Time spent handling a request, until the view returns.',
+    ['view', 'method', 'status']
+)
+REQUEST_SQL_QUERIES = Histogram(
+    'inventory_request_sql_queries',
+    'SQL queries executed by a sampled request.',
+    ['view'],
+    buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_DURATION = Histogram(
+    'inventory_request_db_duration_seconds',
+    'Time spent executing SQL queries by a sampled request.',
+    ['view']
+)
+SOLD_PRODUCTS = Counter('inventory_sold_products_total', 'Units of products sold.')
+SELL_REJECTIONS = Counter('inventory_sell_rejections_total', 'Sells rejected because the product is not available.')
+RESERVATIONS = Counter(
+    'inventory_reservations_total',
+    'Reservations by outcome (created, rejected, confirmed, released, expired).',
+    ['outcome']
+)
+UPLOADED_ROWS = Counter('inventory_uploaded_rows_total', 'Rows parsed from uploaded files.', ['kind'])
+UPLOAD_PARSE_DURATION = Histogram(
+    'inventory_upload_parse_seconds',
+    'Time spent parsing and validating uploaded files.',
+    ['kind']
+)
+
+REGISTRY: List[Metric] = [
+    REQUEST_DURATION,
+    REQUEST_SQL_QUERIES,
+    REQUEST_DB_DURATION,
+    SOLD_PRODUCTS,
+    SELL_REJECTIONS,
+    RESERVATIONS,
+    UPLOADED_ROWS,
+    UPLOAD_PARSE_DURATION,
+]
+
+
+def render_metrics() -> str:
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+def observe_upload_parse(kind: str, parse_fn: Any, *args: Any) -> Any:
+    start = perf_counter()
+    items = parse_fn(*args)
+    UPLOAD_PARSE_DURATION.observe(perf_counter() - start, kind=kind)
+    UPLOADED_ROWS.inc(len(items), kind=kind)
+    return items
+
+
+def observe_upload_batches(kind: str, batches: Iterable[List[T]]) -> Iterator[List[T]]:
+    # with streaming parsers only the time spent producing the batches is parsing time.
+    parse_seconds = 0.0
+    iterator = iter(batches)
+    while True:
+        start = perf_counter()
+        batch = next(iterator, None)
+        parse_seconds += perf_counter() - start
+        if batch is None:
+            break
+        UPLOADED_ROWS.inc(len(batch), kind=kind)
+        yield batch
+
+    UPLOAD_PARSE_DURATION.observe(parse_seconds, kind=kind)
@@ -0,0 +1,101 @@
+import asyncio
+import random
+from contextlib import ExitStack
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+
+from .db_routers import get_replica_databases, get_replica_pin_seconds, routing_scope
+from .metrics import REQUEST_DURATION, REQUEST_SQL_QUERIES, REQUEST_DB_DURATION
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class QueryTimer:
+    def __init__(self) -> None:
+        self.query_count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute: Callable, sql: str, params: Any, many: bool, context: Dict[str, Any]) -> Any:
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += perf_counter() - start
+            self.query_count += 1
+
+
+class RequestMetricsMiddleware:
+    # Records the latency of every request and, for a sample of them (INVENTORY_METRICS_SQL_SAMPLE_RATE),
+    # the number of SQL queries and the time spent in the DB.
+    # ReplicaPinningMiddleware is sync only, so under ASGI django adapts the whole chain and this runs synchronously
+    # in a worker thread too. The async views run their queries in the threads of the DB pool, whose connections are
+    # not wrapped by the request, so only their latency is recorded.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]) -> None:
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'INVENTORY_METRICS_SQL_SAMPLE_RATE', 0.1)
+        if asyncio.iscoroutinefunction(self.get_response):
+            # same marker used by django's MiddlewareMixin, so the handler awaits this instance.
+            self._is_coroutine = asyncio.coroutines._is_coroutine  # type: ignore
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        query_timer = QueryTimer() if random.random() < self.sample_rate else None
+        start = perf_counter()
+        with ExitStack() as stack:
+            if query_timer is not None:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(query_timer))
+            response = self.get_response(request)
+        seconds = perf_counter() - start
+        if is_async_view(request):
+            query_timer = None
+        self._observe(request, response, seconds, query_timer)
+
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        start = perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, perf_counter() - start, None)
+
+        return response
+
+    def _observe(self, request: HttpRequest, response: HttpResponse, seconds: float, query_timer: Optional[QueryTimer]) -> None:
+        view = request.resolver_match.url_name if request.resolver_match is not None else 'unresolved'
+        REQUEST_DURATION.observe(seconds, view=view, method=request.method, status=str(response.status_code))
+        if query_timer is not None:
+            REQUEST_SQL_QUERIES.observe(query_timer.query_count, view=view)
+            REQUEST_DB_DURATION.observe(query_timer.seconds, view=view)
+
+
+def is_async_view(request: HttpRequest) -> bool:
+    return request.resolver_match is not None and asyncio.iscoroutinefunction(request.resolver_match.func)
+
+
+class ReplicaPinningMiddleware:
+    # Read-your-writes for the replica reads: writes (and every request of a client that wrote less than
+    # INVENTORY_REPLICA_PIN_SECONDS ago) read from the primary. The client is recognized by a cookie set by its writes.
+    cookie_name = 'inventory_primary_pin'
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if len(get_replica_databases()) == 0:
+            return self.get_response(request)
+
+        pinned = request.method not in SAFE_METHODS or self.cookie_name in request.COOKIES
+        with routing_scope(pinned) as scope:
+            response = self.get_response(request)
+        if request.method not in SAFE_METHODS or (scope.pinned and self.cookie_name not in request.COOKIES):
+            response.set_cookie(self.cookie_name, '1', max_age=get_replica_pin_seconds(), httponly=True, samesite='Lax')
+
+        return response
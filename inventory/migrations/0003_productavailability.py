@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_auto_20210415_2227'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAvailability',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='inventory.product')),
+                ('availability', models.PositiveIntegerField(db_index=True)),
+            ],
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO inventory_productavailability (product_id, availability)
+                SELECT p.id, COALESCE(MIN(a.stock / r.quantity), 0)
+                FROM inventory_product p
+                LEFT OUTER JOIN inventory_productrequirement r ON r.product_id = p.id
+                LEFT OUTER JOIN inventory_article a ON a.id = r.article_id
+                GROUP BY p.id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
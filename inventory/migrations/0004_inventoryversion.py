@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_productavailability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(
+            sql='INSERT INTO inventory_inventoryversion (id, version) VALUES (1, 1)',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:43
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_inventoryversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('articles', 'Articles'), ('products', 'Products')], max_length=16)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('validating', 'Validating'), ('applying', 'Applying'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16)),
+                ('file', models.FileField(upload_to='upload_jobs/')),
+                ('total_count', models.PositiveIntegerField(null=True)),
+                ('processed_count', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('delta', models.IntegerField()),
+                ('kind', models.CharField(choices=[('sale', 'Sale'), ('adjustment', 'Adjustment')], max_length=16)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('compacted', 'Compacted'), ('superseded', 'Superseded')], default='pending', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('closed_at', models.DateTimeField(null=True)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movements', to='inventory.article')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['article'], name='inventory_movement_pending'),
+        ),
+    ]
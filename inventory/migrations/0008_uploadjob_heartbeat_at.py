@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_stockmovement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
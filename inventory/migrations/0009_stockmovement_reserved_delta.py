@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_uploadjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmovement',
+            name='reserved_delta',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='kind',
+            field=models.CharField(choices=[('sale', 'Sale'), ('adjustment', 'Adjustment'), ('reservation', 'Reservation'), ('release', 'Release')], max_length=16),
+        ),
+    ]
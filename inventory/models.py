@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.core.validators import MinValueValidator
 
@@ -5,6 +6,8 @@ class Article(models.Model):
     id = models.BigIntegerField(primary_key=True)
     name = models.CharField(max_length=128, null=False, unique=True)
     stock = models.PositiveIntegerField(null=False)
+    # units held by active reservations, they are part of the stock but can't be sold or reserved again.
+    reserved = models.PositiveIntegerField(null=False, default=0)
 
 class Product(models.Model):
     name = models.CharField(max_length=128, null=False, unique=True)
@@ -13,3 +16,98 @@ class ProductRequirement(models.Model):
     article = models.ForeignKey(Article, on_delete=models.PROTECT)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='requirements')
     quantity = models.PositiveIntegerField(null=False, validators=[MinValueValidator(1)])
+
+class ProductAvailability(models.Model):
+    # Materialized availability of a product, kept up to date whenever the stock of its articles changes.
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True)
+    availability = models.PositiveIntegerField(null=False, db_index=True)
+
+class InventoryVersion(models.Model):
+    # Single row counter increased after every change of the articles stock or the products.
+    version = models.BigIntegerField(null=False, default=0)
+
+class UploadJob(models.Model):
+    class Kind(models.TextChoices):
+        ARTICLES = 'articles'
+        PRODUCTS = 'products'
+
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        VALIDATING = 'validating'
+        APPLYING = 'applying'
+        SUCCEEDED = 'succeeded'
+        FAILED = 'failed'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=16, choices=Kind.choices, null=False)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING, db_index=True)
+    file = models.FileField(upload_to='upload_jobs/')
+    total_count = models.PositiveIntegerField(null=True)
+    processed_count = models.PositiveIntegerField(null=False, default=0)
+    errors = models.JSONField(null=False, default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    # set by the worker running the job after every batch, jobs not updated for a while were interrupted.
+    heartbeat_at = models.DateTimeField(null=True)
+
+class Reservation(models.Model):
+    # Hold of the articles needed for some units of a product until it is confirmed into a sale, released or expired.
+    class Status(models.TextChoices):
+        ACTIVE = 'active'
+        CONFIRMED = 'confirmed'
+        RELEASED = 'released'
+        EXPIRED = 'expired'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(null=False, validators=[MinValueValidator(1)])
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.ACTIVE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=False)
+
+    class Meta:
+        # the expiry sweep only reads active reservations, closed ones are left out of the index.
+        indexes = [
+            models.Index(
+                fields=['expires_at'],
+                condition=models.Q(status='active'),
+                name='inventory_reservation_expiry'
+            )
+        ]
+
+class ReservationHold(models.Model):
+    reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE, related_name='holds')
+    article = models.ForeignKey(Article, on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField(null=False)
+
+class StockMovement(models.Model):
+    # Change of the stock or the reserved units of an article appended by sells, adjustments and reservations when the
+    # stock ledger is enabled (INVENTORY_STOCK_LEDGER). Pending movements are folded into Article.stock and
+    # Article.reserved by the compactor and kept as an audit trail; article uploads overwrite the stock and close the
+    # pending movements of the uploaded articles.
+    class Kind(models.TextChoices):
+        SALE = 'sale'
+        ADJUSTMENT = 'adjustment'
+        RESERVATION = 'reservation'
+        RELEASE = 'release'
+
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        COMPACTED = 'compacted'
+        SUPERSEDED = 'superseded'
+
+    id = models.BigAutoField(primary_key=True)
+    article = models.ForeignKey(Article, on_delete=models.PROTECT, related_name='movements')
+    delta = models.IntegerField(null=False)
+    reserved_delta = models.IntegerField(null=False, default=0)
+    kind = models.CharField(max_length=16, choices=Kind.choices, null=False)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    closed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        # stock reads sum the pending movements of some articles, the compactor reads all the pending ones.
+        indexes = [
+            models.Index(fields=['article'], condition=models.Q(status='pending'), name='inventory_movement_pending'),
+        ]
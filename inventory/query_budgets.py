@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+from django.db import connection
+
+# Maximum number of SQL queries of every endpoint (by URL name) and of the repository methods reading many rows.
+# Budgets hold whatever the size of the catalogue and of the request, as long as it fits in a single batch
+# (INVENTORY_UPLOAD_BATCH_SIZE, INVENTORY_UPSERT_BATCH_SIZE, ...). Savepoints are not counted, their number depends on
+# the transaction the code runs in. The test suite checks every budget, raise one only together with the change that
+# needs the extra queries.
+QUERY_BUDGETS: Dict[str, int] = {
+    'products-availability': 2,
+    'sell-product': 4,
+    'upload-products': 7,
+    'reserve-product': 6,
+    'orders': 4,
+    'basket-feasibility': 2,
+    'reservation': 1,
+    'confirm-reservation': 5,
+    'release-reservation': 6,
+    'upload-articles': 6,
+    'articles-stock': 5,
+    'metrics': 0,
+    'upload-job': 1,
+    'ProductRepository.get_products_with_requirement_details': 2,
+    'ProductRepository.get_product_with_requirement_details': 2,
+    'ProductRepository.get_products_availability': 1,
+    'ProductRepository.get_products_requirement_article_quantities': 1,
+    'ProductAvailabilityRepository.refresh_for_articles': 1,
+    'ArticleRepository.get_articles_available_stock': 1,
+}
+
+SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryBudgetExceededError(Exception):
+    def __init__(self, name: str, budget: int, queries: List[str]) -> None:
+        self.name = name
+        self.budget = budget
+        self.queries = queries
+        listed_queries = '\n'.join([f'{index + 1}. {sql}' for (index, sql) in enumerate(queries)])
+        super().__init__(f'{name} executed {len(queries)} queries, its budget is {budget}:\n{listed_queries}')
+
+
+def get_query_budget(name: str) -> int:
+    if name not in QUERY_BUDGETS:
+        raise KeyError(f'no query budget declared for {name}')
+
+    return QUERY_BUDGETS[name]
+
+
+@contextmanager
+def capture_queries() -> Iterator[List[str]]:
+    # unlike django.test.utils.CaptureQueriesContext it doesn't need DEBUG, and it also sees the queries of
+    # streamed responses consumed inside the block.
+    queries: List[str] = []
+
+    def capture(execute: Callable, sql: str, params: Any, many: bool, context: Dict[str, Any]) -> Any:
+        if not sql.startswith(SAVEPOINT_STATEMENTS):
+            queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(capture):
+        yield queries
+
+
+@contextmanager
+def query_budget(name: str) -> Iterator[List[str]]:
+    # raises QueryBudgetExceededError when the block executes more queries than the budget declared for `name`.
+    budget = get_query_budget(name)
+    with capture_queries() as queries:
+        yield queries
+    if len(queries) > budget:
+        raise QueryBudgetExceededError(name, budget, queries)
@@ -0,0 +1,42 @@
+import json
+from dataclasses import fields, is_dataclass
+from typing import Any
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson leaves the datetimes to the encoder so they keep the format of the DRF responses ("Z" for UTC), and accepts
+# non string keys like the stdlib encoder.
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def dataclass_to_dict(obj: Any) -> dict:
+    # shallow conversion, nested data objects are converted by the encoder as it reaches them. Unlike
+    # dataclasses.asdict nothing is deep copied.
+    if not is_dataclass(obj):
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+    return { field.name: getattr(obj, field.name) for field in fields(obj) }
+
+
+class DataObjectJSONEncoder(JSONEncoder):
+    # the encoder of the DRF JSONRenderer (decimals, datetimes, uuids...) plus data objects.
+    def default(self, obj: Any) -> Any:
+        if is_dataclass(obj):
+            return dataclass_to_dict(obj)
+        return super().default(obj)
+
+
+def render_json(data: Any) -> bytes:
+    # same bytes as the DRF JSONRenderer, with compact separators and without escaping non ascii characters.
+    # orjson serializes data objects natively, without building intermediate dicts.
+    if orjson is not None:
+        body = orjson.dumps(data, default=DataObjectJSONEncoder().default, option=ORJSON_OPTIONS)
+    else:
+        body = json.dumps(data, cls=DataObjectJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    # the line and paragraph separators are valid JSON but not valid javascript, the DRF renderer escapes them too.
+    return body.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
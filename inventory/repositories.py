@@ -1,25 +1,67 @@
-from typing import List, Tuple, Iterable, Any
+import uuid
+from typing import List, Tuple, Iterable, Iterator, Any, Optional, Sequence, Type, Dict, IO
 from dataclasses import asdict
-from django.db import transaction
+from datetime import datetime
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction, connections, router, models
+from django.utils import timezone
+from django.db.models import F, Q, Case, When, Value, Min, Sum, QuerySet, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
 
-from .models import Article, ProductRequirement, Product
+from .db_routers import read_from_replica
+from .models import (
+    Article,
+    ProductRequirement,
+    Product,
+    ProductAvailability,
+    InventoryVersion,
+    UploadJob,
+    Reservation,
+    ReservationHold,
+    StockMovement
+)
 from .data_business_objects import (
     CreateProductDBO,
     CreateProductRequirementDBO,
     ArticleDBO,
     ProductDBO,
-    ProductRequirementDBO
+    ProductRequirementDBO,
+    ProductAvailabilityDBO,
+    UploadJobDBO,
+    ReservationDBO
 )
 
 class ArticleRepository:
+    def __init__(self) -> None:
+        self._stock_ledger_repository = StockLedgerRepository()
+
+    @read_from_replica
     def partition_ids_by_existence(self, article_ids: Iterable[int]) -> Tuple[List[int], List[int]]:
         queryset_existing_ids = Article.objects.filter(id__in=article_ids).values('id')
         existing_ids = list(map(lambda qs: qs['id'], queryset_existing_ids))
-        no_existing_ids = list(filter(lambda id: id not in existing_ids, article_ids))
+        existing_ids_set = set(existing_ids)
+        no_existing_ids = list(filter(lambda id: id not in existing_ids_set, article_ids))
 
         return (existing_ids, no_existing_ids)
 
-    def save_articles(self, articles: List[ArticleDBO]) -> None:
+    def save_articles(self, articles: List[ArticleDBO], batch_size: Optional[int] = None) -> None:
+        if is_stock_ledger_enabled():
+            # the uploaded stock replaces the pending movements of the articles.
+            self._stock_ledger_repository.supersede_pending_movements([article.id for article in articles])
+        if supports_native_upsert(Article):
+            # the reserved units of existing articles are kept, new articles start without reservations.
+            rows = [(article.id, article.name, article.stock, 0) for article in articles]
+            upsert_rows(
+                Article,
+                ['id', 'name', 'stock', 'reserved'],
+                rows,
+                'id',
+                batch_size or get_upsert_batch_size(),
+                ['name', 'stock']
+            )
+            return
+
         article_models = list(map(lambda article: Article(**asdict(article)),articles))
         article_ids = list(map(lambda article: article.id, articles))
         (existing_ids, no_existing_ids) = self.partition_ids_by_existence(article_ids)
@@ -30,24 +72,167 @@ class ArticleRepository:
             Article.objects.bulk_update(existing_articles, fields=['name', 'stock'])
             Article.objects.bulk_create(not_existing_articles)
 
-    def update_articles_stock(self, new_article_stocks: dict) -> None:
-        articles = [Article(id=id, stock=stock) for (id, stock) in new_article_stocks.items()]
-        Article.objects.bulk_update(articles, fields=['stock'])
+    def decrement_articles_stock(self, article_quantities: Dict[int, int]) -> bool:
+        if is_stock_ledger_enabled():
+            return len(self._stock_ledger_repository.append_movements(
+                { id: -quantity for (id, quantity) in article_quantities.items() },
+                StockMovement.Kind.SALE,
+                keep_reserved=True
+            )) == 0
+
+        # A single guarded UPDATE decrements every article, or none of them when any available stock is not enough.
+        quantity = self._article_quantity_case(article_quantities)
+        return self._update_articles_stock(
+            Article.objects.filter(id__in=article_quantities.keys(), stock__gte=F('reserved') + quantity),
+            len(article_quantities),
+            stock=F('stock') - quantity
+        )
+
+    def reserve_articles_stock(self, article_quantities: Dict[int, int]) -> bool:
+        if is_stock_ledger_enabled():
+            return self._stock_ledger_repository.reserve(article_quantities)
+
+        quantity = self._article_quantity_case(article_quantities)
+        return self._update_articles_stock(
+            Article.objects.filter(id__in=article_quantities.keys(), stock__gte=F('reserved') + quantity),
+            len(article_quantities),
+            reserved=F('reserved') + quantity
+        )
+
+    def consume_reserved_stock(self, article_quantities: Dict[int, int]) -> bool:
+        # the units are already held, only a stock lowered by an upload after the reservation can make it fail.
+        if is_stock_ledger_enabled():
+            return self._stock_ledger_repository.consume_reserved(article_quantities)
+
+        quantity = self._article_quantity_case(article_quantities)
+        return self._update_articles_stock(
+            Article.objects.filter(id__in=article_quantities.keys(), stock__gte=quantity, reserved__gte=quantity),
+            len(article_quantities),
+            stock=F('stock') - quantity,
+            reserved=F('reserved') - quantity
+        )
+
+    def release_reserved_stock(self, article_quantities: Dict[int, int]) -> None:
+        if is_stock_ledger_enabled():
+            self._stock_ledger_repository.release_reserved(article_quantities)
+            return
+
+        quantity = self._article_quantity_case(article_quantities)
+        Article.objects \
+            .filter(id__in=article_quantities.keys()) \
+            .update(reserved=Greatest(F('reserved') - quantity, Value(0)))
+
+    def apply_articles_stock_deltas(self, article_deltas: Dict[int, int], batch_size: int) -> Dict[int, int]:
+        # `stock = stock + delta` in UPDATEs of `batch_size` locked articles, all of them are applied or none when
+        # the stock of any article would become negative. Returns the stock of those articles, empty when applied.
+        if is_stock_ledger_enabled():
+            return self._stock_ledger_repository.append_movements(
+                article_deltas,
+                StockMovement.Kind.ADJUSTMENT,
+                keep_reserved=False
+            )
+
+        connection = connections[router.db_for_write(Article)]
+        # every article takes three query parameters, the backend may limit their number (e.g. SQLite).
+        batch_size = max(1, min(batch_size, connection.ops.bulk_batch_size(['id', 'id', 'delta'], list(article_deltas))))
+        items = list(article_deltas.items())
+        rejected_stock: Dict[int, int] = {}
+        with transaction.atomic():
+            for start in range(0, len(items), batch_size):
+                batch = dict(items[start:start + batch_size])
+                # the rows stay locked until the end of the transaction, the stock the deltas are checked against is
+                # the one they are added to.
+                articles_stock = dict(
+                    Article.objects
+                        .select_for_update()
+                        .filter(id__in=batch.keys())
+                        .order_by('id')
+                        .values_list('id', 'stock')
+                )
+                rejected_stock.update(
+                    (article_id, articles_stock.get(article_id, 0)) for (article_id, delta) in batch.items()
+                    if articles_stock.get(article_id, 0) + delta < 0
+                )
+                # the following batches are still checked, so every rejected article is reported.
+                if len(rejected_stock) == 0:
+                    delta = self._article_quantity_case(batch, models.IntegerField())
+                    Article.objects.filter(id__in=batch.keys()).update(stock=F('stock') + delta)
+            if len(rejected_stock) > 0:
+                transaction.set_rollback(True)
+
+        return rejected_stock
+
+    def get_articles_name_and_stock(self, article_ids: List[int], chunk_size: int) -> Dict[int, Tuple[str, int]]:
+        # the stored state uploads are compared with, the stock includes the pending ledger movements.
+        articles: Dict[int, Tuple[str, int]] = {}
+        for start in range(0, len(article_ids), chunk_size):
+            rows = Article.objects \
+                .filter(id__in=article_ids[start:start + chunk_size]) \
+                .annotate(current_stock=stock_expression()) \
+                .values_list('id', 'name', 'current_stock')
+            articles.update((id, (name, stock)) for (id, name, stock) in rows)
+
+        return articles
+
+    def get_articles_stock(self, article_ids: Iterable[int]) -> Dict[int, int]:
+        return dict(
+            Article.objects
+                .filter(id__in=article_ids)
+                .annotate(current_stock=stock_expression())
+                .values_list('id', 'current_stock')
+        )
+
+    def get_articles_available_stock(self, article_ids: Iterable[int]) -> Dict[int, int]:
+        return dict(
+            Article.objects
+                .filter(id__in=article_ids)
+                .annotate(available_stock=available_stock_expression())
+                .values_list('id', 'available_stock')
+        )
+
+    def iter_articles_available_stock(self, chunk_size: int = 10000) -> Iterator[Tuple[int, int]]:
+        return Article.objects \
+            .order_by('id') \
+            .annotate(available_stock=available_stock_expression()) \
+            .values_list('id', 'available_stock') \
+            .iterator(chunk_size=chunk_size)
+
+    def _article_quantity_case(
+        self,
+        article_quantities: Dict[int, int],
+        output_field: models.Field = models.PositiveIntegerField()
+    ) -> Case:
+        return Case(
+            *[When(id=id, then=Value(quantity)) for (id, quantity) in article_quantities.items()],
+            output_field=output_field
+        )
+
+    def _update_articles_stock(self, articles: QuerySet, expected_count: int, **updates: Any) -> bool:
+        with transaction.atomic():
+            updated_count = articles.update(**updates)
+            if updated_count != expected_count:
+                transaction.set_rollback(True)
+                return False
+
+        return True
 
 
 class ProductRepository:
+    @read_from_replica
     def partition_names_by_existence(self, product_names: Iterable[str]) -> Tuple[List[str], List[str]]:
         queryset_existing_names = Product.objects.filter(name__in=product_names).values('name')
         existing_names = list(map(lambda qs: qs['name'], queryset_existing_names))
-        no_existing_names = list(filter(lambda name: name not in existing_names, product_names))
+        existing_names_set = set(existing_names)
+        no_existing_names = list(filter(lambda name: name not in existing_names_set, product_names))
 
         return (existing_names, no_existing_names)
 
-    def create_products(self, products: List[CreateProductDBO]) -> None:
+    def create_products(self, products: List[CreateProductDBO]) -> List[int]:
         product_models = map(lambda p: Product(name=p.name), products)
 
         with transaction.atomic():
             created_product_models = Product.objects.bulk_create(product_models)
+            self._set_missing_product_ids(created_product_models)
             requirement_models = list(
                 map(
                     lambda zip_tuple: self._map_requirement(zip_tuple[0].requirements, zip_tuple[1]),
@@ -56,37 +241,119 @@ class ProductRepository:
             )
             ProductRequirement.objects.bulk_create(flat_list(requirement_models))
 
-    def get_products_with_requirement_details(self) -> List[ProductDBO]:
-        #TODO: implement pagination to reduce the size of the information in memory.
-        #fetch products with their requirements and articles in three queries.
-        products = Product.objects.all() \
-            .prefetch_related('requirements') \
-            .prefetch_related('requirements__article')
+        return [product.id for product in created_product_models]
+
+    def exists(self, product_id: int) -> bool:
+        return Product.objects.filter(id=product_id).exists()
+
+    @read_from_replica
+    def partition_ids_by_existence(self, product_ids: Iterable[int]) -> Tuple[List[int], List[int]]:
+        existing_ids = list(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        existing_ids_set = set(existing_ids)
+        no_existing_ids = list(filter(lambda id: id not in existing_ids_set, product_ids))
+
+        return (existing_ids, no_existing_ids)
+
+    def get_requirement_article_quantities(self, product_id: int) -> Dict[int, int]:
+        return self.get_products_requirement_article_quantities([product_id]).get(product_id, {})
+
+    def get_products_requirement_article_quantities(self, product_ids: Iterable[int]) -> Dict[int, Dict[int, int]]:
+        requirements = ProductRequirement.objects \
+            .filter(product_id__in=product_ids) \
+            .values_list('product_id', 'article_id', 'quantity')
+        products_article_quantities: Dict[int, Dict[int, int]] = {}
+        for (product_id, article_id, quantity) in requirements:
+            article_quantities = products_article_quantities.setdefault(product_id, {})
+            article_quantities[article_id] = article_quantities.get(article_id, 0) + quantity
+
+        return products_article_quantities
+
+    def iter_product_ids(self, chunk_size: int = 10000) -> Iterator[int]:
+        return Product.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size)
+
+    def iter_requirements(self, chunk_size: int = 10000) -> Iterator[Tuple[int, int, int]]:
+        return ProductRequirement.objects \
+            .order_by('product_id') \
+            .values_list('product_id', 'article_id', 'quantity') \
+            .iterator(chunk_size=chunk_size)
 
-        return list(map(self._product_with_requirements_to_dto, products))
+    @read_from_replica
+    def get_products_with_requirement_details(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[ProductDBO]:
+        #fetch a page of products (keyset pagination on the id) and their requirements joined with the articles.
+        products = Product.objects.order_by('id')
+        if after_id is not None:
+            products = products.filter(id__gt=after_id)
+        if limit is not None:
+            products = products[:limit]
+
+        return self._hydrate_products_with_requirements(list(products.values_list('id', 'name')))
+
+    @read_from_replica
+    def get_products_availability(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        min_availability: Optional[int] = None,
+        product_ids: Optional[Iterable[int]] = None
+    ) -> List[ProductAvailabilityDBO]:
+        products = computed_availability_queryset()
+        if after_id is not None:
+            products = products.filter(id__gt=after_id)
+        if product_ids is not None:
+            products = products.filter(id__in=product_ids)
+        if min_availability is not None:
+            products = products.filter(availability__gte=min_availability)
+        if limit is not None:
+            products = products[:limit]
+
+        return [
+            ProductAvailabilityDBO(id=id, name=name, availability=availability)
+            for (id, name, availability) in products.values_list('id', 'name', 'availability')
+        ]
 
+    @read_from_replica
     def get_product_with_requirement_details(self, product_id: int) -> ProductDBO:
-        product = Product.objects \
-            .prefetch_related('requirements') \
-            .prefetch_related('requirements__article') \
-            .get(id=product_id)
+        product = Product.objects.values_list('id', 'name').get(id=product_id)
 
-        return self._product_with_requirements_to_dto(product)
+        return self._hydrate_products_with_requirements([product])[0]
 
-    def _product_with_requirements_to_dto(self, product: Product) -> ProductDBO:
-        requirements_to_dto = lambda requirement: ProductRequirementDBO(
-            quantity=requirement.quantity,
-            article = ArticleDBO(
-                id=requirement.article.id,
-                name=requirement.article.name,
-                stock=requirement.article.stock
-            )
-        )
-        return ProductDBO(
-            id=product.id,
-            name=product.name,
-            requirements=list(map(requirements_to_dto, product.requirements.all()))
+    def _hydrate_products_with_requirements(self, products: List[Tuple[int, str]]) -> List[ProductDBO]:
+        # builds the data objects from plain rows instead of model instances. Requirements of different products
+        # using the same article share a single ArticleDBO.
+        requirements = ProductRequirement.objects \
+            .filter(product_id__in=[id for (id, _) in products]) \
+            .order_by('product_id', 'id') \
+            .values_list('product_id', 'quantity', 'article_id', 'article__name', 'article__stock')
+        articles: Dict[int, ArticleDBO] = {}
+        product_requirements: Dict[int, List[ProductRequirementDBO]] = {}
+        for (product_id, quantity, article_id, article_name, article_stock) in requirements:
+            article = articles.get(article_id)
+            if article is None:
+                article = articles[article_id] = ArticleDBO(id=article_id, name=article_name, stock=article_stock)
+            product_requirements.setdefault(product_id, []).append(ProductRequirementDBO(quantity=quantity, article=article))
+
+        return [
+            ProductDBO(id=id, name=name, requirements=product_requirements.get(id, []))
+            for (id, name) in products
+        ]
+
+    def _set_missing_product_ids(self, product_models: List[Product]) -> None:
+        # some backends (e.g. SQLite) don't return the ids of the rows created by `bulk_create`.
+        missing_id_models = [product for product in product_models if product.id is None]
+        if len(missing_id_models) == 0:
+            return
+
+        ids_by_name = dict(
+            Product.objects
+                .filter(name__in=[product.name for product in missing_id_models])
+                .values_list('name', 'id')
         )
+        for product in missing_id_models:
+            product.id = ids_by_name[product.name]
 
     def _map_requirement(
         self,
@@ -94,10 +361,695 @@ class ProductRepository:
         created_product: Product
     ) -> Iterable[ProductRequirement]:
         return map(
-          lambda requirement: ProductRequirement(**asdict(requirement), product=created_product),
+          lambda requirement: ProductRequirement(
+              article_id=requirement.article_id,
+              quantity=requirement.quantity,
+              product=created_product
+          ),
           product_requirements
         )
 
 
+class ProductAvailabilityRepository:
+    @read_from_replica
+    def get_products_availability(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        min_availability: Optional[int] = None,
+        product_ids: Optional[Iterable[int]] = None
+    ) -> List[ProductAvailabilityDBO]:
+        products_availability = ProductAvailability.objects.order_by('product_id')
+        if after_id is not None:
+            products_availability = products_availability.filter(product_id__gt=after_id)
+        if product_ids is not None:
+            products_availability = products_availability.filter(product_id__in=product_ids)
+        if min_availability is not None:
+            products_availability = products_availability.filter(availability__gte=min_availability)
+        if limit is not None:
+            products_availability = products_availability[:limit]
+
+        return [
+            ProductAvailabilityDBO(id=id, name=name, availability=availability)
+            for (id, name, availability)
+            in products_availability.values_list('product_id', 'product__name', 'availability')
+        ]
+
+    def get_stored_availability(self, product_ids: Iterable[int]) -> Dict[int, int]:
+        return dict(ProductAvailability.objects.filter(product_id__in=product_ids).values_list('product_id', 'availability'))
+
+    def refresh_for_articles(self, article_ids: Iterable[int]) -> None:
+        # reverse index from articles to the products depending on them, only those need to be recomputed.
+        # Only the products whose availability changes are written, a sell of a widely used article changes the
+        # availability of the few products it is the bottleneck of.
+        dependent_product_ids = ProductRequirement.objects \
+            .filter(article_id__in=list(article_ids)) \
+            .values('product_id')
+        changed_products = computed_availability_queryset() \
+            .filter(id__in=dependent_product_ids) \
+            .annotate(stored_availability=F('productavailability__availability')) \
+            .filter(Q(stored_availability__isnull=True) | ~Q(availability=F('stored_availability')))
+        self._upsert_computed_availability(changed_products)
+
+    def refresh_for_products(self, product_ids: Iterable[int]) -> None:
+        self._upsert_computed_availability(computed_availability_queryset().filter(id__in=list(product_ids)))
+
+    def rebuild(self) -> None:
+        with transaction.atomic():
+            ProductAvailability.objects.all().delete()
+            self._insert_computed_availability(computed_availability_queryset(), '')
+
+    def _upsert_computed_availability(self, products: QuerySet) -> None:
+        # the products queryset always has a WHERE clause, which avoids the SQLite upsert parsing ambiguity.
+        self._insert_computed_availability(
+            products,
+            'ON CONFLICT (product_id) DO UPDATE SET availability = EXCLUDED.availability'
+        )
+
+    def _insert_computed_availability(self, products: QuerySet, conflict_clause: str) -> None:
+        connection = connections[router.db_for_write(ProductAvailability)]
+        quote_name = connection.ops.quote_name
+        (select_sql, params) = products.values_list('id', 'availability').query.sql_with_params()
+        sql = f'INSERT INTO {quote_name(ProductAvailability._meta.db_table)} (product_id, availability) ' \
+            f'{select_sql} {conflict_clause}'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+class InventoryVersionRepository:
+    VERSION_ID = 1
+
+    @read_from_replica
+    def get_version(self) -> int:
+        version = InventoryVersion.objects.filter(id=self.VERSION_ID).values_list('version', flat=True).first()
+        return version or 0
+
+    def bump_version(self) -> None:
+        updated_count = InventoryVersion.objects \
+            .filter(id=self.VERSION_ID) \
+            .update(version=F('version') + 1)
+        if updated_count == 0:
+            InventoryVersion.objects.get_or_create(id=self.VERSION_ID, defaults={ 'version': 1 })
+
+    def bump_and_get_version(self) -> int:
+        # the version set by this bump, the updated row stays locked until it is read back.
+        with transaction.atomic():
+            self.bump_version()
+            return InventoryVersion.objects.values_list('version', flat=True).get(id=self.VERSION_ID)
+
+
+class UploadJobRepository:
+    def create_job(self, kind: str, file: File) -> UploadJobDBO:
+        job = UploadJob.objects.create(kind=kind, file=file)
+        return self._job_to_dto(job)
+
+    def get_job(self, job_id: str) -> UploadJobDBO:
+        return self._job_to_dto(UploadJob.objects.get(id=job_id))
+
+    def get_runnable_job_ids(self, stale_before: datetime) -> List[str]:
+        # pending jobs and jobs interrupted while validating or applying (e.g. by a restart of the web server).
+        return list(map(str, UploadJob.objects \
+            .filter(
+                Q(status=UploadJob.Status.PENDING) |
+                Q(status__in=[UploadJob.Status.VALIDATING, UploadJob.Status.APPLYING], heartbeat_at__lt=stale_before)
+            ) \
+            .order_by('created_at') \
+            .values_list('id', flat=True)))
+
+    def claim_job(self, job_id: str) -> bool:
+        # the conditional update guarantees that a single worker runs each job.
+        now = timezone.now()
+        updated_count = UploadJob.objects \
+            .filter(id=job_id, status=UploadJob.Status.PENDING) \
+            .update(status=UploadJob.Status.VALIDATING, started_at=now, heartbeat_at=now)
+        return updated_count == 1
+
+    def claim_stale_job(self, job_id: str, stale_before: datetime) -> bool:
+        # the job keeps its status: interrupted validations start again, interrupted jobs resume after their last
+        # applied batch.
+        updated_count = UploadJob.objects \
+            .filter(
+                id=job_id,
+                status__in=[UploadJob.Status.VALIDATING, UploadJob.Status.APPLYING],
+                heartbeat_at__lt=stale_before
+            ) \
+            .update(heartbeat_at=timezone.now())
+        return updated_count == 1
+
+    def open_job_file(self, job_id: str) -> IO[bytes]:
+        job = UploadJob.objects.get(id=job_id)
+        job.file.open('rb')
+        return job.file
+
+    def touch_job(self, job_id: str) -> None:
+        UploadJob.objects.filter(id=job_id).update(heartbeat_at=timezone.now())
+
+    def set_job_total_count(self, job_id: str, total_count: int) -> None:
+        UploadJob.objects \
+            .filter(id=job_id) \
+            .update(status=UploadJob.Status.APPLYING, total_count=total_count, heartbeat_at=timezone.now())
+
+    def set_job_processed_count(self, job_id: str, processed_count: int) -> None:
+        UploadJob.objects.filter(id=job_id).update(processed_count=processed_count, heartbeat_at=timezone.now())
+
+    def finish_job(self, job_id: str, errors: List[str]) -> None:
+        job = UploadJob.objects.get(id=job_id)
+        job.status = UploadJob.Status.FAILED if len(errors) > 0 else UploadJob.Status.SUCCEEDED
+        job.errors = errors
+        job.finished_at = timezone.now()
+        job.file.delete(save=False)
+        job.save(update_fields=['status', 'errors', 'finished_at', 'file'])
+
+    def _job_to_dto(self, job: UploadJob) -> UploadJobDBO:
+        return UploadJobDBO(
+            id=str(job.id),
+            kind=job.kind,
+            status=job.status,
+            total_count=job.total_count,
+            processed_count=job.processed_count,
+            errors=job.errors,
+            created_at=job.created_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at
+        )
+
+
+class StockLedgerRepository:
+    # Stock changes appended as movement rows instead of updating the article rows (INVENTORY_STOCK_LEDGER). The stock
+    # of an article is `Article.stock` plus its pending movements, until the compactor folds them into `Article.stock`.
+    # First key of the advisory locks of the articles ('WARE' in ASCII).
+    ARTICLE_LOCK_NAMESPACE = 0x57415245
+
+    def append_movements(self, article_deltas: Dict[int, int], kind: str, keep_reserved: bool) -> Dict[int, int]:
+        # decreases are only appended when the stock of every article stays positive, or above its reserved units
+        # with `keep_reserved`. Returns the stock of the articles without enough of it, empty when appended.
+        with transaction.atomic():
+            decreases = { id: -delta for (id, delta) in article_deltas.items() if delta < 0 }
+            rejected_stock = self.get_insufficient_stock(decreases, keep_reserved) if len(decreases) > 0 else {}
+            if len(rejected_stock) > 0:
+                return rejected_stock
+            StockMovement.objects.bulk_create([
+                StockMovement(article_id=article_id, delta=delta, kind=kind)
+                for (article_id, delta) in article_deltas.items()
+            ])
+
+        return {}
+
+    def reserve(self, article_quantities: Dict[int, int]) -> bool:
+        # the reserved units are appended as movements too, reservations don't write the article rows either.
+        with transaction.atomic():
+            if len(self.get_insufficient_stock(article_quantities, keep_reserved=True)) > 0:
+                return False
+            self._create_movements(article_quantities, StockMovement.Kind.RESERVATION, stock_sign=0, reserved_sign=1)
+
+        return True
+
+    def consume_reserved(self, article_quantities: Dict[int, int]) -> bool:
+        with transaction.atomic():
+            self._lock_articles(article_quantities.keys())
+            articles = self._get_stock_and_reserved(article_quantities.keys())
+            if any(
+                min(articles.get(article_id, (0, 0))) < quantity
+                for (article_id, quantity) in article_quantities.items()
+            ):
+                return False
+            self._create_movements(article_quantities, StockMovement.Kind.SALE, stock_sign=-1, reserved_sign=-1)
+
+        return True
+
+    def release_reserved(self, article_quantities: Dict[int, int]) -> None:
+        # like the updates without the ledger, the reserved units don't go below zero after an upload.
+        with transaction.atomic():
+            self._lock_articles(article_quantities.keys())
+            articles = self._get_stock_and_reserved(article_quantities.keys())
+            released_quantities = {
+                article_id: min(quantity, articles.get(article_id, (0, 0))[1])
+                for (article_id, quantity) in article_quantities.items()
+            }
+            self._create_movements(
+                { id: quantity for (id, quantity) in released_quantities.items() if quantity > 0 },
+                StockMovement.Kind.RELEASE,
+                stock_sign=0,
+                reserved_sign=-1
+            )
+
+    def has_enough_stock(self, article_quantities: Dict[int, int], keep_reserved: bool) -> bool:
+        return len(self.get_insufficient_stock(article_quantities, keep_reserved)) == 0
+
+    def get_insufficient_stock(self, article_quantities: Dict[int, int], keep_reserved: bool) -> Dict[int, int]:
+        # the articles stay locked until the end of the transaction, so the movements appended by concurrent
+        # transactions can't use the same stock.
+        self._lock_articles(article_quantities.keys())
+        available_stock = available_stock_expression() if keep_reserved else stock_expression()
+        articles_stock = dict(
+            Article.objects
+                .filter(id__in=article_quantities.keys())
+                .annotate(ledger_stock=available_stock)
+                .values_list('id', 'ledger_stock')
+        )
+
+        return {
+            article_id: articles_stock.get(article_id, 0) for (article_id, quantity) in article_quantities.items()
+            if articles_stock.get(article_id, 0) < quantity
+        }
+
+    def supersede_pending_movements(self, article_ids: List[int]) -> None:
+        # uploads only replace the stock, the pending reserved units are folded into the articles first.
+        with transaction.atomic():
+            self._lock_articles(article_ids)
+            Article.objects \
+                .filter(id__in=article_ids, movements__status=StockMovement.Status.PENDING) \
+                .update(reserved=reserved_expression())
+            StockMovement.objects \
+                .filter(article_id__in=article_ids, status=StockMovement.Status.PENDING) \
+                .update(status=StockMovement.Status.SUPERSEDED, closed_at=timezone.now())
+
+    def compact_movements(self, limit: int) -> Tuple[List[int], int]:
+        # folds every pending movement of a batch of articles into their stock, in id order. A partial batch could
+        # fold the sales of an article without the earlier adjustment they relied on and take its stock below zero.
+        # The stock plus the pending movements doesn't change, neither does the availability. The article locks keep
+        # the sells and uploads of these articles waiting until the end of the transaction. Returns the compacted
+        # articles and the number of folded movements.
+        with transaction.atomic():
+            article_ids = list(
+                StockMovement.objects
+                    .filter(status=StockMovement.Status.PENDING)
+                    .order_by('article_id')
+                    .values_list('article_id', flat=True)
+                    .distinct()[:limit]
+            )
+            if len(article_ids) == 0:
+                return ([], 0)
+            self._lock_articles(article_ids)
+            movements = list(
+                StockMovement.objects
+                    .filter(article_id__in=article_ids, status=StockMovement.Status.PENDING)
+                    .order_by('id')
+                    .values_list('id', 'article_id', 'delta', 'reserved_delta')
+            )
+            article_deltas: Dict[int, Tuple[int, int]] = {}
+            for (_, article_id, delta, reserved_delta) in movements:
+                (stock_total, reserved_total) = article_deltas.get(article_id, (0, 0))
+                article_deltas[article_id] = (stock_total + delta, reserved_total + reserved_delta)
+            stock_delta = Case(
+                *[When(id=id, then=Value(delta)) for (id, (delta, _)) in article_deltas.items()],
+                output_field=models.IntegerField()
+            )
+            reserved_delta = Case(
+                *[When(id=id, then=Value(delta)) for (id, (_, delta)) in article_deltas.items()],
+                output_field=models.IntegerField()
+            )
+            Article.objects \
+                .filter(id__in=article_deltas.keys()) \
+                .update(stock=F('stock') + stock_delta, reserved=F('reserved') + reserved_delta)
+            StockMovement.objects \
+                .filter(id__in=[id for (id, _, _, _) in movements]) \
+                .update(status=StockMovement.Status.COMPACTED, closed_at=timezone.now())
+
+        return (article_ids, len(movements))
+
+    def _get_stock_and_reserved(self, article_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+        articles = Article.objects \
+            .filter(id__in=article_ids) \
+            .annotate(ledger_stock=stock_expression(), ledger_reserved=reserved_expression()) \
+            .values_list('id', 'ledger_stock', 'ledger_reserved')
+        return { id: (stock, reserved) for (id, stock, reserved) in articles }
+
+    def _create_movements(self, article_quantities: Dict[int, int], kind: str, stock_sign: int, reserved_sign: int) -> None:
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                article_id=article_id,
+                delta=stock_sign * quantity,
+                reserved_delta=reserved_sign * quantity,
+                kind=kind
+            )
+            for (article_id, quantity) in article_quantities.items()
+        ])
+
+    def _lock_articles(self, article_ids: Iterable[int]) -> None:
+        # PostgreSQL advisory locks don't write the hot article rows, SQLite serializes the write transactions.
+        # The two-key locks live in their own namespace, apart from the single-key locks of other applications on the
+        # same database. The ids are hashed into the int4 second key, colliding articles only share their lock.
+        article_ids = sorted(article_ids)
+        connection = connections[router.db_for_write(StockMovement)]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(%s, hashint8(id)) '
+                    'FROM (SELECT unnest(%s::bigint[]) AS id ORDER BY id) AS ids',
+                    [self.ARTICLE_LOCK_NAMESPACE, article_ids]
+                )
+        elif connection.features.has_select_for_update:
+            list(Article.objects.select_for_update().filter(id__in=article_ids).order_by('id').values_list('id'))
+
+
+class ReservationRepository:
+    def create_reservation(
+        self,
+        product_id: int,
+        quantity: int,
+        expires_at: datetime,
+        article_quantities: Dict[int, int]
+    ) -> ReservationDBO:
+        with transaction.atomic():
+            reservation = Reservation.objects.create(product_id=product_id, quantity=quantity, expires_at=expires_at)
+            ReservationHold.objects.bulk_create([
+                ReservationHold(reservation=reservation, article_id=article_id, quantity=article_quantity)
+                for (article_id, article_quantity) in article_quantities.items()
+            ])
+
+        return self._reservation_to_dto(reservation)
+
+    def get_reservation(self, reservation_id: str) -> ReservationDBO:
+        return self._reservation_to_dto(Reservation.objects.get(id=reservation_id))
+
+    def confirm_reservation(self, reservation_id: str, confirmed_at: datetime) -> bool:
+        return self._close_reservation(reservation_id, Reservation.Status.CONFIRMED, confirmed_at)
+
+    def release_reservation(self, reservation_id: str) -> bool:
+        return self._close_reservation(reservation_id, Reservation.Status.RELEASED)
+
+    def expire_reservations(self, expired_at: datetime, limit: int) -> List[str]:
+        # walks the partial index on the expiry of the active reservations. Rows locked by a confirmation or another
+        # sweep are skipped (where the DB supports it), so concurrent sweeps don't wait for each other.
+        with transaction.atomic():
+            reservation_ids = list(
+                Reservation.objects
+                    .select_for_update(skip_locked=True)
+                    .filter(status=Reservation.Status.ACTIVE, expires_at__lte=expired_at)
+                    .order_by('expires_at')
+                    .values_list('id', flat=True)[:limit]
+            )
+            return self._expire_active_reservations(reservation_ids)
+
+    def get_held_article_quantities(self, reservation_ids: Iterable[str]) -> Dict[int, int]:
+        return dict(
+            ReservationHold.objects
+                .filter(reservation_id__in=list(reservation_ids))
+                .values('article_id')
+                .annotate(total_quantity=Sum('quantity'))
+                .values_list('article_id', 'total_quantity')
+        )
+
+    def _close_reservation(self, reservation_id: str, status: str, active_at: Optional[datetime] = None) -> bool:
+        # the conditional update guarantees that a reservation is closed once, e.g. not confirmed and expired.
+        reservations = Reservation.objects.filter(id=reservation_id, status=Reservation.Status.ACTIVE)
+        if active_at is not None:
+            reservations = reservations.filter(expires_at__gt=active_at)
+        return reservations.update(status=status) == 1
+
+    def _expire_active_reservations(self, reservation_ids: List[uuid.UUID]) -> List[str]:
+        # returns only the reservations this UPDATE expired: without row locks (e.g. SQLite) a selected reservation
+        # may have been confirmed, released or expired by another sweep since, its held stock is not released again.
+        connection = connections[router.db_for_write(Reservation)]
+        if connection.vendor == 'postgresql':
+            if len(reservation_ids) == 0:
+                return []
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {Reservation._meta.db_table} SET status = %s WHERE id = ANY(%s) AND status = %s RETURNING id',
+                    [Reservation.Status.EXPIRED, reservation_ids, Reservation.Status.ACTIVE]
+                )
+                return [str(row[0]) for row in cursor.fetchall()]
+
+        return [
+            str(id) for id in reservation_ids
+            if self._close_reservation(str(id), Reservation.Status.EXPIRED)
+        ]
+
+    def _reservation_to_dto(self, reservation: Reservation) -> ReservationDBO:
+        return ReservationDBO(
+            id=str(reservation.id),
+            product_id=reservation.product_id,
+            quantity=reservation.quantity,
+            status=reservation.status,
+            created_at=reservation.created_at,
+            expires_at=reservation.expires_at
+        )
+
+
+class CatalogueBulkLoadRepository:
+    # Loads big catalogues by streaming the rows into temporary staging tables (COPY on PostgreSQL, batched inserts
+    # on other backends) and merging them into the inventory tables with set-based statements.
+    STAGING_ARTICLE_TABLE = 'inventory_staging_article'
+    STAGING_REQUIREMENT_TABLE = 'inventory_staging_requirement'
+
+    def create_staging_tables(self) -> None:
+        with self._cursor() as cursor:
+            self._drop_staging_tables(cursor)
+            # the position keeps the file order, the last row of a repeated article wins like in the uploads.
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {self.STAGING_ARTICLE_TABLE} '
+                '(position bigint NOT NULL, id bigint NOT NULL, name varchar(128) NOT NULL, stock integer NOT NULL)'
+            )
+            # products without requirements are staged with a NULL article. The position keeps the file order.
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {self.STAGING_REQUIREMENT_TABLE} '
+                '(position bigint NOT NULL, product_name varchar(128) NOT NULL, article_id bigint, quantity integer)'
+            )
+
+    def drop_staging_tables(self) -> None:
+        with self._cursor() as cursor:
+            self._drop_staging_tables(cursor)
+
+    def stage_articles(self, articles: Iterable[ArticleDBO]) -> int:
+        rows = ((position, article.id, article.name, article.stock) for (position, article) in enumerate(articles))
+        return self._stage_rows(self.STAGING_ARTICLE_TABLE, ['position', 'id', 'name', 'stock'], rows)
+
+    def stage_products(self, products: Iterable[CreateProductDBO]) -> int:
+        rows = self._product_requirement_rows(products)
+        return self._stage_rows(self.STAGING_REQUIREMENT_TABLE, ['position', 'product_name', 'article_id', 'quantity'], rows)
+
+    def get_staged_missing_article_ids(self) -> List[int]:
+        return self._fetch_column(
+            f'SELECT DISTINCT r.article_id FROM {self.STAGING_REQUIREMENT_TABLE} r '
+            f'LEFT OUTER JOIN {Article._meta.db_table} a ON a.id = r.article_id '
+            'WHERE r.article_id IS NOT NULL AND a.id IS NULL ORDER BY r.article_id'
+        )
+
+    def get_staged_conflicting_product_names(self) -> List[str]:
+        # names of products that already exist or that appear more than once in the staged products.
+        return self._fetch_column(
+            f'SELECT r.product_name FROM {self.STAGING_REQUIREMENT_TABLE} r '
+            f'LEFT OUTER JOIN {Product._meta.db_table} p ON p.name = r.product_name '
+            'GROUP BY r.product_name '
+            'HAVING COUNT(DISTINCT r.position) > 1 OR COUNT(p.id) > 0 '
+            'ORDER BY r.product_name'
+        )
+
+    def merge_articles(self) -> int:
+        with self._cursor() as cursor:
+            # an upsert cannot affect the same row twice, only the last staged row of each article is merged.
+            # The WHERE clause also avoids the SQLite upsert parsing ambiguity.
+            cursor.execute(
+                f'INSERT INTO {Article._meta.db_table} (id, name, stock, reserved) '
+                f'SELECT id, name, stock, 0 FROM {self.STAGING_ARTICLE_TABLE} '
+                f'WHERE position IN (SELECT MAX(position) FROM {self.STAGING_ARTICLE_TABLE} GROUP BY id) '
+                'ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, stock = EXCLUDED.stock'
+            )
+            saved_count = cursor.rowcount
+            # the loaded stock replaces the pending movements of the stock ledger, their reserved units are kept.
+            cursor.execute(
+                f'UPDATE {Article._meta.db_table} SET reserved = reserved + ('
+                f'SELECT COALESCE(SUM(m.reserved_delta), 0) FROM {StockMovement._meta.db_table} m '
+                f'WHERE m.article_id = {Article._meta.db_table}.id AND m.status = %s) '
+                f'WHERE id IN (SELECT id FROM {self.STAGING_ARTICLE_TABLE})',
+                [StockMovement.Status.PENDING]
+            )
+            cursor.execute(
+                f'UPDATE {StockMovement._meta.db_table} SET status = %s, closed_at = %s '
+                f'WHERE status = %s AND article_id IN (SELECT id FROM {self.STAGING_ARTICLE_TABLE})',
+                [StockMovement.Status.SUPERSEDED, timezone.now(), StockMovement.Status.PENDING]
+            )
+            return saved_count
+
+    def merge_products(self) -> int:
+        with self._cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {Product._meta.db_table} (name) '
+                f'SELECT product_name FROM {self.STAGING_REQUIREMENT_TABLE} '
+                'GROUP BY product_name ORDER BY MIN(position)'
+            )
+            created_count = cursor.rowcount
+            cursor.execute(
+                f'INSERT INTO {ProductRequirement._meta.db_table} (product_id, article_id, quantity) '
+                f'SELECT p.id, r.article_id, r.quantity FROM {self.STAGING_REQUIREMENT_TABLE} r '
+                f'INNER JOIN {Product._meta.db_table} p ON p.name = r.product_name '
+                'WHERE r.article_id IS NOT NULL'
+            )
+            return created_count
+
+    def _product_requirement_rows(self, products: Iterable[CreateProductDBO]) -> Iterator[Tuple[Any, ...]]:
+        for (position, product) in enumerate(products):
+            if len(product.requirements) == 0:
+                yield (position, product.name, None, None)
+            for requirement in product.requirements:
+                yield (position, product.name, requirement.article_id, requirement.quantity)
+
+    def _stage_rows(self, table: str, columns: List[str], rows: Iterable[Sequence[Any]]) -> int:
+        connection = self._connection()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                reader = CopyRowsReader(rows)
+                cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN', reader)
+                return reader.row_count
+
+            row_count = 0
+            sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))})'
+            for batch in iter_batches(rows, get_upsert_batch_size()):
+                cursor.executemany(sql, batch)
+                row_count += len(batch)
+            return row_count
+
+    def _fetch_column(self, sql: str) -> List[Any]:
+        with self._cursor() as cursor:
+            cursor.execute(sql)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _drop_staging_tables(self, cursor: Any) -> None:
+        cursor.execute(f'DROP TABLE IF EXISTS {self.STAGING_ARTICLE_TABLE}')
+        cursor.execute(f'DROP TABLE IF EXISTS {self.STAGING_REQUIREMENT_TABLE}')
+
+    def _cursor(self) -> Any:
+        return self._connection().cursor()
+
+    def _connection(self) -> Any:
+        return connections[router.db_for_write(Article)]
+
+
+class CopyRowsReader:
+    # File-like object producing the COPY text format of the rows on demand, so they are never all in memory.
+    def __init__(self, rows: Iterable[Sequence[Any]]) -> None:
+        self._rows = iter(rows)
+        self._buffer = ''
+        self.row_count = 0
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._buffer += '\t'.join(map(copy_text_value, row)) + '\n'
+            self.row_count += 1
+
+        if size < 0:
+            size = len(self._buffer)
+        (data, self._buffer) = (self._buffer[:size], self._buffer[size:])
+        return data
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+
+def copy_text_value(value: Any) -> str:
+    if value is None:
+        return '\\N'
+    return str(value) \
+        .replace('\\', '\\\\') \
+        .replace('\t', '\\t') \
+        .replace('\n', '\\n') \
+        .replace('\r', '\\r')
+
+
+def iter_batches(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if len(batch) > 0:
+        yield batch
+
+
+def computed_availability_queryset() -> QuerySet:
+    # the availability of each product is the minimum of `available stock / quantity` (integer division) of its
+    # requirements, computed by the DB in a single aggregate query. Products without requirements have no availability.
+    return Product.objects.order_by('id').annotate(
+        availability=Coalesce(
+            Min(available_stock_expression('requirements__article__') / F('requirements__quantity')),
+            0
+        )
+    )
+
+
+def stock_expression(article_prefix: str = '') -> Any:
+    return _ledger_expression(article_prefix, 'stock', 'delta')
+
+
+def reserved_expression(article_prefix: str = '') -> Any:
+    return _ledger_expression(article_prefix, 'reserved', 'reserved_delta')
+
+
+def available_stock_expression(article_prefix: str = '') -> Greatest:
+    # an upload can set the stock of an article below its reserved units.
+    return Greatest(stock_expression(article_prefix) - reserved_expression(article_prefix), Value(0))
+
+
+def _ledger_expression(article_prefix: str, article_field: str, movement_field: str) -> Any:
+    # with the stock ledger, the stored value of an article plus the sum of its pending movements.
+    value = F(f'{article_prefix}{article_field}')
+    if not is_stock_ledger_enabled():
+        return value
+
+    pending_movements = StockMovement.objects \
+        .filter(article_id=OuterRef(f'{article_prefix}id'), status=StockMovement.Status.PENDING) \
+        .order_by() \
+        .values('article_id') \
+        .annotate(total_delta=Sum(movement_field)) \
+        .values('total_delta')
+    return value + Coalesce(Subquery(pending_movements, output_field=models.IntegerField()), Value(0))
+
+
+def is_stock_ledger_enabled() -> bool:
+    return getattr(settings, 'INVENTORY_STOCK_LEDGER', False)
+
+
 def flat_list(list_groups: Iterable[Iterable[Any]]) -> Iterable[Any]:
     return [item for group in list_groups for item in group]
+
+
+def get_upsert_batch_size() -> int:
+    return getattr(settings, 'INVENTORY_UPSERT_BATCH_SIZE', 5000)
+
+
+def supports_native_upsert(model: Type[models.Model]) -> bool:
+    # PostgreSQL and SQLite (>= 3.24) share the `INSERT ... ON CONFLICT ... DO UPDATE` syntax.
+    return connections[router.db_for_write(model)].vendor in ('postgresql', 'sqlite')
+
+
+def upsert_rows(
+    model: Type[models.Model],
+    fields: List[str],
+    rows: Sequence[Sequence[Any]],
+    conflict_field: str,
+    batch_size: int,
+    update_fields: Optional[List[str]] = None
+) -> None:
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    model_fields = [model._meta.get_field(field) for field in fields]
+    columns = [quote_name(field.column) for field in model_fields]
+    conflict_column = quote_name(model._meta.get_field(conflict_field).column)
+    update_columns = [column for column in columns if column != conflict_column] if update_fields is None \
+        else [quote_name(model._meta.get_field(field).column) for field in update_fields]
+    update_clause = ', '.join(f'{column} = EXCLUDED.{column}' for column in update_columns) \
+        if len(update_columns) > 0 else None
+    row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    # PostgreSQL can't update a row twice in one statement, the last row of a repeated key wins.
+    conflict_index = fields.index(conflict_field)
+    rows = list({ row[conflict_index]: row for row in rows }.values())
+    # the backend may limit the number of query parameters (e.g. SQLite).
+    batch_size = max(1, min(batch_size, connection.ops.bulk_batch_size(model_fields, rows)))
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            sql = (
+                f'INSERT INTO {quote_name(model._meta.db_table)} ({", ".join(columns)}) '
+                f'VALUES {", ".join([row_placeholder] * len(batch))} '
+                f'ON CONFLICT ({conflict_column}) '
+                + (f'DO UPDATE SET {update_clause}' if update_clause else 'DO NOTHING')
+            )
+            cursor.execute(sql, [value for row in batch for value in row])
@@ -1,3 +1,1309 @@
-from django.test import TestCase
+import io
+import json
+import random
+import tempfile
+import uuid
+from dataclasses import asdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Callable, Dict, List
+from unittest import mock, skipIf
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from django.utils import timezone
 
-# Create your tests here.
+from . import availability_engine, renderers
+from .benchmarks import (
+    BenchmarkRunner,
+    CatalogueScale,
+    clear_inventory,
+    generate_articles_upload,
+    generate_products_upload
+)
+from .business_logic import (
+    ArticleBusiness,
+    CatalogueBulkLoadBusiness,
+    ProductBusiness,
+    ProductDoesNotExistError,
+    ProductNotAvailableError,
+    ReservationBusiness,
+    StockLedgerBusiness,
+    UploadJobBusiness
+)
+from .data_business_objects import (
+    ArticleDBO,
+    CreateProductDBO,
+    CreateProductRequirementDBO,
+    ProductAvailabilityDBO,
+    ReservationRequestDBO
+)
+from .db_routers import (
+    ReplicaRouter,
+    is_pinned_to_primary,
+    iterate_in_routing_scope,
+    read_from_replica,
+    routing_scope
+)
+from .models import Article, Product, ProductRequirement, Reservation, StockMovement, UploadJob
+from .middleware import ReplicaPinningMiddleware
+from .query_budgets import QUERY_BUDGETS, QueryBudgetExceededError, capture_queries, query_budget
+from .repositories import ArticleRepository, ProductAvailabilityRepository, ProductRepository, ReservationRepository
+from .upload_parsers import (
+    ArticleUploadParser,
+    InvalidDataUploadError,
+    JSONListStreamReader,
+    ProductUploadParser,
+    discard_parse_pool,
+    get_parse_pool
+)
+
+# Both catalogues fit in a single batch of every bulk write, even with the SQLite limit of 999 query parameters.
+SMALL_CATALOGUE = CatalogueScale('small', article_count=10, product_count=5, requirements_per_product=3, shared_article_ratio=0.3)
+LARGE_CATALOGUE = CatalogueScale('large', article_count=200, product_count=60, requirements_per_product=4, shared_article_ratio=0.3)
+
+# prepares a scenario on a seeded catalogue and returns the call whose queries are counted.
+Scenario = Callable[[CatalogueScale, List[int]], Callable[[], HttpResponse]]
+
+
+def upload(client: object, url: str, payload: dict) -> HttpResponse:
+    return client.post(  # type: ignore
+        url,
+        data=json.dumps(payload).encode('utf-8'),
+        content_type='application/json',
+        HTTP_CONTENT_DISPOSITION='attachment; filename=upload.json'
+    )
+
+
+def consume(response: HttpResponse) -> HttpResponse:
+    # streamed responses run their queries while the content is read.
+    if response.streaming:
+        b''.join(response.streaming_content)  # type: ignore
+    return response
+
+
+@override_settings(INVENTORY_STOCK_LEDGER=False)
+class QueryBudgetTestCase(TestCase):
+    # Runs every scenario on a small and a large catalogue: its queries must fit in the budget and their number must
+    # not grow with the number of rows. Budgets are declared for the default settings, without the stock ledger.
+
+    def seed_catalogue(self, scale: CatalogueScale, products: bool = True) -> List[int]:
+        rng = random.Random(42)
+        clear_inventory()
+        cache.clear()
+        ArticleBusiness().save_articles(ArticleUploadParser().parse(generate_articles_upload(scale, rng)))
+        # every product is available, sells and reservations are accepted whatever the generated stock.
+        Article.objects.update(stock=1000000)
+        if products:
+            ProductBusiness().save_products(ProductUploadParser().parse(generate_products_upload(scale, rng)))
+
+        return list(Product.objects.order_by('id').values_list('id', flat=True))
+
+    def assert_query_budget(
+        self,
+        name: str,
+        scenario: Scenario,
+        expected_status: int = 200,
+        seed_products: bool = True
+    ) -> None:
+        query_counts: Dict[str, int] = {}
+        for scale in [SMALL_CATALOGUE, LARGE_CATALOGUE]:
+            call = scenario(scale, self.seed_catalogue(scale, seed_products))
+            with self.subTest(name=name, catalogue=scale.name):
+                # the inventory version is bumped on commit, its queries belong to the request too.
+                with capture_queries() as queries, self.captureOnCommitCallbacks(execute=True):
+                    response = consume(call())
+                query_counts[scale.name] = len(queries)
+                self.assertEqual(response.status_code, expected_status, getattr(response, 'content', b''))
+                self.assertLessEqual(
+                    len(queries),
+                    QUERY_BUDGETS[name],
+                    str(QueryBudgetExceededError(name, QUERY_BUDGETS[name], queries))
+                )
+
+        if len(query_counts) == 2:
+            self.assertEqual(
+                query_counts[SMALL_CATALOGUE.name],
+                query_counts[LARGE_CATALOGUE.name],
+                f'the queries of {name} grow with the size of the catalogue'
+            )
+
+
+class QueryBudgetTest(TestCase):
+    def test_raises_when_the_budget_is_exceeded(self) -> None:
+        QUERY_BUDGETS['test-budget'] = 1
+        try:
+            with query_budget('test-budget'):
+                Article.objects.count()
+            with self.assertRaises(QueryBudgetExceededError) as context:
+                with query_budget('test-budget'):
+                    Article.objects.count()
+                    Product.objects.count()
+        finally:
+            del QUERY_BUDGETS['test-budget']
+
+        self.assertEqual(len(context.exception.queries), 2)
+
+    def test_unknown_budget(self) -> None:
+        with self.assertRaises(KeyError):
+            with query_budget('unknown'):
+                pass
+
+
+class BenchmarkRunnerTest(TestCase):
+    def test_run_scale(self) -> None:
+        runner = BenchmarkRunner(sells=50, measure_memory=False, seed=1)
+
+        runner.run_scale(SMALL_CATALOGUE)
+
+        self.assertEqual([result.scenario for result in runner.results], [
+            'parse_articles',
+            'save_articles',
+            'parse_products',
+            'parse_products_in_parallel',
+            'save_products',
+            'get_products_availability',
+            'sell_product'
+        ])
+        self.assertEqual(runner.results[-1].operations, 50)
+        self.assertEqual(Product.objects.count(), SMALL_CATALOGUE.product_count)
+        self.assertEqual(len(json.loads(runner.to_json())['results']), len(runner.results))
+
+    def test_only_unavailable_sells_are_skipped(self) -> None:
+        runner = BenchmarkRunner(sells=2, measure_memory=False, seed=1)
+
+        with mock.patch.object(ProductBusiness, 'sell_product', side_effect=ProductNotAvailableError(1)):
+            runner._sell_products([1, 2])
+        with mock.patch.object(ProductBusiness, 'sell_product', side_effect=ProductDoesNotExistError(1)):
+            with self.assertRaises(ProductDoesNotExistError):
+                runner._sell_products([1, 2])
+
+
+class ProductEndpointsQueryBudgetTest(QueryBudgetTestCase):
+    def test_products_availability(self) -> None:
+        url = reverse('products-availability')
+        self.assert_query_budget('products-availability', lambda scale, product_ids: lambda: self.client.get(url))
+        self.assert_query_budget(
+            'products-availability',
+            lambda scale, product_ids: lambda: self.client.get(url, { 'limit': len(product_ids) })
+        )
+        self.assert_query_budget(
+            'products-availability',
+            lambda scale, product_ids: lambda: self.client.get(url, { 'ids': ','.join(map(str, product_ids)) })
+        )
+
+    def test_streamed_products_availability(self) -> None:
+        # the stream reads one chunk per INVENTORY_AVAILABILITY_CHUNK_SIZE products, both catalogues fit in one.
+        url = reverse('products-availability')
+        self.assert_query_budget(
+            'products-availability',
+            lambda scale, product_ids: lambda: self.client.get(url, { 'mode': 'stream' })
+        )
+
+    def test_not_modified_products_availability(self) -> None:
+        url = reverse('products-availability')
+
+        def scenario(scale: CatalogueScale, product_ids: List[int]) -> Callable[[], HttpResponse]:
+            etag = self.client.get(url)['ETag']
+            return lambda: self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assert_query_budget('products-availability', scenario, expected_status=304)
+
+    def test_sell_product(self) -> None:
+        self.assert_query_budget(
+            'sell-product',
+            lambda scale, product_ids: lambda: self.client.post(reverse('sell-product', args=[product_ids[-1]]))
+        )
+
+    def test_order(self) -> None:
+        # orders of every product of the catalogue, the lines are resolved together.
+        self.assert_query_budget(
+            'orders',
+            lambda scale, product_ids: lambda: self.client.post(
+                reverse('orders'),
+                { 'lines': [{ 'product_id': id, 'quantity': 1 } for id in product_ids] },
+                content_type='application/json'
+            )
+        )
+
+    def test_basket_feasibility(self) -> None:
+        self.assert_query_budget(
+            'basket-feasibility',
+            lambda scale, product_ids: lambda: self.client.post(
+                reverse('basket-feasibility'),
+                { 'lines': [{ 'product_id': id, 'quantity': 2 } for id in product_ids] },
+                content_type='application/json'
+            )
+        )
+
+    def test_upload_products(self) -> None:
+        def scenario(scale: CatalogueScale, product_ids: List[int]) -> Callable[[], HttpResponse]:
+            payload = generate_products_upload(scale, random.Random(7))
+            return lambda: upload(self.client, reverse('upload-products'), payload)
+
+        self.assert_query_budget('upload-products', scenario, expected_status=201, seed_products=False)
+
+    def test_streamed_upload_products(self) -> None:
+        def scenario(scale: CatalogueScale, product_ids: List[int]) -> Callable[[], HttpResponse]:
+            payload = generate_products_upload(scale, random.Random(7))
+            return lambda: upload(self.client, reverse('upload-products') + '?mode=stream', payload)
+
+        self.assert_query_budget('upload-products', scenario, expected_status=201, seed_products=False)
+
+
+class ArticleEndpointsQueryBudgetTest(QueryBudgetTestCase):
+    def test_upload_articles(self) -> None:
+        # half of the uploaded articles already exist.
+        def scenario(scale: CatalogueScale, product_ids: List[int]) -> Callable[[], HttpResponse]:
+            payload = generate_articles_upload(scale, random.Random(7))
+            for article in payload['inventory']:
+                article_id = int(article['art_id']) + scale.article_count // 2
+                article.update({ 'art_id': str(article_id), 'name': f'article {article_id}' })
+            return lambda: upload(self.client, reverse('upload-articles'), payload)
+
+        self.assert_query_budget('upload-articles', scenario, expected_status=201)
+        self.assert_query_budget('upload-articles', scenario, expected_status=201, seed_products=False)
+
+    def test_streamed_upload_articles(self) -> None:
+        def scenario(scale: CatalogueScale, product_ids: List[int]) -> Callable[[], HttpResponse]:
+            payload = generate_articles_upload(scale, random.Random(7))
+            return lambda: upload(self.client, reverse('upload-articles') + '?mode=stream', payload)
+
+        self.assert_query_budget('upload-articles', scenario, expected_status=201)
+
+    def test_stock_deltas(self) -> None:
+        def scenario(scale: CatalogueScale, product_ids: List[int]) -> Callable[[], HttpResponse]:
+            deltas = [
+                { 'art_id': str(id), 'delta': str(-1 if id % 2 == 0 else 5) }
+                for id in range(1, scale.article_count + 1)
+            ]
+            return lambda: self.client.post(reverse('articles-stock'), { 'deltas': deltas }, content_type='application/json')
+
+        self.assert_query_budget('articles-stock', scenario)
+
+
+class ReservationEndpointsQueryBudgetTest(QueryBudgetTestCase):
+    def reserve(self, product_id: int) -> str:
+        return ReservationBusiness().reserve_product(product_id, ReservationRequestDBO(quantity=2, ttl_seconds=None)).id
+
+    def test_reserve_product(self) -> None:
+        self.assert_query_budget(
+            'reserve-product',
+            lambda scale, product_ids: lambda: self.client.post(
+                reverse('reserve-product', args=[product_ids[-1]]),
+                { 'quantity': 3 },
+                content_type='application/json'
+            ),
+            expected_status=201
+        )
+
+    def test_get_reservation(self) -> None:
+        def scenario(scale: CatalogueScale, product_ids: List[int]) -> Callable[[], HttpResponse]:
+            reservation_id = self.reserve(product_ids[-1])
+            return lambda: self.client.get(reverse('reservation', args=[reservation_id]))
+
+        self.assert_query_budget('reservation', scenario)
+
+    def test_confirm_reservation(self) -> None:
+        def scenario(scale: CatalogueScale, product_ids: List[int]) -> Callable[[], HttpResponse]:
+            reservation_id = self.reserve(product_ids[-1])
+            return lambda: self.client.post(reverse('confirm-reservation', args=[reservation_id]))
+
+        self.assert_query_budget('confirm-reservation', scenario)
+
+    def test_release_reservation(self) -> None:
+        def scenario(scale: CatalogueScale, product_ids: List[int]) -> Callable[[], HttpResponse]:
+            reservation_id = self.reserve(product_ids[-1])
+            return lambda: self.client.post(reverse('release-reservation', args=[reservation_id]))
+
+        self.assert_query_budget('release-reservation', scenario)
+
+
+class OperationEndpointsQueryBudgetTest(QueryBudgetTestCase):
+    def test_metrics(self) -> None:
+        self.assert_query_budget('metrics', lambda scale, product_ids: lambda: self.client.get(reverse('metrics')))
+
+    def test_upload_job(self) -> None:
+        def scenario(scale: CatalogueScale, product_ids: List[int]) -> Callable[[], HttpResponse]:
+            job = UploadJob.objects.create(kind=UploadJob.Kind.ARTICLES, file='upload_jobs/upload.json')
+            return lambda: self.client.get(reverse('upload-job', args=[job.id]))
+
+        self.assert_query_budget('upload-job', scenario)
+
+
+class RepositoryQueryBudgetTest(QueryBudgetTestCase):
+    def assert_repository_query_budget(self, name: str, call: Callable[[CatalogueScale, List[int]], object]) -> None:
+        self.assert_query_budget(name, lambda scale, product_ids: lambda: (call(scale, product_ids), HttpResponse())[1])
+
+    def test_products_with_requirement_details(self) -> None:
+        def call(scale: CatalogueScale, product_ids: List[int]) -> object:
+            products = ProductRepository().get_products_with_requirement_details()
+            self.assertEqual(len(products), len(product_ids))
+            self.assertEqual(
+                sum(len(product.requirements) for product in products),
+                scale.product_count * scale.requirements_per_product
+            )
+            return products
+
+        self.assert_repository_query_budget('ProductRepository.get_products_with_requirement_details', call)
+        self.assert_repository_query_budget(
+            'ProductRepository.get_product_with_requirement_details',
+            lambda scale, product_ids: ProductRepository().get_product_with_requirement_details(product_ids[-1])
+        )
+
+    def test_products_availability(self) -> None:
+        self.assert_repository_query_budget(
+            'ProductRepository.get_products_availability',
+            lambda scale, product_ids: ProductRepository().get_products_availability(min_availability=1)
+        )
+        self.assert_repository_query_budget(
+            'ProductRepository.get_products_requirement_article_quantities',
+            lambda scale, product_ids: ProductRepository().get_products_requirement_article_quantities(product_ids)
+        )
+
+    def test_articles_stock(self) -> None:
+        self.assert_repository_query_budget(
+            'ProductAvailabilityRepository.refresh_for_articles',
+            lambda scale, product_ids: ProductAvailabilityRepository().refresh_for_articles(range(1, scale.article_count + 1))
+        )
+        self.assert_repository_query_budget(
+            'ArticleRepository.get_articles_available_stock',
+            lambda scale, product_ids: ArticleRepository().get_articles_available_stock(range(1, scale.article_count + 1))
+        )
+
+
+
+@read_from_replica
+def read_product_database() -> str:
+    return ReplicaRouter().db_for_read(Product) or 'default'
+
+
+@override_settings(INVENTORY_REPLICA_DATABASES=['replica_1', 'replica_2'])
+class ReplicaRouterTest(SimpleTestCase):
+    def test_reads_of_replica_methods(self) -> None:
+        with routing_scope():
+            replica = read_product_database()
+            self.assertIn(replica, ['replica_1', 'replica_2'])
+            # a single replica for the whole scope.
+            self.assertEqual(read_product_database(), replica)
+            self.assertIsNone(ReplicaRouter().db_for_read(Product))
+
+    def test_writes_pin_to_primary(self) -> None:
+        with routing_scope():
+            self.assertIsNone(ReplicaRouter().db_for_write(Product))
+            self.assertTrue(is_pinned_to_primary())
+            self.assertEqual(read_product_database(), 'default')
+
+    @override_settings(INVENTORY_REPLICA_DATABASES=[])
+    def test_without_replicas(self) -> None:
+        with routing_scope():
+            self.assertEqual(read_product_database(), 'default')
+
+
+@override_settings(INVENTORY_REPLICA_DATABASES=['replica_1'], INVENTORY_REPLICA_PIN_SECONDS=5)
+class ReplicaPinningMiddlewareTest(SimpleTestCase):
+    def handle(self, request: object) -> HttpResponse:
+        return HttpResponse(read_product_database())
+
+    def test_reads_from_replica(self) -> None:
+        response = ReplicaPinningMiddleware(self.handle)(RequestFactory().get('/inventory/products/availability'))
+
+        self.assertEqual(response.content, b'replica_1')
+        self.assertNotIn(ReplicaPinningMiddleware.cookie_name, response.cookies)
+
+    def test_writes_pin_the_client(self) -> None:
+        response = ReplicaPinningMiddleware(self.handle)(RequestFactory().post('/inventory/products/1/sell'))
+
+        self.assertEqual(response.content, b'default')
+        self.assertEqual(response.cookies[ReplicaPinningMiddleware.cookie_name]['max-age'], 5)
+
+    def test_pinned_client_reads_from_primary(self) -> None:
+        request = RequestFactory().get('/inventory/products/availability')
+        request.COOKIES[ReplicaPinningMiddleware.cookie_name] = '1'
+        response = ReplicaPinningMiddleware(self.handle)(request)
+
+        self.assertEqual(response.content, b'default')
+
+    def stream(self, request: object) -> StreamingHttpResponse:
+        return StreamingHttpResponse(iterate_in_routing_scope(read_product_database() for _ in range(3)))
+
+    def test_pinned_client_streams_from_primary(self) -> None:
+        request = RequestFactory().get('/inventory/products/availability?mode=stream')
+        request.COOKIES[ReplicaPinningMiddleware.cookie_name] = '1'
+        # the server consumes the stream after the middleware returned.
+        response = ReplicaPinningMiddleware(self.stream)(request)
+
+        self.assertEqual(b''.join(response.streaming_content), b'default' * 3)
+
+    @override_settings(INVENTORY_REPLICA_DATABASES=['replica_1', 'replica_2'])
+    def test_stream_reads_from_a_single_replica(self) -> None:
+        response = ReplicaPinningMiddleware(self.stream)(RequestFactory().get('/inventory/products/availability'))
+
+        self.assertIn(b''.join(response.streaming_content), [b'replica_1' * 3, b'replica_2' * 3])
+
+
+@override_settings(INVENTORY_PARSE_WORKERS=2)
+class ParallelProductUploadParserTest(SimpleTestCase):
+    def setUp(self) -> None:
+        self.data = generate_products_upload(LARGE_CATALOGUE, random.Random(3))
+
+    def test_same_products_as_sequential_parse(self) -> None:
+        parser = ProductUploadParser()
+
+        self.assertEqual(parser.parse_in_parallel(self.data, chunk_size=7), parser.parse(self.data))
+
+    def test_errors_keep_the_product_path(self) -> None:
+        self.data['products'][23]['contain_articles'][1]['amount_of'] = 'many'
+        self.data['products'][50]['name'] = 3
+
+        with self.assertRaises(InvalidDataUploadError) as context:
+            ProductUploadParser().parse_in_parallel(self.data, chunk_size=7)
+
+        self.assertEqual(context.exception.errors, ('attribute products[23][1].amount_of: expected number',))
+
+    def test_parses_share_the_pool(self) -> None:
+        parser = ProductUploadParser()
+        parser.parse_in_parallel(self.data, chunk_size=7)
+        pool = get_parse_pool()
+        parser.parse_in_parallel(self.data, chunk_size=7)
+
+        self.assertIs(get_parse_pool(), pool)
+
+    def test_discarded_pool_is_replaced(self) -> None:
+        pool = get_parse_pool()
+        discard_parse_pool(pool)
+
+        self.assertIsNot(get_parse_pool(), pool)
+
+    def test_uploads_use_the_pool_above_the_threshold(self) -> None:
+        parser = ProductUploadParser()
+        for (min_products, used) in [(0, False), (len(self.data['products']) + 1, False), (len(self.data['products']), True)]:
+            with self.subTest(min_products=min_products), \
+                    override_settings(INVENTORY_PARALLEL_PARSE_MIN_PRODUCTS=min_products), \
+                    mock.patch.object(ProductUploadParser, 'parse_in_parallel', return_value=[]) as parse_in_parallel:
+                parser.parse_upload(self.data)
+
+                self.assertEqual(parse_in_parallel.called, used)
+
+
+class ArticleUploadDiffTest(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.payload = { 'inventory': [{ 'art_id': str(id), 'name': f'article {id}', 'stock': '10' } for id in range(1, 6)] }
+
+    def upload_articles(self, payload: dict, mode: str = '') -> HttpResponse:
+        with self.captureOnCommitCallbacks(execute=True):
+            return upload(self.client, reverse('upload-articles') + mode, payload)
+
+    def test_only_changed_articles_are_written(self) -> None:
+        self.assertEqual(self.upload_articles(self.payload).json(), { 'created': 5, 'updated': 0, 'unchanged': 0 })
+        self.payload['inventory'][0]['stock'] = '7'
+        self.payload['inventory'].append({ 'art_id': '6', 'name': 'article 6', 'stock': '1' })
+
+        with capture_queries() as queries:
+            response = self.upload_articles(self.payload, '?mode=stream')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), { 'created': 1, 'updated': 1, 'unchanged': 4 })
+        self.assertEqual(Article.objects.get(id=1).stock, 7)
+        self.assertEqual(Article.objects.count(), 6)
+        self.assertIn("VALUES (%s, %s, %s, %s), (%s, %s, %s, %s) ON CONFLICT", ' '.join(queries))
+
+    def test_identical_files_are_acknowledged_without_reading_articles(self) -> None:
+        self.upload_articles(self.payload)
+
+        with capture_queries() as queries:
+            response = self.upload_articles(self.payload)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), { 'created': 0, 'updated': 0, 'unchanged': 5 })
+        self.assertEqual(len(queries), 1)
+
+    def test_identical_files_are_compared_after_other_changes(self) -> None:
+        self.upload_articles(self.payload)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('articles-stock'),
+                { 'deltas': [{ 'art_id': '2', 'delta': '-4' }] },
+                content_type='application/json'
+            )
+
+        response = self.upload_articles(self.payload)
+
+        self.assertEqual(response.json(), { 'created': 0, 'updated': 1, 'unchanged': 4 })
+        self.assertEqual(Article.objects.get(id=2).stock, 10)
+
+
+class ArticleRepositoryTest(TestCase):
+    def test_repeated_articles_are_upserted_once(self) -> None:
+        ArticleRepository().save_articles([ArticleDBO(id=1, name='article 1', stock=1)])
+
+        with capture_queries() as queries:
+            ArticleRepository().save_articles([
+                ArticleDBO(id=1, name='article 1', stock=2),
+                ArticleDBO(id=2, name='article 2', stock=5),
+                ArticleDBO(id=1, name='article 1', stock=3)
+            ], batch_size=10)
+
+        self.assertEqual(dict(Article.objects.values_list('id', 'stock')), { 1: 3, 2: 5 })
+        self.assertIn("VALUES (%s, %s, %s, %s), (%s, %s, %s, %s) ON CONFLICT", ' '.join(queries))
+        self.assertNotIn("(%s, %s, %s, %s), (%s, %s, %s, %s), (%s, %s, %s, %s)", ' '.join(queries))
+
+
+class RenderJSONTest(SimpleTestCase):
+    def setUp(self) -> None:
+        item = ProductAvailabilityDBO(id=1, name='chaise \u2028 longue', availability=3)
+        self.data = {
+            'results': [item],
+            'next_cursor': None,
+            'price': Decimal('12.50'),
+            'updated_at': datetime(2021, 3, 4, 5, 6, 7, 891011, tzinfo=timezone.utc),
+            'day': date(2021, 3, 4),
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'a': 1
+        }
+        # the bytes of the DRF renderer used for these responses before.
+        self.expected = JSONRenderer().render({ **self.data, 'results': [asdict(item)] })
+
+    @skipIf(renderers.orjson is None, 'the "json" extra is not installed')
+    def test_orjson_matches_the_drf_renderer(self) -> None:
+        self.assertEqual(renderers.render_json(self.data), self.expected)
+
+    def test_stdlib_matches_the_drf_renderer(self) -> None:
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.render_json(self.data), self.expected)
+
+
+class JSONListStreamReaderTest(SimpleTestCase):
+    def read_list(self, content: bytes) -> list:
+        return list(JSONListStreamReader(io.BytesIO(content), chunk_size=4).iter_list_field('inventory', 'root'))
+
+    def test_reads_the_list_items(self) -> None:
+        self.assertEqual(self.read_list(b'{"version": {"v": 1}, "inventory": [1, {"a": [2]}], "other": "x"} \n'), [1, { 'a': [2] }])
+
+    def test_values_split_across_chunks(self) -> None:
+        content = '{"inventory": ["a long name", 12.5, -3e+10, true, null, {"name": "\\u00e9t\u00e9", "stock": [10]}]}'
+        for chunk_size in range(1, 12):
+            with self.subTest(chunk_size=chunk_size):
+                reader = JSONListStreamReader(io.BytesIO(content.encode('utf-8')), chunk_size=chunk_size)
+                self.assertEqual(list(reader.iter_list_field('inventory', 'root')), json.loads(content)['inventory'])
+
+    def test_malformed_value_fails_without_reading_the_rest(self) -> None:
+        stream = io.BytesIO(b'{"inventory": [1, {"a": x}, ' + b'2, ' * 100000 + b'3]}')
+
+        with self.assertRaises(InvalidDataUploadError):
+            list(JSONListStreamReader(stream, chunk_size=4).iter_list_field('inventory', 'root'))
+        self.assertLess(stream.tell(), 64)
+
+    def test_rejects_content_after_the_object(self) -> None:
+        for content in [b'{"inventory": [1]} x', b'{"inventory": [1]}{}', b'{"inventory": [1]]', b'{"inventory": [1], 2: 3}']:
+            with self.subTest(content=content), self.assertRaises(InvalidDataUploadError):
+                self.read_list(content)
+
+
+class InventoryTestMixin:
+    def create_catalogue(self, articles_stock: Dict[int, int], products: Dict[str, Dict[int, int]]) -> Dict[str, int]:
+        # returns the product ids by name.
+        ArticleBusiness().save_articles([ArticleDBO(id=id, name=f'article {id}', stock=stock) for (id, stock) in articles_stock.items()])
+        if len(products) == 0:
+            return {}
+        ProductBusiness().save_products([
+            CreateProductDBO(
+                name=name,
+                requirements=[CreateProductRequirementDBO(quantity=quantity, article_id=id) for (id, quantity) in article_quantities.items()]
+            )
+            for (name, article_quantities) in products.items()
+        ])
+
+        return dict(Product.objects.values_list('name', 'id'))
+
+    def get_articles_stock(self) -> Dict[int, int]:
+        return ArticleRepository().get_articles_stock(Article.objects.values_list('id', flat=True))
+
+
+class InventoryTestCase(InventoryTestMixin, TestCase):
+    pass
+
+
+class SellProductTest(InventoryTestCase):
+    def setUp(self) -> None:
+        self.product_ids = self.create_catalogue({ 1: 10, 2: 3 }, { 'table': { 1: 4, 2: 1 } })
+
+    def sell(self, product_id: int) -> HttpResponse:
+        return self.client.post(reverse('sell-product', args=[product_id]))
+
+    def test_sell_decrements_the_stock(self) -> None:
+        response = self.sell(self.product_ids['table'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_articles_stock(), { 1: 6, 2: 2 })
+
+    def test_sell_without_enough_stock_is_rejected(self) -> None:
+        self.sell(self.product_ids['table'])
+        self.sell(self.product_ids['table'])
+
+        response = self.sell(self.product_ids['table'])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_articles_stock(), { 1: 2, 2: 1 })
+
+    def test_unknown_product(self) -> None:
+        self.assertEqual(self.sell(self.product_ids['table'] + 1).status_code, 400)
+
+
+@override_settings(INVENTORY_STOCK_LEDGER=True)
+class LedgerSellProductTest(SellProductTest):
+    pass
+
+
+class ProductsAvailabilityTest(InventoryTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.product_ids = self.create_catalogue(
+            { 1: 10, 2: 3 },
+            { 'chair': { 1: 4 }, 'table': { 1: 2, 2: 1 }, 'lamp': { 2: 2 }, 'shelf': { 1: 1 }, 'stool': { 2: 4 } }
+        )
+
+    def get_availability(self, query: Dict[str, str]) -> HttpResponse:
+        return self.client.get(reverse('products-availability'), query)
+
+    def get_pages(self, limit: int, between_pages: Callable[[], None] = lambda: None) -> List[List[str]]:
+        pages = []
+        query = { 'limit': str(limit) }
+        while True:
+            page = self.get_availability(query).json()
+            pages.append([item['name'] for item in page['results']])
+            if page['next_cursor'] is None:
+                return pages
+            query['cursor'] = str(page['next_cursor'])
+            between_pages()
+
+    def test_pages_follow_the_cursor(self) -> None:
+        pages = self.get_pages(2)
+
+        self.assertEqual(pages, [['chair', 'table'], ['lamp', 'shelf'], ['stool']])
+        self.assertEqual(
+            [name for page in pages for name in page],
+            [item['name'] for item in self.get_availability({}).json()]
+        )
+
+    def test_pages_are_stable_under_inserts(self) -> None:
+        # new products get higher ids, the pages already read don't move.
+        def insert_product() -> None:
+            if not Product.objects.filter(name='desk').exists():
+                with self.captureOnCommitCallbacks(execute=True):
+                    ProductBusiness().save_products([
+                        CreateProductDBO(name='desk', requirements=[CreateProductRequirementDBO(quantity=1, article_id=1)])
+                    ])
+
+        pages = self.get_pages(2, insert_product)
+
+        self.assertEqual(pages, [['chair', 'table'], ['lamp', 'shelf'], ['stool', 'desk'], []])
+
+    def test_invalid_query_params(self) -> None:
+        for query in [{ 'cursor': 'abc' }, { 'cursor': '0' }, { 'limit': 'abc' }, { 'limit': '-1' }]:
+            with self.subTest(query=query):
+                self.assertEqual(self.get_availability(query).status_code, 400)
+
+    def get_chair_availability(self, response: HttpResponse) -> int:
+        return next(item['availability'] for item in response.json() if item['name'] == 'chair')
+
+    def test_pages_are_cached_per_version(self) -> None:
+        first = self.get_availability({})
+
+        with capture_queries() as queries:
+            cached = self.get_availability({})
+
+        # only the inventory version is read.
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(cached['ETag'], first['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('sell-product', args=[self.product_ids['chair']]))
+
+        with capture_queries() as queries:
+            sold = self.get_availability({})
+
+        self.assertGreater(len(queries), 1)
+        self.assertNotEqual(sold['ETag'], first['ETag'])
+        self.assertEqual(self.get_chair_availability(first), 2)
+        self.assertEqual(self.get_chair_availability(sold), 1)
+
+    def test_not_modified(self) -> None:
+        etag = self.get_availability({})['ETag']
+
+        response = self.client.get(reverse('products-availability'), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            upload(self.client, reverse('upload-articles'), { 'inventory': [{ 'art_id': '1', 'name': 'article 1', 'stock': '20' }] })
+
+        response = self.client.get(reverse('products-availability'), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get_chair_availability(response), 5)
+
+    @override_settings(INVENTORY_AVAILABILITY_CHUNK_SIZE=2)
+    def test_stream_with_min_availability(self) -> None:
+        response = self.get_availability({ 'mode': 'stream', 'min_availability': '2' })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [
+            { 'id': self.product_ids['chair'], 'name': 'chair', 'availability': 2 },
+            { 'id': self.product_ids['table'], 'name': 'table', 'availability': 3 },
+            { 'id': self.product_ids['shelf'], 'name': 'shelf', 'availability': 10 }
+        ])
+
+
+def scrape_metric(response: HttpResponse, sample: str) -> float:
+    # value of a sample (name and labels) of the metrics response, 0 until it is first observed.
+    for line in response.content.decode().splitlines():
+        if line.startswith(f'{sample} '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+
+@override_settings(INVENTORY_METRICS_SQL_SAMPLE_RATE=1.0)
+class MetricsTest(InventoryTestCase):
+    # the metrics are kept by the process for every test, the samples are compared before and after the request.
+    def setUp(self) -> None:
+        self.product_ids = self.create_catalogue({ 1: 10 }, { 'table': { 1: 4 } })
+
+    def test_sell_is_recorded(self) -> None:
+        samples = [
+            'inventory_sold_products_total',
+            'inventory_request_duration_seconds_count{view="sell-product",method="POST",status="200"}',
+            'inventory_request_duration_seconds_bucket{view="sell-product",method="POST",status="200",le="+Inf"}',
+            'inventory_request_sql_queries_count{view="sell-product"}',
+        ]
+        before = self.client.get(reverse('metrics'))
+
+        self.client.post(reverse('sell-product', args=[self.product_ids['table']]))
+
+        after = self.client.get(reverse('metrics'))
+        self.assertEqual(after.status_code, 200)
+        for sample in samples:
+            self.assertEqual(scrape_metric(after, sample) - scrape_metric(before, sample), 1, sample)
+        self.assertGreater(
+            scrape_metric(after, 'inventory_request_sql_queries_sum{view="sell-product"}')
+            - scrape_metric(before, 'inventory_request_sql_queries_sum{view="sell-product"}'),
+            0
+        )
+
+    def test_rejected_sell_is_recorded(self) -> None:
+        self.client.post(reverse('sell-product', args=[self.product_ids['table']]))
+        self.client.post(reverse('sell-product', args=[self.product_ids['table']]))
+        before = self.client.get(reverse('metrics'))
+
+        self.client.post(reverse('sell-product', args=[self.product_ids['table']]))
+
+        after = self.client.get(reverse('metrics'))
+        sample = 'inventory_request_duration_seconds_count{view="sell-product",method="POST",status="400"}'
+        self.assertEqual(scrape_metric(after, sample) - scrape_metric(before, sample), 1)
+        self.assertEqual(
+            scrape_metric(after, 'inventory_sell_rejections_total') - scrape_metric(before, 'inventory_sell_rejections_total'),
+            1
+        )
+
+
+class OrderTest(InventoryTestCase):
+    def setUp(self) -> None:
+        self.product_ids = self.create_catalogue(
+            { 1: 10, 2: 5, 3: 1 },
+            { 'chair': { 1: 4 }, 'table': { 1: 2, 2: 1 }, 'lamp': { 3: 2 } }
+        )
+
+    def order(self, lines: List[Dict[str, int]]) -> HttpResponse:
+        return self.client.post(reverse('orders'), { 'lines': lines }, content_type='application/json')
+
+    def test_order_sells_every_line(self) -> None:
+        response = self.order([
+            { 'product_id': self.product_ids['chair'], 'quantity': 1 },
+            { 'product_id': self.product_ids['table'], 'quantity': 3 }
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_articles_stock(), { 1: 0, 2: 2, 3: 1 })
+
+    def test_order_is_rejected_when_a_line_is_not_available(self) -> None:
+        # the chairs and the tables are available on their own but not together, the lamp is not available.
+        response = self.order([
+            { 'product_id': self.product_ids['chair'], 'quantity': 2 },
+            { 'product_id': self.product_ids['lamp'], 'quantity': 1 },
+            { 'product_id': self.product_ids['table'], 'quantity': 2 }
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            f'lines[0]: not enough stock of articles with ids 1 for product id={self.product_ids["chair"]}',
+            f'lines[1]: not enough stock of articles with ids 3 for product id={self.product_ids["lamp"]}',
+            f'lines[2]: not enough stock of articles with ids 1 for product id={self.product_ids["table"]}'
+        ])
+        self.assertEqual(self.get_articles_stock(), { 1: 10, 2: 5, 3: 1 })
+
+    def test_order_with_unknown_product(self) -> None:
+        unknown_id = max(self.product_ids.values()) + 1
+        response = self.order([
+            { 'product_id': self.product_ids['chair'], 'quantity': 1 },
+            { 'product_id': unknown_id, 'quantity': 1 }
+        ])
+
+        self.assertEqual(response.json()['errors'], [f'lines[1]: Product does not exist with id={unknown_id}'])
+        self.assertEqual(self.get_articles_stock(), { 1: 10, 2: 5, 3: 1 })
+
+    def test_order_rejected_before_stock_is_freed(self) -> None:
+        # a concurrent change leaves enough stock once the decrement was already rejected.
+        with mock.patch.object(ArticleRepository, 'decrement_articles_stock', return_value=False):
+            response = self.order([
+                { 'product_id': self.product_ids['chair'], 'quantity': 1 },
+                { 'product_id': self.product_ids['table'], 'quantity': 1 }
+            ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            f'lines[0]: not enough stock for product id={self.product_ids["chair"]}',
+            f'lines[1]: not enough stock for product id={self.product_ids["table"]}'
+        ])
+
+
+@override_settings(INVENTORY_STOCK_LEDGER=True)
+class LedgerOrderTest(OrderTest):
+    pass
+
+
+class ProductAvailabilityRefreshTest(InventoryTestCase):
+    def setUp(self) -> None:
+        self.product_ids = self.create_catalogue({ 1: 100, 2: 7 }, { 'shelf': { 1: 1 }, 'desk': { 1: 40 }, 'lamp': { 2: 3 } })
+
+    def get_stored_availability(self) -> Dict[str, int]:
+        stored = ProductAvailabilityRepository().get_stored_availability(self.product_ids.values())
+        return { name: stored[id] for (name, id) in self.product_ids.items() }
+
+    def test_stock_changes_refresh_the_dependent_products(self) -> None:
+        self.assertEqual(self.get_stored_availability(), { 'shelf': 100, 'desk': 2, 'lamp': 2 })
+
+        self.client.post(reverse('sell-product', args=[self.product_ids['shelf']]))
+        self.assertEqual(self.get_stored_availability(), { 'shelf': 99, 'desk': 2, 'lamp': 2 })
+
+        self.client.post(reverse('articles-stock'), { 'deltas': [{ 'art_id': '1', 'delta': '-60' }] }, content_type='application/json')
+        self.assertEqual(self.get_stored_availability(), { 'shelf': 39, 'desk': 0, 'lamp': 2 })
+        self.assertEqual(ProductBusiness().verify_products_availability(100), [])
+
+
+class CatalogueBulkLoadTest(InventoryTestCase):
+    def test_last_row_of_a_repeated_article_wins(self) -> None:
+        self.create_catalogue({ 1: 10 }, {})
+        articles = [
+            ArticleDBO(id=1, name='screw', stock=3),
+            ArticleDBO(id=2, name='bolt', stock=4),
+            ArticleDBO(id=1, name='screw', stock=7)
+        ]
+
+        (saved_articles_count, created_products_count) = CatalogueBulkLoadBusiness().load(articles, [])
+
+        self.assertEqual((saved_articles_count, created_products_count), (2, 0))
+        self.assertEqual(self.get_articles_stock(), { 1: 7, 2: 4 })
+
+
+class ReservationTest(InventoryTestCase):
+    def setUp(self) -> None:
+        self.product_ids = self.create_catalogue({ 1: 10 }, { 'chair': { 1: 4 } })
+
+    def reserve(self, quantity: int = 1) -> HttpResponse:
+        return self.client.post(
+            reverse('reserve-product', args=[self.product_ids['chair']]),
+            { 'quantity': quantity, 'ttl_seconds': 60 },
+            content_type='application/json'
+        )
+
+    def get_articles_available_stock(self) -> Dict[int, int]:
+        return ArticleRepository().get_articles_available_stock([1])
+
+    def expire(self, reservation_id: str) -> None:
+        Reservation.objects.filter(id=reservation_id).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_reserve_holds_the_stock(self) -> None:
+        response = self.reserve(2)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], Reservation.Status.ACTIVE)
+        self.assertEqual(self.get_articles_stock(), { 1: 10 })
+        self.assertEqual(self.get_articles_available_stock(), { 1: 2 })
+        self.assertEqual(self.reserve(1).status_code, 400)
+
+    def test_confirm_sells_the_held_stock(self) -> None:
+        reservation_id = self.reserve(2).json()['id']
+
+        self.assertEqual(self.client.post(reverse('confirm-reservation', args=[reservation_id])).status_code, 200)
+        self.assertEqual(self.get_articles_stock(), { 1: 2 })
+        self.assertEqual(self.get_articles_available_stock(), { 1: 2 })
+        self.assertEqual(self.client.post(reverse('release-reservation', args=[reservation_id])).status_code, 400)
+
+    def test_release_gives_back_the_held_stock(self) -> None:
+        reservation_id = self.reserve(2).json()['id']
+
+        self.assertEqual(self.client.post(reverse('release-reservation', args=[reservation_id])).status_code, 200)
+        self.assertEqual(self.get_articles_stock(), { 1: 10 })
+        self.assertEqual(self.get_articles_available_stock(), { 1: 10 })
+        self.assertEqual(self.client.post(reverse('confirm-reservation', args=[reservation_id])).status_code, 400)
+
+    def test_expired_reservations_give_back_the_held_stock(self) -> None:
+        expired_id = self.reserve(1).json()['id']
+        active_id = self.reserve(1).json()['id']
+        self.expire(expired_id)
+
+        self.assertEqual(ReservationBusiness().expire_reservations(), 1)
+        self.assertEqual(self.client.get(reverse('reservation', args=[expired_id])).json()['status'], Reservation.Status.EXPIRED)
+        self.assertEqual(self.client.get(reverse('reservation', args=[active_id])).json()['status'], Reservation.Status.ACTIVE)
+        self.assertEqual(self.get_articles_available_stock(), { 1: 6 })
+        self.assertEqual(self.client.post(reverse('confirm-reservation', args=[expired_id])).status_code, 400)
+
+    def test_expire_returns_only_the_reservations_it_changed(self) -> None:
+        # a reservation selected by the sweep but confirmed before its UPDATE keeps its held stock sold.
+        confirmed_id = self.reserve(1).json()['id']
+        expired_id = self.reserve(1).json()['id']
+        self.client.post(reverse('confirm-reservation', args=[confirmed_id]))
+
+        expired_ids = ReservationRepository()._expire_active_reservations([uuid.UUID(confirmed_id), uuid.UUID(expired_id)])
+
+        self.assertEqual(expired_ids, [expired_id])
+        self.assertEqual(Reservation.objects.get(id=confirmed_id).status, Reservation.Status.CONFIRMED)
+
+
+@override_settings(INVENTORY_STOCK_LEDGER=True)
+class LedgerReservationTest(ReservationTest):
+    pass
+
+
+class StockDeltaTest(InventoryTestCase):
+    def setUp(self) -> None:
+        self.create_catalogue({ 1: 10, 2: 3, 3: 0 }, {})
+
+    def apply_deltas(self, deltas: List[Dict[str, str]]) -> HttpResponse:
+        return self.client.post(reverse('articles-stock'), { 'deltas': deltas }, content_type='application/json')
+
+    def test_deltas_are_added_to_the_stock(self) -> None:
+        response = self.apply_deltas([{ 'art_id': '1', 'delta': '-4' }, { 'art_id': '3', 'delta': '5' }, { 'art_id': '1', 'delta': '1' }])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_articles_stock(), { 1: 7, 2: 3, 3: 5 })
+
+    @override_settings(INVENTORY_STOCK_DELTA_BATCH_SIZE=1)
+    def test_negative_stock_rejects_every_delta(self) -> None:
+        # the rejected articles are in different batches, every one of them is reported.
+        response = self.apply_deltas([
+            { 'art_id': '1', 'delta': '-4' },
+            { 'art_id': '2', 'delta': '-5' },
+            { 'art_id': '3', 'delta': '2' },
+            { 'art_id': '3', 'delta': '-3' }
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            'deltas[1]: stock of article with id=2 can not be lower than zero, current stock is 3',
+            'deltas[2]: stock of article with id=3 can not be lower than zero, current stock is 0',
+            'deltas[3]: stock of article with id=3 can not be lower than zero, current stock is 0'
+        ])
+        self.assertEqual(self.get_articles_stock(), { 1: 10, 2: 3, 3: 0 })
+
+
+@override_settings(INVENTORY_STOCK_LEDGER=True)
+class LedgerStockDeltaTest(StockDeltaTest):
+    pass
+
+
+class BasketFeasibilityTest(InventoryTestCase):
+    def setUp(self) -> None:
+        # the chairs and the tables compete for the article 1, the stickers need no articles.
+        self.product_ids = self.create_catalogue(
+            { 1: 10, 2: 5 },
+            { 'chair': { 1: 4 }, 'table': { 1: 2, 2: 1 }, 'sticker': {} }
+        )
+
+    def get_feasibility(self, lines: List[Dict[str, int]]) -> dict:
+        response = self.client.post(reverse('basket-feasibility'), { 'lines': lines }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def line(self, name: str, quantity: int, feasible_quantity: int) -> Dict[str, int]:
+        return { 'product_id': self.product_ids[name], 'quantity': quantity, 'feasible_quantity': feasible_quantity }
+
+    def test_lines_are_served_in_order(self) -> None:
+        chairs_first = self.get_feasibility([
+            { 'product_id': self.product_ids['chair'], 'quantity': 2 },
+            { 'product_id': self.product_ids['table'], 'quantity': 3 }
+        ])
+        tables_first = self.get_feasibility([
+            { 'product_id': self.product_ids['table'], 'quantity': 3 },
+            { 'product_id': self.product_ids['chair'], 'quantity': 2 }
+        ])
+
+        self.assertEqual(chairs_first, {
+            'lines': [self.line('chair', 2, 2), self.line('table', 3, 1)],
+            'feasible': False,
+            'max_baskets': 0
+        })
+        self.assertEqual(tables_first, {
+            'lines': [self.line('table', 3, 3), self.line('chair', 2, 1)],
+            'feasible': False,
+            'max_baskets': 0
+        })
+        self.assertEqual(self.get_articles_stock(), { 1: 10, 2: 5 })
+
+    def test_max_baskets(self) -> None:
+        # every basket takes 6 units of the article 1 and 1 unit of the article 2.
+        feasibility = self.get_feasibility([
+            { 'product_id': self.product_ids['chair'], 'quantity': 1 },
+            { 'product_id': self.product_ids['table'], 'quantity': 1 },
+            { 'product_id': self.product_ids['sticker'], 'quantity': 4 }
+        ])
+
+        self.assertEqual(feasibility, {
+            'lines': [self.line('chair', 1, 1), self.line('table', 1, 1), self.line('sticker', 4, 4)],
+            'feasible': True,
+            'max_baskets': 1
+        })
+
+    def test_products_without_articles(self) -> None:
+        feasibility = self.get_feasibility([{ 'product_id': self.product_ids['sticker'], 'quantity': 1000 }])
+
+        self.assertEqual(feasibility, { 'lines': [self.line('sticker', 1000, 1000)], 'feasible': True, 'max_baskets': None })
+
+
+class AsyncViewTest(InventoryTestMixin, TransactionTestCase):
+    # the views read and write from the threads of the DB pool, which don't see the transaction of a TestCase. The
+    # query strings are part of the paths, the AsyncClient of Django 3.2 drops the `data` of GET requests.
+    def setUp(self) -> None:
+        cache.clear()
+        self.product_ids = self.create_catalogue({ 1: 10, 2: 1 }, { 'chair': { 1: 4 }, 'table': { 1: 1 }, 'lamp': { 2: 2 } })
+
+    async def test_availability_pages(self) -> None:
+        url = reverse('async-products-availability')
+        items = []
+        query = 'limit=2'
+        while True:
+            page = (await self.async_client.get(f'{url}?{query}')).json()
+            items.extend(page['results'])
+            if page['next_cursor'] is None:
+                break
+            query = f'limit=2&cursor={page["next_cursor"]}'
+
+        self.assertEqual(items, (await self.async_client.get(url)).json())
+        self.assertEqual(
+            [(item['name'], item['availability']) for item in items],
+            [('chair', 2), ('table', 10), ('lamp', 0)]
+        )
+
+    async def test_availability_stream_mode_is_rejected(self) -> None:
+        response = await self.async_client.get(f'{reverse("async-products-availability")}?mode=stream')
+
+        self.assertEqual(response.status_code, 400)
+
+    async def test_sell(self) -> None:
+        response = await self.async_client.post(reverse('async-sell-product', args=[self.product_ids['chair']]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await sync_to_async(self.get_articles_stock)(), { 1: 6, 2: 1 })
+
+    async def test_sell_without_enough_stock_is_rejected(self) -> None:
+        # the same answer as the sync endpoint.
+        response = await self.async_client.post(reverse('async-sell-product', args=[self.product_ids['lamp']]))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), { 'errors': [f'Product quantity is zero with id={self.product_ids["lamp"]}'] })
+        self.assertEqual(await sync_to_async(self.get_articles_stock)(), { 1: 10, 2: 1 })
+
+    @override_settings(INVENTORY_METRICS_SQL_SAMPLE_RATE=1.0)
+    async def test_sell_records_only_the_latency(self) -> None:
+        # the queries run in the threads of the DB pool, out of the reach of the metrics middleware.
+        before = await self.async_client.get(reverse('metrics'))
+
+        await self.async_client.post(reverse('async-sell-product', args=[self.product_ids['chair']]))
+
+        after = await self.async_client.get(reverse('metrics'))
+        sample = 'inventory_request_duration_seconds_count{view="async-sell-product",method="POST",status="200"}'
+        self.assertEqual(scrape_metric(after, sample) - scrape_metric(before, sample), 1)
+        sample = 'inventory_request_sql_queries_count{view="async-sell-product"}'
+        self.assertEqual(scrape_metric(after, sample) - scrape_metric(before, sample), 0)
+
+
+@override_settings(INVENTORY_STOCK_LEDGER=True)
+class StockLedgerCompactionTest(InventoryTestCase):
+    def setUp(self) -> None:
+        self.product_ids = self.create_catalogue({ 1: 0, 2: 4 }, { 'chair': { 1: 3 }, 'table': { 2: 1 } })
+
+    def test_every_pending_movement_of_an_article_is_folded(self) -> None:
+        # the chair is only sold thanks to the adjustment appended before it, the sale can't be folded without it.
+        self.client.post(reverse('articles-stock'), { 'deltas': [{ 'art_id': '1', 'delta': '5' }] }, content_type='application/json')
+        self.client.post(reverse('sell-product', args=[self.product_ids['table']]))
+        self.client.post(reverse('sell-product', args=[self.product_ids['chair']]))
+
+        compacted_count = StockLedgerBusiness().compact_movements(batch_size=1)
+
+        self.assertEqual(compacted_count, 3)
+        self.assertEqual(dict(Article.objects.values_list('id', 'stock')), { 1: 2, 2: 3 })
+        self.assertFalse(StockMovement.objects.filter(status=StockMovement.Status.PENDING).exists())
+        self.assertEqual(self.get_articles_stock(), { 1: 2, 2: 3 })
+
+    def test_sold_availability_is_refreshed_by_the_compaction(self) -> None:
+        table_id = self.product_ids['table']
+        self.client.post(reverse('sell-product', args=[table_id]))
+        self.assertEqual(ProductAvailabilityRepository().get_stored_availability([table_id]), { table_id: 4 })
+
+        StockLedgerBusiness().compact_movements()
+
+        self.assertEqual(ProductAvailabilityRepository().get_stored_availability([table_id]), { table_id: 3 })
+        self.assertEqual(ProductBusiness().verify_products_availability(100), [])
+
+    def test_availability_includes_the_pending_sells(self) -> None:
+        cache.clear()
+        table_id = self.product_ids['table']
+        self.client.post(reverse('sell-product', args=[table_id]))
+
+        response = self.client.get(reverse('products-availability'), { 'ids': str(table_id) })
+
+        self.assertEqual(response.json(), [{ 'id': table_id, 'name': 'table', 'availability': 3 }])
+        self.assertEqual(ProductAvailabilityRepository().get_stored_availability([table_id]), { table_id: 4 })
+
+    def test_reservations_are_appended_as_movements(self) -> None:
+        reservation = ReservationBusiness().reserve_product(self.product_ids['table'], ReservationRequestDBO(quantity=3, ttl_seconds=None))
+        ReservationBusiness().confirm_reservation(reservation.id)
+        released = ReservationBusiness().reserve_product(self.product_ids['table'], ReservationRequestDBO(quantity=1, ttl_seconds=None))
+        ReservationBusiness().release_reservation(released.id)
+
+        self.assertEqual(dict(Article.objects.values_list('id', 'reserved')), { 1: 0, 2: 0 })
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('kind', 'delta', 'reserved_delta')),
+            [('reservation', 0, 3), ('sale', -3, -3), ('reservation', 0, 1), ('release', 0, -1)]
+        )
+        self.assertEqual(ArticleRepository().get_articles_available_stock([2]), { 2: 1 })
+
+        StockLedgerBusiness().compact_movements()
+
+        self.assertEqual(list(Article.objects.order_by('id').values_list('id', 'stock', 'reserved')), [(1, 0, 0), (2, 1, 0)])
+
+    def test_uploads_keep_the_pending_reserved_units(self) -> None:
+        ReservationBusiness().reserve_product(self.product_ids['table'], ReservationRequestDBO(quantity=1, ttl_seconds=None))
+
+        ArticleBusiness().save_articles([ArticleDBO(id=2, name='article 2', stock=10)])
+
+        self.assertEqual(Article.objects.get(id=2).reserved, 1)
+        self.assertEqual(ArticleRepository().get_articles_available_stock([2]), { 2: 9 })
+
+
+@skipIf(availability_engine.np is None, 'the "engine" extra is not installed')
+class InventoryEngineTest(TestCase):
+    def setUp(self) -> None:
+        rng = random.Random(11)
+        ArticleBusiness().save_articles(ArticleUploadParser().parse(generate_articles_upload(LARGE_CATALOGUE, rng)))
+        ProductBusiness().save_products(ProductUploadParser().parse(generate_products_upload(LARGE_CATALOGUE, rng)))
+        self.engine = availability_engine.InventoryEngine()
+        self.engine.load()
+
+    def get_computed_availability(self) -> Dict[int, int]:
+        return { item.id: item.availability for item in ProductRepository().get_products_availability() }
+
+    def test_same_availability_as_the_db(self) -> None:
+        self.assertEqual(self.engine.get_products_availability(), self.get_computed_availability())
+
+    def test_stock_overrides(self) -> None:
+        stock_overrides = { 1: 0, 2: 0, 3: 1000000, 4: 7 }
+
+        what_if_availability = self.engine.get_products_availability(stock_overrides)
+
+        for (article_id, stock) in stock_overrides.items():
+            Article.objects.filter(id=article_id).update(stock=stock)
+        self.assertEqual(what_if_availability, self.get_computed_availability())
+        self.assertNotEqual(what_if_availability, self.engine.get_products_availability())
+
+    def test_stock_changes_match_a_full_reload(self) -> None:
+        new_article_stocks = { 1: 0, 2: 3, 5: 1000000, 9: 1 }
+        self.engine.apply_stock_changes(new_article_stocks)
+
+        for (article_id, stock) in new_article_stocks.items():
+            Article.objects.filter(id=article_id).update(stock=stock)
+        reloaded_engine = availability_engine.InventoryEngine()
+        reloaded_engine.load()
+        self.assertEqual(self.engine.get_products_availability(), reloaded_engine.get_products_availability())
+        self.assertEqual(self.engine.get_products_availability(), self.get_computed_availability())
+
+    def test_refresh_after_a_sell(self) -> None:
+        product_id = max(self.get_computed_availability().items(), key=lambda item: item[1])[0]
+        ProductBusiness().sell_product(product_id)
+        article_ids = ProductRequirement.objects.filter(product_id=product_id).values_list('article_id', flat=True)
+
+        self.engine.refresh_articles_stock(article_ids)
+
+        self.assertEqual(self.engine.get_products_availability(), self.get_computed_availability())
+
+    def test_what_if_command(self) -> None:
+        product_id = ProductRequirement.objects.filter(article_id=1).values_list('product_id', flat=True).first()
+        output = io.StringIO()
+
+        call_command('what_if_availability', '--stock', '1=0', stdout=output)
+
+        self.assertIn(f'product id={product_id}: availability=', output.getvalue())
+        self.assertIn(' what-if=0\n', output.getvalue())
+
+
+@override_settings(INVENTORY_UPLOAD_BATCH_SIZE=2, INVENTORY_UPLOAD_JOB_STALE_SECONDS=60)
+class UploadJobTest(InventoryTestCase):
+    def setUp(self) -> None:
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.create_catalogue({ 1: 10 }, {})
+
+    def create_job(self, kind: str, payload: dict) -> str:
+        return UploadJobBusiness().create_job(kind, ContentFile(json.dumps(payload).encode('utf-8'), name='upload.json')).id
+
+    def run_jobs(self) -> None:
+        call_command('process_upload_jobs', stdout=io.StringIO())
+
+    def test_product_names_are_unique_in_the_whole_file(self) -> None:
+        products = [{ 'name': name, 'contain_articles': [{ 'art_id': '1', 'amount_of': '1' }] } for name in ['p1', 'p2', 'p3', 'p1']]
+        job_id = self.create_job(UploadJob.Kind.PRODUCTS, { 'products': products })
+
+        self.run_jobs()
+
+        job = UploadJobBusiness().get_job(job_id)
+        self.assertEqual(job.status, UploadJob.Status.FAILED)
+        self.assertEqual(job.errors, ['Products already exist with names: p1'])
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_interrupted_jobs_are_resumed(self) -> None:
+        articles = [{ 'art_id': str(id), 'name': f'article {id}', 'stock': '5' } for id in range(2, 7)]
+        job_id = self.create_job(UploadJob.Kind.ARTICLES, { 'inventory': articles })
+        # the first three articles were applied before the web server was restarted.
+        UploadJob.objects.filter(id=job_id).update(
+            status=UploadJob.Status.APPLYING,
+            total_count=5,
+            processed_count=3,
+            heartbeat_at=timezone.now() - timedelta(seconds=61)
+        )
+
+        self.run_jobs()
+
+        job = UploadJobBusiness().get_job(job_id)
+        self.assertEqual(job.status, UploadJob.Status.SUCCEEDED)
+        self.assertEqual(job.processed_count, 5)
+        self.assertEqual(self.get_articles_stock(), { 1: 10, 5: 5, 6: 5 })
+
+    def test_running_jobs_are_not_resumed(self) -> None:
+        job_id = self.create_job(UploadJob.Kind.ARTICLES, { 'inventory': [] })
+        UploadJob.objects.filter(id=job_id).update(status=UploadJob.Status.VALIDATING, heartbeat_at=timezone.now())
+
+        self.run_jobs()
+
+        self.assertEqual(UploadJobBusiness().get_job(job_id).status, UploadJob.Status.VALIDATING)
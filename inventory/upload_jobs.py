@@ -0,0 +1,125 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional, Set
+from django.conf import settings
+from django.db import connections, transaction
+
+from .db_routers import routing_scope
+from .models import UploadJob
+from .metrics import observe_upload_batches
+from .upload_parsers import ArticleUploadParser, ProductUploadParser, InvalidDataUploadError
+from .business_logic import ArticleBusiness, ProductBusiness, UploadJobBusiness, BusinessValidationError
+
+logger = logging.getLogger(__name__)
+
+
+class UploadJobRunner:
+    def __init__(self) -> None:
+        self._upload_job_business = UploadJobBusiness()
+        self._article_upload_parser = ArticleUploadParser()
+        self._product_upload_parser = ProductUploadParser()
+        self._article_business = ArticleBusiness()
+        self._product_business = ProductBusiness()
+
+    def run_job(self, job_id: str) -> None:
+        if not self._upload_job_business.claim_job(job_id) and not self._upload_job_business.claim_interrupted_job(job_id):
+            return
+
+        job = self._upload_job_business.get_job(job_id)
+        try:
+            # the whole file is validated before writing anything, each batch is then applied in its own transaction
+            # so the progress of the job is visible while it runs. A job interrupted while applying resumes after the
+            # last applied batch, the progress is saved with it.
+            if job.status == UploadJob.Status.APPLYING:
+                processed_count = job.processed_count
+            else:
+                total_count = self._validate(job.id, job.kind)
+                self._upload_job_business.start_applying_job(job.id, total_count)
+                processed_count = 0
+            batches = self._parse_batches(job.id, job.kind, skip_count=processed_count)
+            for batch in observe_upload_batches(job.kind, batches):
+                with transaction.atomic():
+                    self._save_batch(job.kind, batch)
+                    processed_count += len(batch)
+                    self._upload_job_business.report_job_progress(job.id, processed_count)
+        except InvalidDataUploadError as exception:
+            self._upload_job_business.finish_job(job.id, list(exception.errors))
+        except BusinessValidationError as exception:
+            self._upload_job_business.finish_job(job.id, [str(exception)])
+        except Exception as exception:
+            self._upload_job_business.finish_job(job.id, [f'Unexpected error: {str(exception)}'])
+            raise
+        else:
+            self._upload_job_business.finish_job(job.id, [])
+
+    def _validate(self, job_id: str, kind: str) -> int:
+        # product names must be unique in the whole file, not only in each batch.
+        total_count = 0
+        uploaded_names: Set[str] = set()
+        for batch in self._parse_batches(job_id, kind):
+            if kind == UploadJob.Kind.PRODUCTS:
+                self._product_business.validate_products(batch, uploaded_names)
+            total_count += len(batch)
+            self._upload_job_business.report_job_alive(job_id)
+
+        return total_count
+
+    def _parse_batches(self, job_id: str, kind: str, skip_count: int = 0) -> Iterator[List[Any]]:
+        parser = self._product_upload_parser if kind == UploadJob.Kind.PRODUCTS else self._article_upload_parser
+        with self._upload_job_business.open_job_file(job_id) as file:
+            for batch in parser.parse_stream(file, get_upload_job_batch_size()):
+                if skip_count < len(batch):
+                    yield batch[skip_count:]
+                skip_count = max(0, skip_count - len(batch))
+
+    def _save_batch(self, kind: str, batch: List[Any]) -> None:
+        if kind == UploadJob.Kind.PRODUCTS:
+            self._product_business.save_products(batch)
+        else:
+            self._article_business.save_articles(batch)
+
+
+class UploadJobWorkerPool:
+    def __init__(self, max_workers: int) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-job')
+
+    def submit(self, job_id: str) -> None:
+        self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id: str) -> None:
+        try:
+            run_upload_job(job_id)
+        finally:
+            # worker threads open their own DB connections.
+            connections.close_all()
+
+
+def run_upload_job(job_id: str) -> None:
+    # jobs write to the primary, their validation reads must see the uploads applied just before them.
+    try:
+        with routing_scope(pinned=True):
+            UploadJobRunner().run_job(job_id)
+    except Exception:
+        logger.exception('Upload job %s could not be run', job_id)
+
+
+def schedule_upload_job(job_id: str) -> None:
+    # the job row must be committed before a worker can claim it.
+    transaction.on_commit(lambda: get_worker_pool().submit(job_id))
+
+
+def get_upload_job_batch_size() -> int:
+    return getattr(settings, 'INVENTORY_UPLOAD_BATCH_SIZE', 1000)
+
+
+_worker_pool: Optional[UploadJobWorkerPool] = None
+_worker_pool_lock = threading.Lock()
+
+def get_worker_pool() -> UploadJobWorkerPool:
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = UploadJobWorkerPool(getattr(settings, 'INVENTORY_UPLOAD_JOB_WORKERS', 2))
+
+        return _worker_pool
@@ -1,5 +1,23 @@
-from typing import List, Any, Dict, Callable, Iterable
-from .data_business_objects import CreateProductDBO, CreateProductRequirementDBO, ArticleDBO
+import codecs
+import json
+import multiprocessing
+import os
+import re
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import List, Any, Dict, Callable, Iterable, Iterator, IO, Optional, Tuple
+from django.conf import settings
+from .data_business_objects import (
+    CreateProductDBO,
+    CreateProductRequirementDBO,
+    ArticleDBO,
+    OrderLineDBO,
+    StockDeltaDBO,
+    ReservationRequestDBO
+)
 
 class InvalidDataUploadError(Exception):
     def __init__(self, *errors: str) -> None:
@@ -39,10 +57,17 @@ class UploadParser:
 
         return value
 
-    def parse_list_items(self, obj_list: Iterable[Any], parser_fn: Callable[[dict, str], Any], obj_context: str) -> List[Any]:
+    def parse_list_items(
+        self,
+        obj_list: Iterable[Any],
+        parser_fn: Callable[[dict, str], Any],
+        obj_context: str,
+        start_index: int = 0
+    ) -> List[Any]:
+        # start_index is the position of the first item when obj_list is a slice of the list.
         parsed_items = []
         format_errors = []
-        for index, item in enumerate(obj_list):
+        for index, item in enumerate(obj_list, start_index):
             try:
                 parsed_items.append(parser_fn(item, f'{obj_context}[{index}]'))
             except InvalidDataUploadError as exception:
@@ -53,6 +78,140 @@ class UploadParser:
 
         return parsed_items
 
+    def parse_list_items_in_batches(
+        self,
+        obj_list: Iterable[Any],
+        parser_fn: Callable[[dict, str], Any],
+        obj_context: str,
+        batch_size: int
+    ) -> Iterator[List[Any]]:
+        batch = []
+        for index, item in enumerate(obj_list):
+            batch.append(parser_fn(item, f'{obj_context}[{index}]'))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if len(batch) > 0:
+            yield batch
+
+
+NUMBER_CHARACTERS = re.compile(r'[0-9.eE+-]*')
+# a surrogate pair escape (\uXXXX\uXXXX) and the character the decoder checks after it.
+MAX_TRUNCATED_TOKEN_LENGTH = 16
+
+
+# Reads the items of a list attribute of a JSON object incrementally from a binary stream.
+# Only the item being decoded is kept in memory, so files of any size can be processed.
+class JSONListStreamReader:
+    def __init__(self, stream: IO[bytes], chunk_size: int = 64 * 1024) -> None:
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._json_decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+
+    def iter_list_field(self, field_name: str, obj_context: str) -> Iterator[Any]:
+        self._expect('{')
+        if self._consume_if('}'):
+            raise InvalidUploadAttributeError(obj_context, field_name, 'not found')
+
+        while True:
+            key = self._decode_value()
+            if not isinstance(key, str):
+                raise InvalidDataUploadError('Invalid JSON structure. Expected object key')
+            self._expect(':')
+            if key == field_name:
+                yield from self._iter_list_items(field_name, obj_context)
+                self._skip_object_end()
+                return
+
+            self._decode_value()
+            if not self._consume_if(','):
+                self._expect('}')
+                raise InvalidUploadAttributeError(obj_context, field_name, 'not found')
+
+    def _skip_object_end(self) -> None:
+        # the attributes after the list are validated but ignored, and nothing but whitespace can follow the object
+        # (like json.loads).
+        while self._consume_if(','):
+            if not isinstance(self._decode_value(), str):
+                raise InvalidDataUploadError('Invalid JSON structure. Expected object key')
+            self._expect(':')
+            self._decode_value()
+        self._expect('}')
+        if self._peek() != '':
+            raise InvalidDataUploadError(f'Invalid JSON structure. Extra data after the object, found "{self._peek()}"')
+
+    def _iter_list_items(self, field_name: str, obj_context: str) -> Iterator[Any]:
+        if self._peek() != '[':
+            raise InvalidUploadAttributeError(obj_context, field_name, 'expected list')
+        self._position += 1
+        if self._consume_if(']'):
+            return
+
+        while True:
+            yield self._decode_value()
+            if not self._consume_if(','):
+                self._expect(']')
+                return
+
+    def _decode_value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._position)
+                # a value followed only by number characters may be a truncated number (e.g. `1.` of `1.5`), read
+                # further to confirm it.
+                if NUMBER_CHARACTERS.match(self._buffer, end).end() < len(self._buffer) or self._eof:
+                    self._position = end
+                    return value
+            except json.decoder.JSONDecodeError as exception:
+                # the value can't be completed by the next chunk when the error is more than a chunk (and more than
+                # a truncated token, e.g. an escape sequence) before the end of the buffer: reading the rest of the
+                # file to fail at the end would keep it all in memory. Only a string can span chunks before its error
+                # position (its start) and still be valid.
+                truncated = exception.msg.startswith('Unterminated string') or \
+                    len(self._buffer) - exception.pos <= max(self._chunk_size, MAX_TRUNCATED_TOKEN_LENGTH)
+                if self._eof or not truncated:
+                    raise InvalidDataUploadError(f'Invalid JSON structure. {str(exception)}') from exception
+            self._read_chunk()
+
+    def _expect(self, char: str) -> None:
+        if not self._consume_if(char):
+            found = self._peek() or 'end of file'
+            raise InvalidDataUploadError(f'Invalid JSON structure. Expected "{char}", found "{found}"')
+
+    def _consume_if(self, char: str) -> bool:
+        if self._peek() == char:
+            self._position += 1
+            return True
+
+        return False
+
+    def _peek(self) -> str:
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position].isspace():
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if self._eof:
+                return ''
+            self._read_chunk()
+
+    def _read_chunk(self) -> None:
+        self._buffer = self._buffer[self._position:]
+        self._position = 0
+        # grow the read size with the pending buffer so a large single value is not decoded quadratically.
+        chunk = self._stream.read(max(self._chunk_size, len(self._buffer)))
+        if not chunk:
+            self._eof = True
+            self._buffer += self._text_decoder.decode(b'', final=True)
+        else:
+            self._buffer += self._text_decoder.decode(chunk)
+
 
 class ArticleUploadParser:
     def __init__(self) -> None:
@@ -62,6 +221,10 @@ class ArticleUploadParser:
         articles = self._parser.parse_list_field(data, 'inventory', 'root')
         return self._parser.parse_list_items(articles, self._parse_article, 'inventory')
 
+    def parse_stream(self, stream: IO[bytes], batch_size: int) -> Iterator[List[ArticleDBO]]:
+        articles = JSONListStreamReader(stream).iter_list_field('inventory', 'root')
+        return self._parser.parse_list_items_in_batches(articles, self._parse_article, 'inventory', batch_size)
+
     def _parse_article(self, article: dict, obj_context: str) -> ArticleDBO:
         article_id = self._parser.parse_numeric_field(article, 'art_id', obj_context)
         name = self._parser.parse_string_field(article, 'name', obj_context)
@@ -78,6 +241,57 @@ class ProductUploadParser:
         products = self._parser.parse_list_field(data, 'products', 'root')
         return self._parser.parse_list_items(products, self._parse_product, 'products')
 
+    def parse_upload(self, data: dict) -> List[CreateProductDBO]:
+        # the pool only pays off for uploads above INVENTORY_PARALLEL_PARSE_MIN_PRODUCTS, measured with the
+        # `benchmark` command on the deployment hosts. Disabled by default.
+        min_products = get_parallel_parse_min_products()
+        products = data.get('products') if isinstance(data, dict) else None
+        if min_products > 0 and isinstance(products, list) and len(products) >= min_products:
+            return self.parse_in_parallel(data)
+
+        return self.parse(data)
+
+    def parse_in_parallel(self, data: dict, chunk_size: Optional[int] = None) -> List[CreateProductDBO]:
+        # validates chunks of the products in a pool of processes, errors keep the products[i] path of the whole
+        # list. Like parse, it fails with the error of the first invalid product. Short lists are not worth
+        # sending to the processes.
+        products = self._parser.parse_list_field(data, 'products', 'root')
+        chunk_size = chunk_size or get_parallel_parse_chunk_size()
+        workers = get_parse_workers()
+        if workers <= 1 or len(products) < 2 * chunk_size:
+            return self._parser.parse_list_items(products, self._parse_product, 'products')
+
+        chunks = [(start, products[start:start + chunk_size]) for start in range(0, len(products), chunk_size)]
+        parsed_products: List[CreateProductDBO] = []
+        pool = get_parse_pool()
+        try:
+            for (names, requirement_counts, article_ids, quantities, errors) in pool.map(parse_products_chunk, chunks):
+                if len(errors) > 0:
+                    raise InvalidDataUploadError(*errors)
+                requirements = zip(article_ids, quantities)
+                parsed_products.extend(
+                    CreateProductDBO(
+                        name=name,
+                        requirements=[
+                            CreateProductRequirementDBO(article_id=article_id, quantity=quantity)
+                            for (article_id, quantity) in islice(requirements, requirement_count)
+                        ]
+                    )
+                    for (name, requirement_count) in zip(names, requirement_counts)
+                )
+        except BrokenProcessPool:
+            discard_parse_pool(pool)
+            raise
+
+        return parsed_products
+
+    def parse_chunk(self, start_index: int, products: List[Any]) -> List[CreateProductDBO]:
+        return self._parser.parse_list_items(products, self._parse_product, 'products', start_index)
+
+    def parse_stream(self, stream: IO[bytes], batch_size: int) -> Iterator[List[CreateProductDBO]]:
+        products = JSONListStreamReader(stream).iter_list_field('products', 'root')
+        return self._parser.parse_list_items_in_batches(products, self._parse_product, 'products', batch_size)
+
     def _parse_product(self, item: dict, obj_context: str) -> CreateProductDBO:
         name = self._parser.parse_string_field(item, 'name', obj_context)
         requirement_items = self._parser.parse_list_field(item, 'contain_articles', obj_context)
@@ -93,4 +307,123 @@ class ProductUploadParser:
             raise InvalidDataUploadError(obj_context, 'quantity', 'expected value greater than 0')
 
         return CreateProductRequirementDBO(article_id=article_id, quantity=quantity)
-        
\ No newline at end of file
+
+
+class OrderParser:
+    def __init__(self) -> None:
+        self._parser = UploadParser()
+
+    def parse(self, data: Any) -> List[OrderLineDBO]:
+        if not isinstance(data, dict):
+            raise InvalidDataUploadError('attribute root: expected object')
+        lines = self._parser.parse_list_field(data, 'lines', 'root')
+        return self._parser.parse_list_items(lines, self._parse_line, 'lines')
+
+    def _parse_line(self, line: dict, obj_context: str) -> OrderLineDBO:
+        product_id = self._parser.parse_numeric_field(line, 'product_id', obj_context)
+        quantity = self._parser.parse_numeric_field(line, 'quantity', obj_context)
+
+        if quantity <= 0:
+            raise InvalidUploadAttributeError(obj_context, 'quantity', 'expected value greater than 0')
+
+        return OrderLineDBO(product_id=product_id, quantity=quantity)
+
+
+class StockDeltaParser:
+    def __init__(self) -> None:
+        self._parser = UploadParser()
+
+    def parse(self, data: Any) -> List[StockDeltaDBO]:
+        if not isinstance(data, dict):
+            raise InvalidDataUploadError('attribute root: expected object')
+        deltas = self._parser.parse_list_field(data, 'deltas', 'root')
+        return self._parser.parse_list_items(deltas, self._parse_delta, 'deltas')
+
+    def _parse_delta(self, delta: dict, obj_context: str) -> StockDeltaDBO:
+        article_id = self._parser.parse_numeric_field(delta, 'art_id', obj_context)
+        stock_delta = self._parser.parse_numeric_field(delta, 'delta', obj_context)
+
+        return StockDeltaDBO(article_id=article_id, delta=stock_delta)
+
+
+class ReservationParser:
+    # both attributes are optional, by default one unit is reserved for the configured TTL.
+    def __init__(self) -> None:
+        self._parser = UploadParser()
+
+    def parse(self, data: Any) -> ReservationRequestDBO:
+        if not isinstance(data, dict):
+            raise InvalidDataUploadError('attribute root: expected object')
+        quantity = self._parse_optional_positive_field(data, 'quantity')
+        ttl_seconds = self._parse_optional_positive_field(data, 'ttl_seconds')
+
+        return ReservationRequestDBO(quantity=quantity or 1, ttl_seconds=ttl_seconds)
+
+    def _parse_optional_positive_field(self, data: dict, field_name: str) -> Optional[int]:
+        if data.get(field_name) is None:
+            return None
+        value = self._parser.parse_numeric_field(data, field_name, 'root')
+        if value <= 0:
+            raise InvalidUploadAttributeError('root', field_name, 'expected value greater than 0')
+
+        return value
+
+
+# Pool validating the products of large uploads, started on the first parallel parse and shared by the following
+# ones. Its processes are started with forkserver (or spawn) rather than forked from the threaded web process, which
+# would copy its open database connections and the locks held by other threads, so the chunks are sent to them.
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=get_parse_workers(),
+                mp_context=multiprocessing.get_context(start_method)
+            )
+
+        return _parse_pool
+
+
+def discard_parse_pool(pool: ProcessPoolExecutor) -> None:
+    # a pool whose process died can't run tasks anymore, the next parallel parse starts a new one.
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False)
+
+
+def parse_products_chunk(chunk: Tuple[int, List[Any]]) -> Tuple[List[str], array, array, array, Tuple[str, ...]]:
+    # runs in the parse pool. The requirements are sent back as flat integer arrays, much cheaper to pickle than data
+    # objects or a tuple per requirement, and errors are returned since they are not picklable.
+    (start, products) = chunk
+    (requirement_counts, article_ids, quantities) = (array('q'), array('q'), array('q'))
+    try:
+        parsed_products = ProductUploadParser().parse_chunk(start, products)
+    except InvalidDataUploadError as exception:
+        return ([], requirement_counts, article_ids, quantities, tuple(exception.errors))
+
+    for product in parsed_products:
+        requirement_counts.append(len(product.requirements))
+        for requirement in product.requirements:
+            article_ids.append(requirement.article_id)
+            quantities.append(requirement.quantity)
+
+    return ([product.name for product in parsed_products], requirement_counts, article_ids, quantities, ())
+
+
+def get_parse_workers() -> int:
+    return getattr(settings, 'INVENTORY_PARSE_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_parallel_parse_chunk_size() -> int:
+    return getattr(settings, 'INVENTORY_PARALLEL_PARSE_CHUNK_SIZE', 20000)
+
+
+def get_parallel_parse_min_products() -> int:
+    return getattr(settings, 'INVENTORY_PARALLEL_PARSE_MIN_PRODUCTS', 0)
@@ -1,10 +1,21 @@
 from django.urls import path
 
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('products/availability', views.ProductsAvailabilityView.as_view(), name='products-availability'),
-    path('products/<int:product_id>/sell', views.SellProductView.as_view(), name='products-availability'),
+    path('products/<int:product_id>/sell', views.SellProductView.as_view(), name='sell-product'),
     path('products/upload', views.UploadProductsView.as_view(), name='upload-products'),
+    path('products/<int:product_id>/reserve', views.ReserveProductView.as_view(), name='reserve-product'),
+    path('orders', views.OrderView.as_view(), name='orders'),
+    path('baskets/feasibility', views.BasketFeasibilityView.as_view(), name='basket-feasibility'),
+    path('reservations/<uuid:reservation_id>', views.ReservationView.as_view(), name='reservation'),
+    path('reservations/<uuid:reservation_id>/confirm', views.ConfirmReservationView.as_view(), name='confirm-reservation'),
+    path('reservations/<uuid:reservation_id>/release', views.ReleaseReservationView.as_view(), name='release-reservation'),
     path('articles/upload', views.UploadArticlesView.as_view(), name='upload-articles'),
+    path('articles/stock', views.ArticlesStockDeltaView.as_view(), name='articles-stock'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
+    path('jobs/<uuid:job_id>', views.UploadJobView.as_view(), name='upload-job'),
+    path('async/products/availability', async_views.products_availability_view, name='async-products-availability'),
+    path('async/products/<int:product_id>/sell', async_views.sell_product_view, name='async-sell-product'),
 ]
@@ -1,6 +1,17 @@
 import json
-from typing import Any
+import hashlib
+from typing import Any, Optional, Iterator, List
 from dataclasses import asdict
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.http import StreamingHttpResponse, HttpResponse, HttpResponseNotModified, QueryDict
+from django.http.response import HttpResponseBase
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
 from rest_framework.views import APIView
 from rest_framework.request import Request
 from rest_framework.response import Response
@@ -10,12 +21,26 @@ from rest_framework import status
 from .upload_parsers import (
     ProductUploadParser,
     ArticleUploadParser,
+    OrderParser,
+    ReservationParser,
+    StockDeltaParser,
     InvalidDataUploadError
 )
+from .models import UploadJob
+from .renderers import render_json
+from .db_routers import iterate_in_routing_scope
+from .data_business_objects import ArticleUploadResultDBO
+from .metrics import observe_upload_parse, observe_upload_batches, render_metrics
+from .upload_jobs import schedule_upload_job
 from .business_logic import (
     ArticleBusiness,
     ProductBusiness,
-    BusinessValidationError
+    InventoryVersionBusiness,
+    UploadJobBusiness,
+    ReservationBusiness,
+    BusinessValidationError,
+    OrderNotAvailableError,
+    StockDeltaRejectedError
 )
 
 class JSONFileParser(FileUploadParser):
@@ -24,6 +49,10 @@ class JSONFileParser(FileUploadParser):
 
 class APIVieWithErrorHandling(APIView):
     def handle_exception(self, exc: Exception) -> Response:
+        if isinstance(exc, OrderNotAvailableError):
+            return Response({ 'errors': exc.line_errors }, status=status.HTTP_400_BAD_REQUEST)
+        if isinstance(exc, StockDeltaRejectedError):
+            return Response({ 'errors': exc.delta_errors }, status=status.HTTP_400_BAD_REQUEST)
         if isinstance(exc, BusinessValidationError):
             return Response({ 'errors': [str(exc)] }, status=status.HTTP_400_BAD_REQUEST)
         if isinstance(exc, InvalidDataUploadError):
@@ -32,30 +61,212 @@ class APIVieWithErrorHandling(APIView):
         return super().handle_exception(exc)
 
 
-def read_upload_file_content(request: Request) -> dict:
+def get_upload_file(request: Request) -> UploadedFile:
     file = request.data.get('file')
     if file is None:
         raise InvalidDataUploadError('expected key "file" in payload')
+
+    return file
+
+
+def read_upload_file_content(request: Request) -> dict:
+    file = get_upload_file(request)
     try:
         return json.load(file)
     except json.decoder.JSONDecodeError as exception:
         raise InvalidDataUploadError(f'Invalid JSON structure. {str(exception)}') from exception
 
 
+def is_streaming_upload(request: Request) -> bool:
+    return request.query_params.get('mode') == 'stream'
+
+
+def is_async_upload(request: Request) -> bool:
+    return request.query_params.get('mode') == 'async'
+
+
+class ArticleUploadFingerprint:
+    # Byte-identical article files are acknowledged without reading the articles while the inventory version is still
+    # the one left by the previous upload of the file. The version set by the upload is only remembered when no other
+    # change was made since the version was read before it, so nothing else can hide behind it.
+    def __init__(self, file: UploadedFile, version: int) -> None:
+        digest = hashlib.sha256()
+        for chunk in file.chunks():
+            digest.update(chunk)
+        file.seek(0)
+        self._cache_key = f'inventory:article-upload:{digest.hexdigest()}'
+        self._version = version
+        self._result: Optional[ArticleUploadResultDBO] = None
+        self._bumped_version: Optional[int] = None
+
+    def get_applied_article_count(self) -> Optional[int]:
+        applied_upload = cache.get(self._cache_key)
+        if applied_upload is None or applied_upload[0] != self._version:
+            return None
+
+        return applied_upload[1]
+
+    def set_result(self, result: ArticleUploadResultDBO) -> None:
+        self._result = result
+        if result.created + result.updated == 0:
+            # nothing was written, the version read before the upload still describes the articles.
+            transaction.on_commit(lambda: self._remember(self._version))
+        elif self._bumped_version is not None:
+            # outside a request transaction the version is bumped before the result reaches the view.
+            self._remember(self._bumped_version)
+
+    def remember_on_version_bump(self, version: int) -> None:
+        if version != self._version + 1:
+            return
+        self._bumped_version = version
+        if self._result is not None:
+            self._remember(version)
+
+    def _remember(self, version: int) -> None:
+        article_count = self._result.created + self._result.updated + self._result.unchanged  # type: ignore
+        cache.set(self._cache_key, (version, article_count), get_article_upload_fingerprint_timeout())
+
+
+def create_upload_job(request: Request, kind: str) -> Response:
+    job = UploadJobBusiness().create_job(kind, get_upload_file(request))
+    schedule_upload_job(job.id)
+
+    return Response(
+        { 'job_id': job.id, 'status_url': reverse('upload-job', kwargs={ 'job_id': job.id }) },
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+def get_upload_batch_size() -> int:
+    return getattr(settings, 'INVENTORY_UPLOAD_BATCH_SIZE', 1000)
+
+
+def get_article_upload_fingerprint_timeout() -> int:
+    return getattr(settings, 'INVENTORY_ARTICLE_UPLOAD_FINGERPRINT_TIMEOUT', 86400)
+
+
+def get_availability_chunk_size() -> int:
+    return getattr(settings, 'INVENTORY_AVAILABILITY_CHUNK_SIZE', 1000)
+
+
+def get_availability_cache_timeout() -> int:
+    return getattr(settings, 'INVENTORY_AVAILABILITY_CACHE_TIMEOUT', 300)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    etags = [tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(if_none_match)]
+
+    return '*' in etags or etag in etags
+
+
+def parse_positive_query_param(query_params: QueryDict, name: str) -> Optional[int]:
+    value = query_params.get(name)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError as exception:
+        raise InvalidDataUploadError(f'query parameter {name}: expected number') from exception
+    if number <= 0:
+        raise InvalidDataUploadError(f'query parameter {name}: expected value greater than 0')
+
+    return number
+
+
+def parse_ids_query_param(query_params: QueryDict, name: str) -> Optional[List[int]]:
+    value = query_params.get(name)
+    if value is None:
+        return None
+    try:
+        return [int(id) for id in value.split(',')]
+    except ValueError as exception:
+        raise InvalidDataUploadError(f'query parameter {name}: expected comma separated numbers') from exception
+
+
+def get_inventory_etag(inventory_version_business: InventoryVersionBusiness) -> str:
+    return f'"inventory-{inventory_version_business.get_version()}"'
+
+
+def get_products_availability_body(
+    product_business: ProductBusiness,
+    etag: str,
+    full_path: str,
+    query_params: QueryDict
+) -> bytes:
+    # rendered pages are cached per inventory version and query, a new version makes every previous entry unreachable.
+    cursor = parse_positive_query_param(query_params, 'cursor')
+    limit = parse_positive_query_param(query_params, 'limit')
+    min_availability = parse_positive_query_param(query_params, 'min_availability')
+    product_ids = parse_ids_query_param(query_params, 'ids')
+    path_hash = hashlib.sha1(full_path.encode()).hexdigest()
+    cache_key = f'inventory:products-availability:{etag}:{path_hash}'
+    body = cache.get(cache_key)
+    if body is None:
+        products_availability = product_business.get_products_availability(
+            cursor,
+            limit,
+            min_availability,
+            product_ids
+        )
+        if limit is None:
+            body = render_json(products_availability)
+        else:
+            next_cursor = products_availability[-1].id if len(products_availability) == limit else None
+            body = render_json({ 'results': products_availability, 'next_cursor': next_cursor })
+        cache.set(cache_key, body, get_availability_cache_timeout())
+
+    return body
+
+
 class UploadArticlesView(APIVieWithErrorHandling):
     parser_classes = [JSONFileParser]
 
     def __init__(self, **kwargs: Any) -> None:
         self._article_upload_parser = ArticleUploadParser()
         self._article_business = ArticleBusiness()
+        self._inventory_version_business = InventoryVersionBusiness()
         super().__init__(**kwargs)
 
     def post(self, request: Request) -> Response:
-        data = read_upload_file_content(request)
-        articles = self._article_upload_parser.parse(data)
-        self._article_business.save_articles(articles)
+        if is_async_upload(request):
+            return create_upload_job(request, UploadJob.Kind.ARTICLES)
+
+        fingerprint = ArticleUploadFingerprint(get_upload_file(request), self._inventory_version_business.get_version())
+        article_count = fingerprint.get_applied_article_count()
+        if article_count is not None:
+            return Response(asdict(ArticleUploadResultDBO(created=0, updated=0, unchanged=article_count)), status=status.HTTP_200_OK)
+
+        if is_streaming_upload(request):
+            article_batches = self._article_upload_parser.parse_stream(get_upload_file(request), get_upload_batch_size())
+            result = self._article_business.save_articles_in_batches(
+                observe_upload_batches(UploadJob.Kind.ARTICLES, article_batches),
+                fingerprint.remember_on_version_bump
+            )
+        else:
+            data = read_upload_file_content(request)
+            articles = observe_upload_parse(UploadJob.Kind.ARTICLES, self._article_upload_parser.parse, data)
+            result = self._article_business.save_articles(articles, fingerprint.remember_on_version_bump)
+        fingerprint.set_result(result)
+
+        return Response(
+            asdict(result),
+            status=status.HTTP_201_CREATED if result.created + result.updated > 0 else status.HTTP_200_OK
+        )
 
-        return Response(status=status.HTTP_201_CREATED)
+
+class ArticlesStockDeltaView(APIVieWithErrorHandling):
+    def __init__(self, **kwargs: Any) -> None:
+        self._stock_delta_parser = StockDeltaParser()
+        self._article_business = ArticleBusiness()
+        super().__init__(**kwargs)
+
+    def post(self, request: Request) -> Response:
+        deltas = self._stock_delta_parser.parse(request.data)
+        self._article_business.apply_stock_deltas(deltas)
+
+        return Response(status=status.HTTP_200_OK)
 
 
 class UploadProductsView(APIVieWithErrorHandling):
@@ -67,25 +278,63 @@ class UploadProductsView(APIVieWithErrorHandling):
         super().__init__(**kwargs)
 
     def post(self, request: Request) -> Response:
+        if is_async_upload(request):
+            return create_upload_job(request, UploadJob.Kind.PRODUCTS)
+        if is_streaming_upload(request):
+            product_batches = self._product_upload_parser.parse_stream(get_upload_file(request), get_upload_batch_size())
+            self._product_business.save_products_in_batches(observe_upload_batches(UploadJob.Kind.PRODUCTS, product_batches))
+            return Response(status=status.HTTP_201_CREATED)
+
         data = read_upload_file_content(request)
-        products = self._product_upload_parser.parse(data)
+        products = observe_upload_parse(UploadJob.Kind.PRODUCTS, self._product_upload_parser.parse_upload, data)
         self._product_business.save_products(products)
 
         return Response(status=status.HTTP_201_CREATED)
 
 
+# read-only, not wrapping it in a transaction lets its reads go to a replica (see db_routers).
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class ProductsAvailabilityView(APIVieWithErrorHandling):
     def __init__(self, **kwargs: Any) -> None:
         self._product_business = ProductBusiness()
+        self._inventory_version_business = InventoryVersionBusiness()
         super().__init__(**kwargs)
 
-    def get(self,request: Request) -> Response:
-        products_availability = self._product_business.get_products_availability()
+    def get(self, request: Request) -> HttpResponseBase:
+        # the inventory version identifies the content, unchanged inventories are answered without reading products.
+        etag = get_inventory_etag(self._inventory_version_business)
+        if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+            return HttpResponseNotModified(headers={ 'ETag': etag })
 
-        return Response(
-            [asdict(item) for item in products_availability],
-            status=status.HTTP_200_OK
+        if request.query_params.get('mode') == 'stream':
+            return StreamingHttpResponse(
+                iterate_in_routing_scope(self._stream_products_availability(
+                    parse_positive_query_param(request.query_params, 'min_availability'),
+                    parse_ids_query_param(request.query_params, 'ids')
+                )),
+                content_type='application/json',
+                status=status.HTTP_200_OK,
+                headers={ 'ETag': etag }
+            )
+
+        body = get_products_availability_body(self._product_business, etag, request.get_full_path(), request.query_params)
+
+        return HttpResponse(body, content_type='application/json', status=status.HTTP_200_OK, headers={ 'ETag': etag })
+
+    def _stream_products_availability(
+        self,
+        min_availability: Optional[int],
+        product_ids: Optional[List[int]]
+    ) -> Iterator[bytes]:
+        yield b'['
+        products_availability = self._product_business.iter_products_availability(
+            get_availability_chunk_size(),
+            min_availability,
+            product_ids
         )
+        for index, item in enumerate(products_availability):
+            yield (b',' if index > 0 else b'') + render_json(item)
+        yield b']'
 
 
 class SellProductView(APIVieWithErrorHandling):
@@ -97,3 +346,93 @@ class SellProductView(APIVieWithErrorHandling):
         self._product_business.sell_product(product_id)
 
         return Response(status=status.HTTP_200_OK)
+
+
+class OrderView(APIVieWithErrorHandling):
+    def __init__(self, **kwargs: Any) -> None:
+        self._order_parser = OrderParser()
+        self._product_business = ProductBusiness()
+        super().__init__(**kwargs)
+
+    def post(self, request: Request) -> Response:
+        lines = self._order_parser.parse(request.data)
+        self._product_business.sell_products(lines)
+
+        return Response(status=status.HTTP_200_OK)
+
+
+class ReserveProductView(APIVieWithErrorHandling):
+    def __init__(self, **kwargs: Any) -> None:
+        self._reservation_parser = ReservationParser()
+        self._reservation_business = ReservationBusiness()
+        super().__init__(**kwargs)
+
+    def post(self, request: Request, product_id: int) -> Response:
+        reservation_request = self._reservation_parser.parse(request.data)
+        reservation = self._reservation_business.reserve_product(product_id, reservation_request)
+
+        return Response(asdict(reservation), status=status.HTTP_201_CREATED)
+
+
+class ReservationView(APIVieWithErrorHandling):
+    def __init__(self, **kwargs: Any) -> None:
+        self._reservation_business = ReservationBusiness()
+        super().__init__(**kwargs)
+
+    def get(self, request: Request, reservation_id: str) -> Response:
+        return Response(asdict(self._reservation_business.get_reservation(str(reservation_id))), status=status.HTTP_200_OK)
+
+
+class ConfirmReservationView(APIVieWithErrorHandling):
+    def __init__(self, **kwargs: Any) -> None:
+        self._reservation_business = ReservationBusiness()
+        super().__init__(**kwargs)
+
+    def post(self, request: Request, reservation_id: str) -> Response:
+        self._reservation_business.confirm_reservation(str(reservation_id))
+
+        return Response(status=status.HTTP_200_OK)
+
+
+class ReleaseReservationView(APIVieWithErrorHandling):
+    def __init__(self, **kwargs: Any) -> None:
+        self._reservation_business = ReservationBusiness()
+        super().__init__(**kwargs)
+
+    def post(self, request: Request, reservation_id: str) -> Response:
+        self._reservation_business.release_reservation(str(reservation_id))
+
+        return Response(status=status.HTTP_200_OK)
+
+
+class BasketFeasibilityView(APIVieWithErrorHandling):
+    def __init__(self, **kwargs: Any) -> None:
+        self._order_parser = OrderParser()
+        self._product_business = ProductBusiness()
+        super().__init__(**kwargs)
+
+    def post(self, request: Request) -> HttpResponse:
+        lines = self._order_parser.parse(request.data)
+        feasibility = self._product_business.get_basket_feasibility(lines)
+
+        return HttpResponse(render_json(feasibility), content_type='application/json', status=status.HTTP_200_OK)
+
+
+class UploadJobView(APIVieWithErrorHandling):
+    def __init__(self, **kwargs: Any) -> None:
+        self._upload_job_business = UploadJobBusiness()
+        super().__init__(**kwargs)
+
+    def get(self, request: Request, job_id: str) -> Response:
+        job = self._upload_job_business.get_job(str(job_id))
+        rows_per_second = None
+        if job.started_at is not None:
+            elapsed_seconds = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+            rows_per_second = round(job.processed_count / elapsed_seconds, 2) if elapsed_seconds > 0 else None
+
+        return Response({ **asdict(job), 'rows_per_second': rows_per_second }, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    def get(self, request: Request) -> HttpResponse:
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
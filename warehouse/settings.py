@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.middleware.RequestMetricsMiddleware',
+    'inventory.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +86,17 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         "HOST": os.getenv('DB_HOST', 'localhost'),
         'ATOMIC_REQUESTS': True,
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '0')),
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -126,7 +139,89 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+
+# Media files (files uploaded to be processed in background)
+# https://docs.djangoproject.com/en/3.2/topics/files/
+
+MEDIA_ROOT = os.getenv('DJANGO_MEDIA_ROOT', str(BASE_DIR / 'media'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Inventory
+
+# Number of items parsed and written to the DB at once by streaming uploads (`?mode=stream`).
+INVENTORY_UPLOAD_BATCH_SIZE = int(os.getenv('INVENTORY_UPLOAD_BATCH_SIZE', '1000'))
+
+# Maximum number of rows sent in a single `INSERT ... ON CONFLICT` statement when saving articles.
+INVENTORY_UPSERT_BATCH_SIZE = int(os.getenv('INVENTORY_UPSERT_BATCH_SIZE', '5000'))
+
+# Number of products loaded from the DB at once by the streamed products availability (`?mode=stream`).
+INVENTORY_AVAILABILITY_CHUNK_SIZE = int(os.getenv('INVENTORY_AVAILABILITY_CHUNK_SIZE', '1000'))
+
+# Number of threads of every web process running the upload jobs (`?mode=async`).
+INVENTORY_UPLOAD_JOB_WORKERS = int(os.getenv('INVENTORY_UPLOAD_JOB_WORKERS', '2'))
+
+# Seconds after which a validating or applying upload job without progress is considered interrupted (e.g. by a
+# restart) and can be resumed by `python manage.py process_upload_jobs`. It must be longer than a batch takes.
+INVENTORY_UPLOAD_JOB_STALE_SECONDS = int(os.getenv('INVENTORY_UPLOAD_JOB_STALE_SECONDS', '300'))
+
+# Share of the requests (0 to 1) whose SQL queries are counted and timed for the metrics endpoint.
+INVENTORY_METRICS_SQL_SAMPLE_RATE = float(os.getenv('INVENTORY_METRICS_SQL_SAMPLE_RATE', '0.1'))
+
+# Seconds a serialized products availability response is cached for a given inventory version.
+INVENTORY_AVAILABILITY_CACHE_TIMEOUT = int(os.getenv('INVENTORY_AVAILABILITY_CACHE_TIMEOUT', '300'))
+
+# Number of threads of every ASGI process running the DB work of the async endpoints (`inventory/async/...`).
+INVENTORY_ASYNC_DB_WORKERS = int(os.getenv('INVENTORY_ASYNC_DB_WORKERS', '10'))
+
+# Seconds a reservation holds its articles when the request doesn't ask for a TTL, and the longest TTL allowed.
+INVENTORY_RESERVATION_TTL = int(os.getenv('INVENTORY_RESERVATION_TTL', '900'))
+INVENTORY_RESERVATION_MAX_TTL = int(os.getenv('INVENTORY_RESERVATION_MAX_TTL', '3600'))
+
+# Number of expired reservations released at once by the expiry sweep.
+INVENTORY_RESERVATION_SWEEP_BATCH_SIZE = int(os.getenv('INVENTORY_RESERVATION_SWEEP_BATCH_SIZE', '1000'))
+
+# Maximum number of articles changed by a single `UPDATE` of the stock delta endpoint.
+INVENTORY_STOCK_DELTA_BATCH_SIZE = int(os.getenv('INVENTORY_STOCK_DELTA_BATCH_SIZE', '500'))
+
+# Append sells and stock adjustments as stock movements instead of updating the article rows. The pending movements
+# are folded into the articles stock by `python manage.py compact_stock_movements`, run it before disabling the ledger.
+INVENTORY_STOCK_LEDGER = os.getenv('INVENTORY_STOCK_LEDGER', 'false').lower() == 'true'
+
+# Number of articles whose pending stock movements are folded into their stock in every compaction transaction.
+INVENTORY_LEDGER_COMPACTION_BATCH_SIZE = int(os.getenv('INVENTORY_LEDGER_COMPACTION_BATCH_SIZE', '1000'))
+
+# Read replicas of the default database, one `replica_<n>` alias per host of the comma separated DB_REPLICA_HOSTS.
+# Read-only repository methods query them, see inventory/db_routers.py. Pointing DB_REPLICA_HOSTS to the primary host
+# (e.g. `localhost`) runs the routing locally with two aliases of the same database.
+for (index, host) in enumerate([host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host]):
+    DATABASES[f'replica_{index + 1}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'ATOMIC_REQUESTS': False,
+        'TEST': { 'MIRROR': 'default' },
+    }
+INVENTORY_REPLICA_DATABASES = [alias for alias in DATABASES if alias.startswith('replica_')]
+DATABASE_ROUTERS = ['inventory.db_routers.ReplicaRouter']
+
+# Seconds a client reads from the primary after writing, so it sees its writes despite the replication lag.
+INVENTORY_REPLICA_PIN_SECONDS = int(os.getenv('INVENTORY_REPLICA_PIN_SECONDS', '10'))
+
+# Product uploads of at least INVENTORY_PARALLEL_PARSE_MIN_PRODUCTS products are validated by a pool of processes
+# (0, the default, validates every upload in the web process). Sending the products to the pool and rebuilding the
+# results cost about as much as the validation itself, measure with the `benchmark` command before enabling it.
+# Processes of the pool (defaults to the number of CPUs), and number of products validated by each task. Uploads with
+# less than two chunks are validated in the web process.
+INVENTORY_PARALLEL_PARSE_MIN_PRODUCTS = int(os.getenv('INVENTORY_PARALLEL_PARSE_MIN_PRODUCTS', '0'))
+INVENTORY_PARSE_WORKERS = int(os.getenv('INVENTORY_PARSE_WORKERS', '0')) or None
+INVENTORY_PARALLEL_PARSE_CHUNK_SIZE = int(os.getenv('INVENTORY_PARALLEL_PARSE_CHUNK_SIZE', '20000'))
+
+# Number of uploaded articles compared with the stored ones per query, only new and changed articles are written.
+INVENTORY_ARTICLE_DIFF_CHUNK_SIZE = int(os.getenv('INVENTORY_ARTICLE_DIFF_CHUNK_SIZE', '5000'))
+
+# Seconds the fingerprint of an applied article file is kept, to acknowledge identical re-uploads without DB work.
+INVENTORY_ARTICLE_UPLOAD_FINGERPRINT_TIMEOUT = int(os.getenv('INVENTORY_ARTICLE_UPLOAD_FINGERPRINT_TIMEOUT', '86400'))